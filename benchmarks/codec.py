@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+"""
+Benchmark the encode and decode hot paths.
+
+Measure the encoding and decoding of every field class, the decoding of
+complete handshake messages, streaming through a TLS connection with
+different segment sizes and the reassembly of fragmented DTLS handshake
+messages. The results can be saved as JSON and compared against a saved
+baseline, the exit code is 1 if a benchmark is slower than the baseline by
+more than the threshold.
+
+Example::
+
+    python benchmarks/codec.py --output baseline.json
+    python benchmarks/codec.py --baseline baseline.json --threshold 0.1
+"""
+import argparse
+import inspect
+import json
+import platform
+import random
+import struct
+import sys
+import timeit
+
+import flextls
+from flextls import field
+from flextls.connection import DTLSv10Connection, SSLv30Connection
+from flextls.field import CertificateField, CertificateListField, CipherSuiteField, CipherSuitesField, \
+    CompressionMethodField, CompressionMethodsField, ECParametersField, ECParametersNamedCurveField, ECPointField, \
+    EnumField, ExtensionsField, Field, HostNameField, MultiPartField, RandomField, ServerDHParamsField, \
+    ServerECDHParamsField, ServerNameField, ServerNameListField, SignatureAndHashAlgorithmField, \
+    SSLv2CipherSuiteField, UInt8EnumField, UInt8Field, UInt16EnumField, UInt16Field, UInt24Field, UInt48Field, \
+    VectorBaseField, VectorInt24Field, VectorListBaseField, VectorListInt24Field, VectorListUInt8Field, \
+    VectorListUInt16Field, VectorUInt8Field, VectorUInt16Field, VersionField
+from flextls.protocol.handshake import Handshake
+
+# Use the same data in every run
+_random = random.Random(1)
+
+
+def random_bytes(length):
+    return bytes(bytearray(_random.getrandbits(8) for i in range(length)))
+
+
+def vector(fmt, data):
+    if fmt == "I":
+        return struct.pack("!I", len(data))[1:] + data
+    return struct.pack("!" + fmt, len(data)) + data
+
+
+def handshake(handshake_type, data):
+    return struct.pack("!B", handshake_type) + vector("I", data)
+
+
+def extension(extension_type, data):
+    return struct.pack("!HH", extension_type, len(data)) + data
+
+
+CERTIFICATE = random_bytes(1200)
+SERVER_NAME = b"\x00" + vector("H", b"www.example.org")
+
+EXTENSIONS = b"".join([
+    extension(0x0000, vector("H", SERVER_NAME)),
+    # supported_groups: x25519, secp256r1, secp384r1
+    extension(0x000a, vector("H", b"\x00\x1d\x00\x17\x00\x18")),
+    # ec_point_formats: uncompressed
+    extension(0x000b, vector("B", b"\x00")),
+    # signature_algorithms
+    extension(0x000d, vector("H", b"\x04\x03\x05\x03\x06\x03\x08\x04\x08\x05\x08\x06\x04\x01\x05\x01\x06\x01")),
+    # ALPN: h2, http/1.1
+    extension(0x0010, vector("H", vector("B", b"h2") + vector("B", b"http/1.1"))),
+    # renegotiation_info
+    extension(0xff01, b"\x00"),
+])
+
+CLIENT_HELLO = handshake(1, b"".join([
+    b"\x03\x03",
+    random_bytes(32),
+    vector("B", random_bytes(32)),
+    vector("H", b"".join([struct.pack("!H", 0xc000 + i) for i in range(40)])),
+    vector("B", b"\x00"),
+    vector("H", EXTENSIONS),
+]))
+
+SERVER_HELLO = handshake(2, b"".join([
+    b"\x03\x03",
+    random_bytes(32),
+    vector("B", random_bytes(32)),
+    # TLS_DHE_RSA_WITH_AES_256_CBC_SHA
+    b"\x00\x39",
+    b"\x00",
+    vector("H", extension(0xff01, b"\x00") + extension(0x0010, vector("H", vector("B", b"h2")))),
+]))
+
+SERVER_CERTIFICATE = handshake(11, vector("I", b"".join([vector("I", random_bytes(1200)) for i in range(3)])))
+
+SERVER_KEY_EXCHANGE = handshake(12, b"".join([
+    vector("H", random_bytes(256)),
+    vector("H", b"\x02"),
+    vector("H", random_bytes(256)),
+    vector("H", random_bytes(256)),
+]))
+
+SERVER_HELLO_DONE = handshake(14, b"")
+
+SERVER_FLIGHT = SERVER_HELLO + SERVER_CERTIFICATE + SERVER_KEY_EXCHANGE + SERVER_HELLO_DONE
+
+#: Factory and data of every field class
+FIELD_CASES = {
+    Field: (lambda: Field("value", 0), b"\x01\x02"),
+    UInt8Field: (lambda: UInt8Field("value", 0), b"\x01"),
+    UInt16Field: (lambda: UInt16Field("value", 0), b"\x01\x02"),
+    UInt24Field: (lambda: UInt24Field("value", 0), b"\x01\x02\x03"),
+    UInt48Field: (lambda: UInt48Field("value", 0), b"\x01\x02\x03\x04\x05\x06"),
+    RandomField: (lambda: RandomField("random"), random_bytes(32)),
+    EnumField: (lambda: EnumField("value", 0, {0: "a", 1: "b"}), b"\x00\x01"),
+    UInt8EnumField: (lambda: UInt8EnumField("value", 0, {0: "a", 1: "b"}), b"\x01"),
+    UInt16EnumField: (lambda: UInt16EnumField("value", 0, {0: "a", 1: "b"}), b"\x00\x01"),
+    VectorListBaseField: (
+        lambda: VectorListBaseField("list", UInt16Field, ["item", 0]),
+        vector("H", random_bytes(40))
+    ),
+    VectorListUInt8Field: (lambda: VectorListUInt8Field("list", CompressionMethodField), vector("B", b"\x01\x00")),
+    VectorListUInt16Field: (lambda: VectorListUInt16Field("list", CipherSuiteField), vector("H", random_bytes(80))),
+    VectorListInt24Field: (
+        lambda: VectorListInt24Field("list", CertificateField),
+        vector("I", vector("I", CERTIFICATE) * 3)
+    ),
+    CertificateListField: (lambda: CertificateListField("list"), vector("I", vector("I", CERTIFICATE) * 3)),
+    CipherSuitesField: (lambda: CipherSuitesField("list"), vector("H", random_bytes(80))),
+    ServerNameListField: (lambda: ServerNameListField("list"), vector("H", SERVER_NAME)),
+    ExtensionsField: (lambda: ExtensionsField("list"), vector("H", EXTENSIONS)),
+    CompressionMethodsField: (lambda: CompressionMethodsField("list"), vector("B", b"\x01\x00")),
+    VectorBaseField: (lambda: VectorBaseField("value"), vector("H", random_bytes(64))),
+    VectorUInt8Field: (lambda: VectorUInt8Field("value"), vector("B", random_bytes(32))),
+    VectorUInt16Field: (lambda: VectorUInt16Field("value"), vector("H", random_bytes(256))),
+    VectorInt24Field: (lambda: VectorInt24Field("value"), vector("I", random_bytes(1200))),
+    CertificateField: (lambda: CertificateField(), vector("I", CERTIFICATE)),
+    HostNameField: (lambda: HostNameField("value"), vector("H", b"www.example.org")),
+    ECPointField: (lambda: ECPointField("value"), vector("B", random_bytes(65))),
+    MultiPartField: (lambda: MultiPartField("value", [UInt8Field("a", 0), UInt16Field("b", 0)]), b"\x01\x00\x02"),
+    ServerNameField: (lambda: ServerNameField("value"), SERVER_NAME),
+    VersionField: (lambda: VersionField("version"), b"\x03\x03"),
+    SignatureAndHashAlgorithmField: (lambda: SignatureAndHashAlgorithmField("value"), b"\x04\x03"),
+    ServerDHParamsField: (
+        lambda: ServerDHParamsField("params"),
+        vector("H", random_bytes(256)) + vector("H", b"\x02") + vector("H", random_bytes(256))
+    ),
+    ServerECDHParamsField: (lambda: ServerECDHParamsField("params"), b"\x03\x00\x17" + vector("B", random_bytes(65))),
+    ECParametersField: (lambda: ECParametersField("curve_params", None), b"\x03\x00\x17"),
+    ECParametersNamedCurveField: (lambda: ECParametersNamedCurveField("curve_params"), b"\x03\x00\x17"),
+    CipherSuiteField: (lambda: CipherSuiteField(), b"\x00\x39"),
+    SSLv2CipherSuiteField: (lambda: SSLv2CipherSuiteField(), b"\x01\x00\x80"),
+    CompressionMethodField: (lambda: CompressionMethodField(), b"\x00"),
+}
+
+
+def get_field_classes():
+    """
+    Get all field classes defined in flextls.field.
+    """
+    base_classes = (Field, VectorListBaseField, VectorBaseField, MultiPartField)
+    return [
+        value for (name, value) in inspect.getmembers(field, inspect.isclass)
+        if issubclass(value, base_classes) and value.__module__ == field.__name__
+    ]
+
+
+def field_benchmarks():
+    missing = [cls.__name__ for cls in get_field_classes() if cls not in FIELD_CASES]
+    if missing:
+        sys.stderr.write("No benchmark for field classes: %s\n" % ", ".join(missing))
+
+    for (cls, (factory, data)) in sorted(FIELD_CASES.items(), key=lambda item: item[0].__name__):
+        def decode(factory=factory, data=data):
+            factory().dissect(data)
+
+        tmp = factory()
+        tmp.dissect(data)
+        yield ("field.decode.%s" % cls.__name__, decode)
+        yield ("field.encode.%s" % cls.__name__, tmp.assemble)
+
+
+def message_benchmarks():
+    connection = SSLv30Connection(flextls.registry.version.TLSv12)
+    # The cipher suite is required to decode the ServerKeyExchange message
+    connection.state.cipher_suite = 0x0039
+    messages = (
+        ("client_hello", CLIENT_HELLO),
+        ("server_hello", SERVER_HELLO),
+        ("certificate", SERVER_CERTIFICATE),
+        ("server_key_exchange", SERVER_KEY_EXCHANGE),
+    )
+    for (name, data) in messages:
+        def decode(data=data):
+            Handshake.decode(data, connection=connection)
+
+        yield ("message.decode.%s" % name, decode)
+
+
+def records(data, content_type=22, version=b"\x03\x03", max_length=16384):
+    result = b""
+    for i in range(0, len(data), max_length):
+        payload = data[i:i + max_length]
+        result += struct.pack("!B2sH", content_type, version, len(payload)) + payload
+    return result
+
+
+def stream_benchmarks(segment_sizes):
+    stream = records(SERVER_FLIGHT)
+    for segment_size in segment_sizes:
+        segments = [stream[i:i + segment_size] for i in range(0, len(stream), segment_size)]
+
+        def decode(segments=segments):
+            connection = SSLv30Connection(flextls.registry.version.TLSv12)
+            for segment in segments:
+                connection.decode(segment)
+            while not connection.is_empty():
+                connection.pop_record()
+
+        yield ("stream.tls.%d" % segment_size, decode)
+
+
+def dtls_records(fragment_size):
+    result = []
+    messages = (
+        (2, SERVER_HELLO[4:]),
+        (11, SERVER_CERTIFICATE[4:]),
+        (12, SERVER_KEY_EXCHANGE[4:]),
+        (14, SERVER_HELLO_DONE[4:]),
+    )
+    sequence_number = 0
+    for (message_seq, (handshake_type, body)) in enumerate(messages):
+        for offset in range(0, max(len(body), 1), fragment_size):
+            fragment = body[offset:offset + fragment_size]
+            header = struct.pack("!B", handshake_type) + struct.pack("!I", len(body))[1:]
+            header += struct.pack("!H", message_seq)
+            header += struct.pack("!I", offset)[1:] + struct.pack("!I", len(fragment))[1:]
+            # Handshake, DTLS 1.2, epoch 0
+            record = struct.pack("!B2sH", 22, b"\xfe\xfd", 0) + struct.pack("!Q", sequence_number)[2:]
+            record += struct.pack("!H", len(header + fragment)) + header + fragment
+            result.append(record)
+            sequence_number += 1
+    return result
+
+
+def dtls_benchmarks(fragment_sizes):
+    # The fragments are sent in order, the connection does not buffer out of order fragments
+    for fragment_size in fragment_sizes:
+        datagrams = dtls_records(fragment_size)
+
+        def decode(datagrams=datagrams):
+            connection = DTLSv10Connection(flextls.registry.version.DTLSv12)
+            for datagram in datagrams:
+                connection.decode(datagram)
+            while not connection.is_empty():
+                connection.pop_record()
+
+        yield ("dtls.reassemble.%d" % fragment_size, decode)
+
+
+def measure(func, repeat, min_time):
+    """
+    Measure the time of a function.
+
+    :return: The best time of all runs in seconds per call
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        if timer.timeit(number) >= min_time:
+            break
+        number *= 10
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare the results with the results of a baseline.
+
+    :return: Names of the benchmarks slower than the baseline by more than the threshold
+    """
+    regressions = []
+    for (name, value) in sorted(results.items()):
+        base_value = baseline.get(name)
+        if base_value is None:
+            print("%-45s %10.2fus         new" % (name, value * 1000000))
+            continue
+        change = (value - base_value) / base_value
+        mark = ""
+        if change > threshold:
+            mark = "REGRESSION"
+            regressions.append(name)
+        print("%-45s %10.2fus %+8.1f%% %s" % (name, value * 1000000, change * 100, mark))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--filter", default="", help="Run only benchmarks containing this string")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs of every benchmark")
+    parser.add_argument("--min-time", type=float, default=0.05, help="Minimum time of a run in seconds")
+    parser.add_argument("--segment-sizes", type=int, nargs="+", default=[16, 256, 1460, 16384],
+                        help="Segment sizes of the TLS streams")
+    parser.add_argument("--fragment-sizes", type=int, nargs="+", default=[100, 500],
+                        help="Fragment sizes of the DTLS handshake messages")
+    parser.add_argument("--output", help="Save the results as JSON")
+    parser.add_argument("--baseline", help="Compare against the results saved with --output")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Report a regression if a benchmark is slower by more than this fraction")
+    args = parser.parse_args()
+
+    benchmarks = []
+    benchmarks += field_benchmarks()
+    benchmarks += message_benchmarks()
+    benchmarks += stream_benchmarks(args.segment_sizes)
+    benchmarks += dtls_benchmarks(args.fragment_sizes)
+
+    results = {}
+    for (name, func) in benchmarks:
+        if args.filter not in name:
+            continue
+        results[name] = measure(func, args.repeat, args.min_time)
+        if args.baseline is None:
+            print("%-45s %10.2fus" % (name, results[name] * 1000000))
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "implementation": platform.python_implementation(),
+                    "flextls": flextls.__version__,
+                    "results": results,
+                },
+                f,
+                indent=2,
+                sort_keys=True
+            )
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("%d of %d benchmarks slower than the baseline" % (len(regressions), len(results)))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""
+Benchmark the SNI proxy against a loopback echo backend.
+
+Measure the connection setup latency (connect, send the ClientHello and
+receive the echo) and the sustained throughput of a single connection. The
+values of a direct connection to the backend are shown for comparison.
+"""
+import argparse
+import asyncio
+import binascii
+import time
+
+from flextls.proxy import RoutingTable, SNIProxy
+from flextls.protocol.handshake.raw import peek_client_hello
+
+# ClientHello with server_name: localhost and ALPN: h2
+CLIENT_HELLO = binascii.unhexlify(
+    b"160301004a010000460303" + b"00" * 32 + b"000002002f0100001b"
+    b"0000000e000c0000096c6f63616c686f7374001000050003026832"
+)
+
+
+async def echo(reader, writer):
+    while True:
+        data = await reader.read(65536)
+        if not data:
+            break
+        writer.write(data)
+        await writer.drain()
+    writer.close()
+
+
+async def measure_setup(port, count):
+    results = []
+    for i in range(count):
+        start_time = time.monotonic()
+        (reader, writer) = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(CLIENT_HELLO)
+        await reader.readexactly(len(CLIENT_HELLO))
+        results.append(time.monotonic() - start_time)
+        writer.close()
+        await writer.wait_closed()
+    results.sort()
+    return results
+
+
+async def measure_throughput(port, size, chunk_size):
+    (reader, writer) = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(CLIENT_HELLO)
+    await reader.readexactly(len(CLIENT_HELLO))
+
+    chunk = b"\x00" * chunk_size
+
+    async def send():
+        sent = 0
+        while sent < size:
+            writer.write(chunk)
+            sent += chunk_size
+            await writer.drain()
+
+    async def receive():
+        received = 0
+        while received < size:
+            data = await reader.read(65536)
+            if not data:
+                break
+            received += len(data)
+        return received
+
+    start_time = time.monotonic()
+    (tmp, received) = await asyncio.gather(send(), receive())
+    duration = time.monotonic() - start_time
+    writer.close()
+    await writer.wait_closed()
+    return received / duration
+
+
+def print_result(name, setup_times, throughput):
+    print(
+        "%-8s setup p50 %8.1fus p99 %8.1fus  throughput %8.1f MB/s" % (
+            name,
+            setup_times[len(setup_times) // 2] * 1000000,
+            setup_times[int(len(setup_times) * 0.99)] * 1000000,
+            throughput / 1000000
+        )
+    )
+
+
+async def run(args):
+    backend = await asyncio.start_server(echo, "127.0.0.1", 0)
+    backend_port = backend.sockets[0].getsockname()[1]
+
+    routing_table = RoutingTable()
+    routing_table.add_route("localhost", "127.0.0.1", backend_port)
+    proxy = SNIProxy(routing_table, buffer_size=args.buffer_size)
+    server = await proxy.start("127.0.0.1", 0)
+    proxy_port = server.sockets[0].getsockname()[1]
+
+    for (name, port) in (("direct", backend_port), ("proxy", proxy_port)):
+        setup_times = await measure_setup(port, args.connections)
+        throughput = await measure_throughput(port, args.size * 1000000, args.chunk_size)
+        print_result(name, setup_times, throughput)
+
+    await proxy.stop()
+    backend.close()
+    return proxy.snapshot()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--connections", type=int, default=1000, help="Number of connections to measure the setup latency")
+    parser.add_argument("--size", type=int, default=200, help="MB to transfer to measure the throughput")
+    parser.add_argument("--chunk-size", type=int, default=16384, help="Size of the chunks to send")
+    parser.add_argument("--buffer-size", type=int, default=65536, help="Buffer size of the proxy")
+    args = parser.parse_args()
+
+    start_time = time.monotonic()
+    for i in range(10000):
+        peek_client_hello(CLIENT_HELLO)
+    print("peek_client_hello() %.2fus" % ((time.monotonic() - start_time) / 10000 * 1000000))
+
+    stats = asyncio.run(run(args))
+    print("rejected connections: %d" % stats["rejected_connections"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+The asyncio part of :mod:`flextls.proxy`. Requires Python 3.7 or newer, the
+module is not installed on older versions.
+"""
+import asyncio
+import time
+
+from flextls.protocol.handshake.raw import peek_client_hello
+
+
+class SNIProxy(object):
+    """
+    Read the ClientHello of a connection, select a route and forward the
+    data in both directions.
+
+    :param RoutingTable routing_table: The routing table
+    :param Integer buffer_size: Maximum size of the read and write buffers of each direction
+    :param Integer max_hello_size: Close the connection if the ClientHello is larger
+    :param float hello_timeout: Close the connection if the ClientHello is not received in time
+    :param float connect_timeout: Timeout to connect to the backend
+    """
+    def __init__(self, routing_table, buffer_size=65536, max_hello_size=16384 + 5,
+                 hello_timeout=10.0, connect_timeout=10.0):
+        self.routing_table = routing_table
+        self.buffer_size = buffer_size
+        self.max_hello_size = max_hello_size
+        self.hello_timeout = hello_timeout
+        self.connect_timeout = connect_timeout
+        self.rejected_connections = 0
+        self._server = None
+        # Keep references to the tasks, asyncio only uses weak references
+        self._tasks = set()
+
+    async def _read_client_hello(self, reader):
+        data = b""
+        while True:
+            (version, server_names, protocols, missing) = peek_client_hello(data)
+            if missing == 0:
+                return (data, server_names, protocols)
+
+            if len(data) + missing > self.max_hello_size:
+                raise ValueError("ClientHello too large")
+
+            tmp_data = await reader.read(max(missing, self.buffer_size - len(data)))
+            if not tmp_data:
+                raise EOFError("Connection closed before the ClientHello has been received")
+            data += tmp_data
+
+    async def _forward(self, reader, writer, route, counter_name):
+        try:
+            while True:
+                data = await reader.read(self.buffer_size)
+                if not data:
+                    break
+                writer.write(data)
+                setattr(route, counter_name, getattr(route, counter_name) + len(data))
+                await writer.drain()
+            if writer.can_write_eof():
+                writer.write_eof()
+        except (ConnectionError, OSError):
+            writer.close()
+
+    async def handle_connection(self, client_reader, client_writer):
+        """
+        Handle a client connection. Use as callback for
+        :func:`asyncio.start_server`.
+        """
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            await self._handle_connection(client_reader, client_writer)
+        finally:
+            self._tasks.discard(task)
+
+    async def _handle_connection(self, client_reader, client_writer):
+        start_time = time.monotonic()
+        try:
+            (data, server_names, protocols) = await asyncio.wait_for(
+                self._read_client_hello(client_reader),
+                self.hello_timeout
+            )
+        except (ValueError, EOFError, ConnectionError, OSError, asyncio.TimeoutError):
+            self.rejected_connections += 1
+            client_writer.close()
+            return
+
+        route = self.routing_table.get_route(server_names, protocols)
+        if route is None:
+            self.rejected_connections += 1
+            client_writer.close()
+            return
+
+        route.connections += 1
+        route.active_connections += 1
+        server_writer = None
+        try:
+            (server_reader, server_writer) = await asyncio.wait_for(
+                asyncio.open_connection(route.host, route.port, limit=self.buffer_size),
+                self.connect_timeout
+            )
+            server_writer.transport.set_write_buffer_limits(high=self.buffer_size)
+            client_writer.transport.set_write_buffer_limits(high=self.buffer_size)
+
+            server_writer.write(data)
+            route.bytes_from_client += len(data)
+            await server_writer.drain()
+            route.setup_latency.add(time.monotonic() - start_time)
+
+            await asyncio.gather(
+                self._forward(client_reader, server_writer, route, "bytes_from_client"),
+                self._forward(server_reader, client_writer, route, "bytes_from_server")
+            )
+        except (ConnectionError, OSError, asyncio.TimeoutError):
+            route.errors += 1
+        finally:
+            route.active_connections -= 1
+            client_writer.close()
+            if server_writer is not None:
+                server_writer.close()
+
+    async def start(self, host, port, **kwargs):
+        """
+        Start listening for connections.
+
+        :param String host: The address to listen on
+        :param Integer port: The port to listen on
+        :return: The server
+        :rtype: asyncio.AbstractServer
+        """
+        self._server = await asyncio.start_server(
+            self.handle_connection,
+            host,
+            port,
+            limit=self.buffer_size,
+            **kwargs
+        )
+        return self._server
+
+    async def stop(self, timeout=None):
+        """
+        Stop listening for new connections and wait for the active
+        connections to be closed.
+
+        :param float timeout: Cancel the remaining connections after the timeout
+        """
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+        if self._tasks:
+            (done, pending) = await asyncio.wait(list(self._tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
+
+    def reset(self):
+        """
+        Reset the counters of the proxy and all routes.
+        """
+        self.rejected_connections = 0
+        for route in self.routing_table.get_routes():
+            route.reset()
+
+    def snapshot(self):
+        """
+        Get the counters of the proxy and all routes.
+
+        :rtype: Dict
+        """
+        return {
+            "rejected_connections": self.rejected_connections,
+            "routes": [route.snapshot() for route in self.routing_table.get_routes()]
+        }
@@ -0,0 +1,358 @@
+"""
+Summarize the TLS and DTLS flows of capture files.
+
+:class:`CaptureAnalyzer` distributes the flows of a capture to a pool of
+worker processes. The flows are assigned to the workers (shards) by a hash
+of the addresses and ports, so all packets of a flow are decoded by the same
+worker. The parent process only reads the packet headers and sends the
+offsets of the packets to the workers, the workers map the capture file into
+memory and decode the packets. Every worker returns a :class:`FlowSummary`
+for each flow.
+
+Example::
+
+    analyzer = CaptureAnalyzer(shard_count=32, ports=[443])
+    for summary in analyzer.analyze("capture.pcap"):
+        print(summary.as_dict())
+"""
+import multiprocessing
+import struct
+import traceback
+import zlib
+
+try:
+    from queue import Empty, Full
+except ImportError:
+    from Queue import Empty, Full
+
+from flextls.capture import IPPROTO_TCP, CaptureReader, FlowTracker, Packet, parse_packet
+from flextls.protocol import Protocol
+from flextls.protocol.alert import Alert
+from flextls.protocol.handshake import ClientHello, DTLSv10ClientHello, ServerCertificate, ServerHello
+
+
+class FlowSummary(object):
+    """
+    Summary of a flow using only plain Python types, it can be pickled and
+    send to other processes.
+
+    :param flextls.capture.Flow flow: The flow
+    """
+    __slots__ = (
+        "flow_id", "protocol", "client", "server", "packets", "first_timestamp", "last_timestamp",
+        "versions", "cipher_suites", "cipher_suite", "server_names", "certificate_hashes", "alerts", "errors",
+    )
+
+    def __init__(self, flow=None):
+        self.flow_id = None
+        self.protocol = None
+        self.client = None
+        self.server = None
+        self.packets = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+        #: Versions of the ClientHello and ServerHello messages as (major, minor)
+        self.versions = []
+        #: Cipher suites offered by the client
+        self.cipher_suites = []
+        #: Cipher suite selected by the server
+        self.cipher_suite = None
+        self.server_names = []
+        #: SHA-256 hex digests of the certificates sent by the server
+        self.certificate_hashes = []
+        #: Alerts as (direction, level, description)
+        self.alerts = []
+        #: Decoding errors of the client and the server direction
+        self.errors = [None, None]
+        if flow is not None:
+            self.update_flow(flow)
+
+    def __getstate__(self):
+        return dict([(name, getattr(self, name)) for name in self.__slots__])
+
+    def __setstate__(self, state):
+        for (name, value) in state.items():
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return "<FlowSummary %s:%d -> %s:%d>" % (self.client + self.server)
+
+    def as_dict(self):
+        """
+        :rtype: Dict
+        """
+        return self.__getstate__()
+
+    def update_flow(self, flow):
+        """
+        Update the addresses, counters and errors from a flow.
+
+        :param flextls.capture.Flow flow: The flow
+        """
+        self.flow_id = flow.flow_id
+        self.protocol = "tcp" if flow.protocol == IPPROTO_TCP else "udp"
+        self.client = (flow.client_address, flow.client[1])
+        self.server = (flow.server_address, flow.server[1])
+        self.packets = flow.packets
+        self.first_timestamp = flow.first_timestamp
+        self.last_timestamp = flow.last_timestamp
+        self.errors = [None if error is None else repr(error) for error in flow.errors]
+
+    def update(self, direction, record):
+        """
+        Update the summary with a decoded record.
+
+        :param Integer direction: CLIENT or SERVER
+        :param flextls.protocol.Protocol record: The record returned by the connection
+        """
+        if isinstance(record, Alert):
+            self.alerts.append((direction, record.level, record.description))
+            return
+
+        message = record.payload
+        if not isinstance(message, Protocol):
+            return
+
+        if isinstance(message, (ClientHello, DTLSv10ClientHello)):
+            self._add_version(message)
+            self.cipher_suites = [cipher_suite.value for cipher_suite in message.cipher_suites]
+            extension = message.get_extension(0x0000)
+            if extension is not None and isinstance(extension.payload, Protocol):
+                for server_name in extension.payload.server_name_list:
+                    if server_name.payload is not None:
+                        self.server_names.append(server_name.payload.value)
+        elif isinstance(message, ServerHello):
+            self._add_version(message)
+            self.cipher_suite = message.cipher_suite
+        elif isinstance(message, ServerCertificate):
+            self.certificate_hashes = list(message.iter_certificate_digests())
+
+    def _add_version(self, message):
+        version = (message.version.major, message.version.minor)
+        if version not in self.versions:
+            self.versions.append(version)
+
+
+def summarize(packets, **kwargs):
+    """
+    Decode the packets and summarize the flows in the current process.
+
+    :param packets: Iterable of packets e.g. a :class:`flextls.capture.CaptureReader`
+    :param kwargs: Passed to :class:`flextls.capture.FlowTracker`
+    :return: Iterator of summaries, in the order the flows have been closed
+    """
+    summaries = {}
+    closed_flows = []
+    tracker = FlowTracker(flow_closed_callback=closed_flows.append, **kwargs)
+
+    def get_closed_summaries():
+        for flow in closed_flows:
+            summary = summaries.pop(flow.flow_id, None)
+            if summary is None:
+                summary = FlowSummary()
+            summary.update_flow(flow)
+            yield summary
+        del closed_flows[:]
+
+    for (flow, direction, record) in tracker.process(packets):
+        summary = summaries.get(flow.flow_id)
+        if summary is None:
+            summary = FlowSummary(flow)
+            summaries[flow.flow_id] = summary
+        summary.update(direction, record)
+        if closed_flows:
+            for summary in get_closed_summaries():
+                yield summary
+
+    for summary in get_closed_summaries():
+        yield summary
+
+
+def get_shard(protocol, src, src_port, dst, dst_port, shard_count):
+    """
+    Get the shard of a flow. Both directions of a flow use the same shard.
+
+    :return: Number of the shard from 0 to shard_count - 1
+    :rtype: Integer
+    """
+    endpoints = sorted([src + struct.pack("!H", src_port), dst + struct.pack("!H", dst_port)])
+    return zlib.crc32(struct.pack("!B", protocol) + endpoints[0] + endpoints[1]) % shard_count
+
+
+def _iter_shard_packets(reader, queue):
+    while True:
+        batch = queue.get()
+        if batch is None:
+            return
+        for (offset, length, timestamp, linktype) in batch:
+            yield Packet(timestamp, linktype, reader.read(offset, length), offset)
+
+
+def _run_worker(shard, filename, packet_queue, result_queue, batch_size, tracker_kwargs):
+    try:
+        with CaptureReader(filename) as reader:
+            results = []
+            for summary in summarize(_iter_shard_packets(reader, packet_queue), **tracker_kwargs):
+                results.append(summary)
+                if len(results) >= batch_size:
+                    result_queue.put(("summaries", shard, results))
+                    results = []
+            result_queue.put(("summaries", shard, results))
+    except Exception:
+        result_queue.put(("error", shard, traceback.format_exc()))
+    result_queue.put(("done", shard, None))
+
+
+class _WorkerPool(object):
+    """
+    The worker processes and queues of one call of
+    :meth:`CaptureAnalyzer.analyze`.
+    """
+    #: Seconds to wait for results before checking the workers
+    timeout = 0.1
+
+    def __init__(self, filename, shard_count, queue_depth, batch_size, tracker_kwargs):
+        self.result_queue = multiprocessing.Queue()
+        self.packet_queues = []
+        self.workers = []
+        for shard in range(shard_count):
+            packet_queue = multiprocessing.Queue(queue_depth)
+            worker = multiprocessing.Process(
+                target=_run_worker,
+                args=(shard, filename, packet_queue, self.result_queue, batch_size, tracker_kwargs)
+            )
+            worker.daemon = True
+            worker.start()
+            self.packet_queues.append(packet_queue)
+            self.workers.append(worker)
+        #: Shards of the workers not done yet
+        self.running = set(range(shard_count))
+
+    def _is_worker_failed(self):
+        for shard in self.running:
+            if not self.workers[shard].is_alive():
+                return True
+        return False
+
+    def put(self, shard, batch):
+        """
+        Put a batch into the queue of a worker and return the available
+        results while waiting.
+        """
+        while True:
+            for summary in self.get_results(block=False):
+                yield summary
+            try:
+                self.packet_queues[shard].put(batch, timeout=self.timeout)
+                return
+            except Full:
+                if not self.workers[shard].is_alive():
+                    raise RuntimeError("Worker failed")
+
+    def get_results(self, block):
+        """
+        Get the results of the workers.
+
+        :param Boolean block: Wait for at least one result
+        :return: List of summaries
+        :raises RuntimeError: If a worker fails or exits without sending all results
+        """
+        summaries = []
+        worker_failed = False
+        while True:
+            try:
+                (result_type, shard, value) = self.result_queue.get(block=block, timeout=self.timeout)
+            except Empty:
+                if not block:
+                    return summaries
+                # Get the results sent before the worker has exited first
+                if worker_failed:
+                    raise RuntimeError("Worker exited without sending all results")
+                worker_failed = self._is_worker_failed()
+                continue
+            block = False
+            if result_type == "error":
+                raise RuntimeError("Worker failed: %s" % value)
+            if result_type == "done":
+                self.running.discard(shard)
+            else:
+                summaries += value
+
+    def close(self):
+        """
+        Stop the workers still running and wait for all workers.
+        """
+        for shard, worker in enumerate(self.workers):
+            if shard in self.running:
+                worker.terminate()
+            worker.join()
+
+
+class CaptureAnalyzer(object):
+    """
+    Analyze the flows of a capture file with a pool of worker processes.
+
+    The size of the batches and the queue depth limit the memory used for
+    packets waiting to be decoded: every worker has up to queue_depth batches
+    with batch_size packet offsets in its queue. The parent process waits if
+    a queue is full.
+
+    :param Integer shard_count: Number of worker processes, default: number of CPUs
+    :param Integer queue_depth: Maximum number of batches in the queue of every worker
+    :param Integer batch_size: Number of packets and summaries sent at once
+    :param tracker_kwargs: Passed to :class:`flextls.capture.FlowTracker` in the workers, must be picklable
+    """
+    def __init__(self, shard_count=None, queue_depth=16, batch_size=1024, **tracker_kwargs):
+        if shard_count is None:
+            shard_count = multiprocessing.cpu_count()
+        if shard_count < 1:
+            raise ValueError("At least one shard required")
+        self.shard_count = shard_count
+        self.queue_depth = queue_depth
+        self.batch_size = batch_size
+        self.tracker_kwargs = tracker_kwargs
+
+    def analyze(self, filename):
+        """
+        Analyze a capture file.
+
+        :param String filename: The name of the file
+        :return: Iterator of :class:`FlowSummary`, the order of the flows is not defined
+        :raises RuntimeError: If a worker fails
+        """
+        ports = self.tracker_kwargs.get("ports")
+        if ports is not None:
+            ports = frozenset(ports)
+
+        pool = _WorkerPool(filename, self.shard_count, self.queue_depth, self.batch_size, self.tracker_kwargs)
+        try:
+            batches = [[] for i in range(self.shard_count)]
+            with CaptureReader(filename) as reader:
+                for packet in reader:
+                    result = parse_packet(packet.linktype, packet.data)
+                    if result is None:
+                        continue
+                    (protocol, src, src_port, dst, dst_port) = result[:5]
+                    if ports is not None and src_port not in ports and dst_port not in ports:
+                        continue
+
+                    shard = get_shard(protocol, src, src_port, dst, dst_port, self.shard_count)
+                    batch = batches[shard]
+                    batch.append((packet.offset, len(packet.data), packet.timestamp, packet.linktype))
+                    if len(batch) >= self.batch_size:
+                        for summary in pool.put(shard, batch):
+                            yield summary
+                        batches[shard] = []
+
+            for (shard, batch) in enumerate(batches):
+                if batch:
+                    for summary in pool.put(shard, batch):
+                        yield summary
+                for summary in pool.put(shard, None):
+                    yield summary
+
+            while pool.running:
+                for summary in pool.get_results(block=True):
+                    yield summary
+        finally:
+            pool.close()
@@ -0,0 +1,236 @@
+"""
+Cache decoded handshake messages to reuse them for messages with the same
+content e.g. certificate chains of servers on the same hosting platform and
+share identical values of decoded fields.
+"""
+from collections import OrderedDict
+import copy
+import sys
+
+
+class DecodeCache(object):
+    """
+    Bounded LRU cache of decoded messages. The key is build from the class of
+    the record containing the message, the message type, a context and the
+    hash of the raw data. The raw data is compared on every hit to rule out
+    hash collisions.
+
+    The cache keeps the added objects for its own. Every hit returns a new
+    copy of the cached message, changing the returned objects does not
+    change the cache or the messages of other connections.
+
+    The memory is limited by the size of the raw data of all entries. The
+    decoded objects need additional memory.
+
+    Example::
+
+        cache = DecodeCache(max_entries=10000, max_memory=64 * 1024 * 1024)
+        conn = SSLv30Connection(
+            protocol_version=flextls.registry.version.TLSv12,
+            decode_cache=cache
+        )
+
+    :param Integer max_entries: Maximum number of cached messages
+    :param Integer max_memory: Maximum size of the raw data of all cached messages in bytes
+    :param List message_types: Types of the handshake messages to cache. Default: Certificate and ServerKeyExchange
+    """
+    def __init__(self, max_entries=1024, max_memory=16 * 1024 * 1024, message_types=(11, 12)):
+        self.max_entries = max_entries
+        self.max_memory = max_memory
+        self.message_types = frozenset(message_types)
+        self._entries = OrderedDict()
+        self.memory = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        (data, obj) = self._entries.pop(key)
+        self.memory -= len(data)
+
+    def add(self, record_class, message_type, data, obj, context=None):
+        """
+        Add a decoded message. The least recently used messages are removed
+        if a limit is reached. The object is owned by the cache and must not
+        be used or changed afterwards, add a copy to keep using it.
+
+        :param record_class: Class of the record containing the message e.g. flextls.protocol.handshake.Handshake
+        :param message_type: Type of the message
+        :param bytes data: The raw data of the message
+        :param flextls.protocol.Protocol obj: The decoded message
+        :param context: Additional hashable values required to decode the message
+        """
+        data_length = len(data)
+        if data_length > self.max_memory:
+            return
+
+        key = (record_class, message_type, context, hash(data))
+        if key in self._entries:
+            self._remove(key)
+
+        while self._entries and (len(self._entries) >= self.max_entries or
+                                 self.memory + data_length > self.max_memory):
+            (tmp_key, (tmp_data, tmp_obj)) = self._entries.popitem(last=False)
+            self.memory -= len(tmp_data)
+            self.evictions += 1
+
+        self._entries[key] = (data, obj)
+        self.memory += data_length
+
+    def clear(self):
+        """
+        Remove all messages and reset the counters.
+        """
+        self._entries = OrderedDict()
+        self.memory = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, record_class, message_type, data, context=None):
+        """
+        Get a copy of a decoded message.
+
+        :param record_class: Class of the record containing the message
+        :param message_type: Type of the message
+        :param bytes data: The raw data of the message
+        :param context: Additional hashable values required to decode the message
+        :return: The decoded message or None
+        :rtype: flextls.protocol.Protocol
+        """
+        key = (record_class, message_type, context, hash(data))
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != data:
+            self.misses += 1
+            return None
+
+        # Mark as recently used
+        del self._entries[key]
+        self._entries[key] = entry
+        self.hits += 1
+        return copy.deepcopy(entry[1])
+
+    def snapshot(self):
+        """
+        Get the counters.
+
+        :return: Number of entries, memory used, hits, misses and evictions
+        :rtype: Dict
+        """
+        return {
+            "entries": len(self._entries),
+            "memory": self.memory,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+
+class InternPool(object):
+    """
+    Share one bytes object for all values with the same content. Used to
+    deduplicate the values of :class:`flextls.field.VectorBaseField` fields
+    e.g. certificates, DH parameters and ALPN protocol names if many decoded
+    connections are kept in memory.
+
+    Set the pool as intern_pool of a :class:`flextls.protocol.DecodeProfile`
+    or pass it to a connection.
+
+    bytes objects do not support weak references. The pool keeps a reference
+    to every value and :meth:`prune` removes the values not used anywhere
+    else. The pool is pruned automatically if the maximum number of values is
+    reached.
+
+    :param Integer max_entries: Maximum number of values in the pool
+    """
+    def __init__(self, max_entries=65536):
+        self.max_entries = max_entries
+        self._values = {}
+        self._profiles = {}
+        self.hits = 0
+        self.misses = 0
+        self.saved_bytes = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    def get_profile(self, mode):
+        """
+        Get a decode profile using the pool. The same profile is returned for
+        the same mode.
+
+        :param mode: True or LAZY
+        :rtype: flextls.protocol.DecodeProfile
+        """
+        profile = self._profiles.get(mode)
+        if profile is None:
+            from flextls.protocol import DecodeProfile
+            profile = DecodeProfile(default=mode, item_mode=mode, intern_pool=self)
+            self._profiles[mode] = profile
+        return profile
+
+    def intern(self, value):
+        """
+        Get the shared object for a value.
+
+        :param value: The value, bytes or memoryview
+        :return: The shared object
+        :rtype: bytes
+        """
+        if value.__class__ is memoryview:
+            value = value.tobytes()
+
+        tmp_value = self._values.get(value)
+        if tmp_value is not None:
+            self.hits += 1
+            self.saved_bytes += sys.getsizeof(value)
+            return tmp_value
+
+        self.misses += 1
+        if len(self._values) >= self.max_entries:
+            self.prune()
+            if len(self._values) >= self.max_entries:
+                return value
+
+        self._values[value] = value
+        return value
+
+    def prune(self):
+        """
+        Remove the values only used by the pool.
+        """
+        if not hasattr(sys, "getrefcount"):
+            self._values = {}
+            return
+
+        # References: key and value of the dict, the loop variable and the argument of getrefcount()
+        self._values = dict([
+            (value, value) for value in self._values if sys.getrefcount(value) > 4
+        ])
+
+    @property
+    def memory(self):
+        """
+        Memory used by the values in the pool in bytes.
+
+        :rtype: Integer
+        """
+        return sum([sys.getsizeof(value) for value in self._values])
+
+    def snapshot(self):
+        """
+        Get the counters.
+
+        :return: Number of values, memory used by the values, hits, misses and the memory saved
+        :rtype: Dict
+        """
+        return {
+            "entries": len(self._values),
+            "memory": self.memory,
+            "hits": self.hits,
+            "misses": self.misses,
+            "saved_bytes": self.saved_bytes
+        }
@@ -0,0 +1,787 @@
+"""
+Decode SSL/TLS and DTLS records from pcap and pcapng capture files.
+
+The capture file is mapped into memory with :mod:`mmap` and read packet by
+packet. TCP segments are reassembled per flow and direction and passed to a
+:class:`flextls.connection.SSLv30Connection`, UDP datagrams are passed to a
+:class:`flextls.connection.DTLSv10Connection`. The memory used does not
+depend on the size of the capture file: the number of tracked flows and the
+size of the buffers for out-of-order segments are limited.
+
+:class:`PcapWriter` writes TCP segments and UDP datagrams to pcap files e.g.
+to create test data.
+
+Example::
+
+    with CaptureReader("capture.pcap") as reader:
+        tracker = FlowTracker(ports=[443])
+        for (flow, direction, record) in tracker.process(reader):
+            print(flow, direction, record)
+"""
+import mmap
+import socket
+import struct
+from collections import OrderedDict
+
+from flextls.connection import DTLSv10Connection, SSLv30Connection
+from flextls.protocol.change_cipher_spec import ChangeCipherSpec
+
+#: Data sent by the client
+CLIENT = 0
+#: Data sent by the server
+SERVER = 1
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+
+
+class Packet(object):
+    """
+    A packet of a capture file.
+
+    :param float timestamp: The time the packet has been captured
+    :param Integer linktype: The link-layer header type
+    :param memoryview data: The captured data
+    :param Integer offset: Offset of the packet data in the capture file
+    """
+    __slots__ = ("timestamp", "linktype", "data", "offset")
+
+    def __init__(self, timestamp, linktype, data, offset):
+        self.timestamp = timestamp
+        self.linktype = linktype
+        self.data = data
+        self.offset = offset
+
+
+class CaptureReader(object):
+    """
+    Read the packets of a pcap or pcapng file.
+
+    :param String filename: The name of the file
+    :raises ValueError: If the file format is not supported
+    """
+    def __init__(self, filename):
+        self._file = open(filename, "rb")
+        self._mmap = None
+        self._data = memoryview(b"")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._data = memoryview(self._mmap)
+        except ValueError:
+            # Empty file
+            pass
+
+        if len(self._data) < 4:
+            self.close()
+            raise ValueError("Unsupported file format")
+
+        magic = self._data[:4].tobytes()
+        if magic in (b"\xa1\xb2\xc3\xd4", b"\xa1\xb2\x3c\x4d"):
+            self._iter_packets = self._iter_pcap
+            self._byte_order = ">"
+        elif magic in (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1"):
+            self._iter_packets = self._iter_pcap
+            self._byte_order = "<"
+        elif magic == b"\x0a\x0d\x0d\x0a":
+            self._iter_packets = self._iter_pcapng
+            self._byte_order = None
+        else:
+            self.close()
+            raise ValueError("Unsupported file format")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self):
+        return self._iter_packets()
+
+    def close(self):
+        """
+        Close the file.
+        """
+        self._data.release()
+        self._data = memoryview(b"")
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Packets are still in use, the map is closed if they are released
+                pass
+            self._mmap = None
+        self._file.close()
+
+    def read(self, offset, length):
+        """
+        Get data of the file e.g. the data of a packet using the offset of
+        :class:`Packet`.
+
+        :param Integer offset: The offset in the file
+        :param Integer length: Number of bytes
+        :rtype: memoryview
+        """
+        return self._data[offset:offset + length]
+
+    def _iter_pcap(self):
+        data = self._data
+        byte_order = self._byte_order
+        if len(data) < 24:
+            return
+
+        (magic, ver_major, ver_minor, tmp, tmp, snaplen, linktype) = struct.unpack_from(
+            byte_order + "IHHiIII",
+            data,
+            0
+        )
+        # Nanosecond resolution
+        ts_divisor = 1000000.0
+        if magic == 0xa1b23c4d:
+            ts_divisor = 1000000000.0
+        linktype = linktype & 0x0fffffff
+
+        header_format = byte_order + "IIII"
+        data_length = len(data)
+        offset = 24
+        while offset + 16 <= data_length:
+            (ts_sec, ts_frac, incl_len, orig_len) = struct.unpack_from(header_format, data, offset)
+            offset += 16
+            if offset + incl_len > data_length:
+                # Truncated file
+                return
+            yield Packet(
+                ts_sec + ts_frac / ts_divisor,
+                linktype,
+                data[offset:offset + incl_len],
+                offset
+            )
+            offset += incl_len
+
+    def _iter_pcapng(self):
+        data = self._data
+        data_length = len(data)
+        byte_order = "<"
+        interfaces = []
+        offset = 0
+        while offset + 12 <= data_length:
+            (block_type,) = struct.unpack_from(byte_order + "I", data, offset)
+            if block_type == 0x0a0d0d0a:
+                # Section Header Block, detect the byte order
+                (magic,) = struct.unpack_from("<I", data, offset + 8)
+                if magic == 0x1a2b3c4d:
+                    byte_order = "<"
+                elif magic == 0x4d3c2b1a:
+                    byte_order = ">"
+                else:
+                    return
+                interfaces = []
+
+            (block_length,) = struct.unpack_from(byte_order + "I", data, offset + 4)
+            if block_length < 12 or offset + block_length > data_length:
+                # Truncated file
+                return
+
+            if block_type == 0x00000001:
+                # Interface Description Block
+                (linktype, tmp, snaplen) = struct.unpack_from(byte_order + "HHI", data, offset + 8)
+                interfaces.append(
+                    (linktype, self._get_pcapng_ts_divisor(data, offset + 16, offset + block_length - 4, byte_order))
+                )
+            elif block_type == 0x00000006:
+                # Enhanced Packet Block
+                (interface_id, ts_high, ts_low, incl_len, orig_len) = struct.unpack_from(
+                    byte_order + "IIIII",
+                    data,
+                    offset + 8
+                )
+                if interface_id < len(interfaces):
+                    (linktype, ts_divisor) = interfaces[interface_id]
+                    yield Packet(
+                        ((ts_high << 32) + ts_low) / ts_divisor,
+                        linktype,
+                        data[offset + 28:offset + 28 + incl_len],
+                        offset + 28
+                    )
+            elif block_type == 0x00000003:
+                # Simple Packet Block, only valid with one interface
+                if len(interfaces) > 0:
+                    (orig_len,) = struct.unpack_from(byte_order + "I", data, offset + 8)
+                    incl_len = min(orig_len, block_length - 16)
+                    yield Packet(
+                        0.0,
+                        interfaces[0][0],
+                        data[offset + 12:offset + 12 + incl_len],
+                        offset + 12
+                    )
+
+            offset += block_length
+
+    @staticmethod
+    def _get_pcapng_ts_divisor(data, offset, end, byte_order):
+        while offset + 4 <= end:
+            (code, length) = struct.unpack_from(byte_order + "HH", data, offset)
+            if code == 0:
+                break
+            if code == 9 and length == 1:
+                # if_tsresol
+                (value,) = struct.unpack_from("B", data, offset + 4)
+                if value & 0x80:
+                    return float(2 ** (value & 0x7f))
+                return float(10 ** value)
+            offset += 4 + length + (-length % 4)
+        return 1000000.0
+
+
+class PcapWriter(object):
+    """
+    Write packets with Ethernet and IPv4 headers to a pcap file. The
+    checksums of the IP, TCP and UDP headers are not calculated.
+
+    :param String filename: The name of the file
+    :param Integer snaplen: The maximum length of the captured packets
+    """
+    def __init__(self, filename, snaplen=65535):
+        self._file = open(filename, "wb")
+        self._file.write(struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, snaplen, LINKTYPE_ETHERNET))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Close the file.
+        """
+        self._file.close()
+
+    def write_packet(self, timestamp, data):
+        """
+        Write a packet.
+
+        :param float timestamp: The time the packet has been captured
+        :param bytes data: The packet data including the Ethernet header
+        """
+        seconds = int(timestamp)
+        microseconds = int(round((timestamp - seconds) * 1000000))
+        self._file.write(struct.pack("<IIII", seconds, microseconds, len(data), len(data)))
+        self._file.write(data)
+
+    def _write_ip(self, timestamp, protocol, src, dst, data):
+        ip = struct.pack(
+            "!BBHHHBBH4s4s",
+            0x45, 0, 20 + len(data), 0, 0x4000, 64, protocol, 0,
+            socket.inet_aton(src), socket.inet_aton(dst)
+        )
+        ethernet = b"\x00\x00\x00\x00\x00\x02\x00\x00\x00\x00\x00\x01\x08\x00"
+        self.write_packet(timestamp, ethernet + ip + data)
+
+    def write_tcp(self, timestamp, src, src_port, dst, dst_port, seq, flags, payload=b""):
+        """
+        Write a TCP segment.
+
+        :param float timestamp: The time the packet has been captured
+        :param String src: The IPv4 source address e.g. "10.0.0.1"
+        :param Integer src_port: The source port
+        :param String dst: The IPv4 destination address
+        :param Integer dst_port: The destination port
+        :param Integer seq: The sequence number
+        :param Integer flags: The TCP flags e.g. TCP_SYN
+        :param bytes payload: The payload
+        """
+        tcp = struct.pack("!HHIIBBHHH", src_port, dst_port, seq & 0xffffffff, 0, 5 << 4, flags, 65535, 0, 0)
+        self._write_ip(timestamp, IPPROTO_TCP, src, dst, tcp + payload)
+
+    def write_udp(self, timestamp, src, src_port, dst, dst_port, payload):
+        """
+        Write an UDP datagram.
+
+        :param float timestamp: The time the packet has been captured
+        :param String src: The IPv4 source address e.g. "10.0.0.1"
+        :param Integer src_port: The source port
+        :param String dst: The IPv4 destination address
+        :param Integer dst_port: The destination port
+        :param bytes payload: The payload
+        """
+        udp = struct.pack("!HHHH", src_port, dst_port, 8 + len(payload), 0)
+        self._write_ip(timestamp, IPPROTO_UDP, src, dst, udp + payload)
+
+
+def parse_packet(linktype, data):
+    """
+    Get the addresses, the ports and the payload of a TCP segment or an UDP
+    datagram. IP fragments are not reassembled.
+
+    :param Integer linktype: The link-layer header type
+    :param memoryview data: The packet data
+    :return: None or a tuple with the protocol, source address, source port, destination address, destination port, TCP sequence number, TCP flags, the payload and the offset of the payload in the packet data. The addresses are packed.
+    :rtype: Tuple
+    """
+    try:
+        if linktype == LINKTYPE_ETHERNET:
+            (ether_type,) = struct.unpack_from("!H", data, 12)
+            offset = 14
+            # VLAN tags
+            while ether_type in (0x8100, 0x88a8):
+                (ether_type,) = struct.unpack_from("!H", data, offset + 2)
+                offset += 4
+        elif linktype == LINKTYPE_LINUX_SLL:
+            (ether_type,) = struct.unpack_from("!H", data, 14)
+            offset = 16
+        elif linktype == LINKTYPE_NULL:
+            # Loopback, address family in host byte order
+            (family,) = struct.unpack_from("<I", data, 0)
+            if family > 0xffff:
+                (family,) = struct.unpack_from(">I", data, 0)
+            ether_type = 0x0800
+            if family in (10, 24, 28, 30):
+                ether_type = 0x86dd
+            offset = 4
+        elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+            (version,) = struct.unpack_from("B", data, 0)
+            ether_type = 0x0800
+            if version >> 4 == 6:
+                ether_type = 0x86dd
+            offset = 0
+        else:
+            return None
+
+        if ether_type == 0x0800:
+            (version_ihl, total_length, fragment, protocol) = struct.unpack_from("!BxHxxHxB", data, offset)
+            if fragment & 0x1fff or fragment & 0x2000:
+                # IP fragment
+                return None
+            src = data[offset + 12:offset + 16].tobytes()
+            dst = data[offset + 16:offset + 20].tobytes()
+            end = offset + total_length
+            if total_length == 0:
+                # Not set in packets captured before TCP segmentation offload (TSO/GSO)
+                end = len(data)
+            offset += (version_ihl & 0x0f) * 4
+        elif ether_type == 0x86dd:
+            (payload_length, protocol) = struct.unpack_from("!HB", data, offset + 4)
+            src = data[offset + 8:offset + 24].tobytes()
+            dst = data[offset + 24:offset + 40].tobytes()
+            offset += 40
+            end = offset + payload_length
+            # Hop-by-Hop, Routing and Destination Options extension headers
+            while protocol in (0, 43, 60):
+                (protocol, length) = struct.unpack_from("BB", data, offset)
+                offset += (length + 1) * 8
+        else:
+            return None
+
+        end = min(end, len(data))
+        if protocol == IPPROTO_TCP:
+            (src_port, dst_port, seq, offset_flags) = struct.unpack_from("!HHIxxxxH", data, offset)
+            offset += (offset_flags >> 12) * 4
+            return (protocol, src, src_port, dst, dst_port, seq, offset_flags & 0xff, data[offset:end], offset)
+
+        if protocol == IPPROTO_UDP:
+            (src_port, dst_port) = struct.unpack_from("!HH", data, offset)
+            return (protocol, src, src_port, dst, dst_port, None, None, data[offset + 8:end], offset + 8)
+    except struct.error:
+        pass
+
+    return None
+
+
+class TCPStream(object):
+    """
+    Reassemble the data of one direction of a TCP connection. Segments
+    received out of order are buffered until the missing data is received.
+
+    :param Integer max_buffer_size: Maximum size of the buffered out-of-order data
+    """
+    def __init__(self, max_buffer_size):
+        self.max_buffer_size = max_buffer_size
+        self.initial_seq = None
+        self.next_seq = None
+        self.buffer_size = 0
+        self.failed = False
+        self._segments = {}
+
+    def add(self, seq, data, syn=False):
+        """
+        Add a segment.
+
+        :param Integer seq: The sequence number
+        :param data: The payload
+        :param Boolean syn: True if the SYN flag is set
+        :return: The data in order or an empty list
+        :rtype: List
+        """
+        if syn:
+            self.next_seq = (seq + 1) & 0xffffffff
+            self.initial_seq = self.next_seq
+            return []
+
+        if self.failed or len(data) == 0:
+            return []
+
+        if self.next_seq is None:
+            # Capture started after the handshake
+            self.next_seq = seq
+            self.initial_seq = seq
+
+        diff = (seq - self.next_seq) & 0xffffffff
+        if diff >= 0x80000000:
+            # Retransmission of old data, use the new part only
+            diff = 0x100000000 - diff
+            if diff >= len(data):
+                return []
+            data = data[diff:]
+            seq = self.next_seq
+        elif diff > 0:
+            if seq not in self._segments or len(self._segments[seq]) < len(data):
+                self.buffer_size += len(data) - len(self._segments.get(seq, b""))
+                self._segments[seq] = data.tobytes() if isinstance(data, memoryview) else data
+            if self.buffer_size > self.max_buffer_size:
+                # Unable to recover from the missing data
+                self.failed = True
+                self._segments = {}
+                self.buffer_size = 0
+            return []
+
+        result = [data]
+        self.next_seq = (seq + len(data)) & 0xffffffff
+        while self._segments:
+            found = False
+            for tmp_seq in list(self._segments.keys()):
+                diff = (self.next_seq - tmp_seq) & 0xffffffff
+                if diff >= 0x80000000:
+                    continue
+                tmp_data = self._segments.pop(tmp_seq)
+                self.buffer_size -= len(tmp_data)
+                if diff < len(tmp_data):
+                    result.append(tmp_data[diff:])
+                    self.next_seq = (tmp_seq + len(tmp_data)) & 0xffffffff
+                found = True
+            if not found:
+                break
+
+        return result
+
+
+class Flow(object):
+    """
+    A TCP connection or an exchange of UDP datagrams between two endpoints.
+
+    :param Integer protocol: IPPROTO_TCP or IPPROTO_UDP
+    :param Tuple client: Packed address and port of the client
+    :param Tuple server: Packed address and port of the server
+    """
+    def __init__(self, protocol, client, server, flow_id=0):
+        self.flow_id = flow_id
+        self.protocol = protocol
+        self.client = client
+        self.server = server
+        self.connections = [None, None]
+        self.streams = [None, None]
+        self.errors = [None, None]
+        self.closed = [False, False]
+        self.encrypted = [False, False]
+        self.packets = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+    def __repr__(self):
+        return "<Flow %s:%d -> %s:%d %s>" % (
+            self.client_address,
+            self.client[1],
+            self.server_address,
+            self.server[1],
+            "TCP" if self.protocol == IPPROTO_TCP else "UDP"
+        )
+
+    @staticmethod
+    def _format_address(address):
+        if len(address) == 4:
+            return socket.inet_ntoa(address)
+        return socket.inet_ntop(socket.AF_INET6, address)
+
+    @property
+    def client_address(self):
+        """
+        :rtype: String
+        """
+        return self._format_address(self.client[0])
+
+    @property
+    def server_address(self):
+        """
+        :rtype: String
+        """
+        return self._format_address(self.server[0])
+
+
+class FlowTracker(object):
+    """
+    Track the TCP and UDP flows of a capture and decode the records.
+
+    Decoding errors are stored in :attr:`Flow.errors` and stop the decoding
+    of this direction of the flow. The decoding also stops after the
+    ChangeCipherSpec message because the following records are encrypted.
+
+    :param List ports: Only track flows with one of the ports, None to track all flows
+    :param Integer max_flows: Maximum number of tracked flows, the least recently used flow is closed if the limit is reached
+    :param Integer max_buffer_size: Maximum size of the buffered out-of-order data per direction
+    :param float flow_timeout: Close flows without packets for the given number of seconds
+    :param payload_auto_decode: Passed to the connections
+    :param flow_closed_callback: Called with the flow after a flow has been closed
+    :param connection_kwargs: Additional arguments for the connections e.g. decode_cache
+    """
+    def __init__(self, ports=None, max_flows=10000, max_buffer_size=1024 * 1024, flow_timeout=300.0,
+                 payload_auto_decode=True, flow_closed_callback=None, connection_kwargs=None):
+        self.ports = None
+        if ports is not None:
+            self.ports = frozenset(ports)
+        self.max_flows = max_flows
+        self.max_buffer_size = max_buffer_size
+        self.flow_timeout = flow_timeout
+        self.payload_auto_decode = payload_auto_decode
+        self.flow_closed_callback = flow_closed_callback
+        self.connection_kwargs = connection_kwargs or {}
+        self._flows = OrderedDict()
+        self._next_flow_id = 0
+        self._last_timeout_check = None
+
+    def __len__(self):
+        return len(self._flows)
+
+    def _create_connection(self, protocol):
+        connection_class = SSLv30Connection
+        if protocol == IPPROTO_UDP:
+            connection_class = DTLSv10Connection
+        return connection_class(
+            protocol_version=None,
+            payload_auto_decode=self.payload_auto_decode,
+            **self.connection_kwargs
+        )
+
+    def _get_flow(self, protocol, src, dst, client_is_src):
+        key = (protocol, src, dst)
+        flow = self._flows.get(key)
+        if flow is not None:
+            direction = CLIENT
+        else:
+            key = (protocol, dst, src)
+            flow = self._flows.get(key)
+            direction = SERVER
+
+        if flow is None:
+            if not client_is_src:
+                (src, dst) = (dst, src)
+                direction = SERVER
+            else:
+                direction = CLIENT
+            if len(self._flows) >= self.max_flows:
+                (tmp_key, tmp_flow) = self._flows.popitem(last=False)
+                self._close_flow(tmp_flow)
+            flow = Flow(protocol, src, dst, flow_id=self._next_flow_id)
+            self._next_flow_id += 1
+            key = (protocol, src, dst)
+        else:
+            # Mark as recently used
+            del self._flows[key]
+
+        self._flows[key] = flow
+        return (flow, direction)
+
+    def _close_flow(self, flow):
+        if self.flow_closed_callback is not None:
+            self.flow_closed_callback(flow)
+
+    def _add_payload(self, flow, direction, seq, payload, offset):
+        """
+        Called for every TCP segment and UDP datagram with payload. The
+        segment has already been added to the stream of the flow.
+
+        :param Integer seq: The TCP sequence number or None for UDP
+        :param memoryview payload: The payload
+        :param Integer offset: Offset of the payload in the capture file
+        """
+        pass
+
+    def _decode(self, flow, direction, data_list):
+        connection = flow.connections[direction]
+        if connection is None:
+            connection = self._create_connection(flow.protocol)
+            flow.connections[direction] = connection
+
+        results = []
+        for data in data_list:
+            if isinstance(data, memoryview):
+                data = data.tobytes()
+            if flow.protocol == IPPROTO_UDP:
+                data = self._get_dtls_plaintext(flow, direction, data)
+            error = None
+            try:
+                connection.decode(data)
+            except Exception as e:
+                error = e
+
+            while not connection.is_empty():
+                record = connection.pop_record()
+                if flow.encrypted[direction]:
+                    # The records after the ChangeCipherSpec message can not be decoded
+                    continue
+                results.append((flow, direction, record))
+                if isinstance(record, ChangeCipherSpec):
+                    flow.encrypted[direction] = True
+
+            if flow.encrypted[direction]:
+                break
+            if error is not None:
+                flow.errors[direction] = error
+                break
+        return results
+
+    @staticmethod
+    def _get_dtls_plaintext(flow, direction, data):
+        """
+        Remove the records of a datagram with epoch > 0 and stop at the
+        ChangeCipherSpec record. The DTLS connection does not decode them.
+        """
+        offset = 0
+        while offset + 13 <= len(data):
+            (content_type, epoch, length) = struct.unpack_from("!BxxH6xH", data, offset)
+            if content_type == 20 or epoch > 0:
+                flow.encrypted[direction] = True
+                break
+            offset += 13 + length
+        return data[:offset]
+
+    def close_all(self):
+        """
+        Close all flows.
+        """
+        flows = self._flows
+        self._flows = OrderedDict()
+        for flow in flows.values():
+            self._close_flow(flow)
+
+    def close_timed_out(self, timestamp):
+        """
+        Close all flows without packets since timestamp - flow_timeout.
+
+        :param float timestamp: The current time
+        """
+        limit = timestamp - self.flow_timeout
+        while self._flows:
+            (key, flow) = next(iter(self._flows.items()))
+            if flow.last_timestamp is None or flow.last_timestamp >= limit:
+                break
+            del self._flows[key]
+            self._close_flow(flow)
+
+    def process_packet(self, packet):
+        """
+        Process a packet.
+
+        :param Packet packet: The packet
+        :return: List of the decoded records with flow and direction
+        :rtype: List
+        """
+        if self._last_timeout_check is None or packet.timestamp - self._last_timeout_check > 1.0:
+            self._last_timeout_check = packet.timestamp
+            self.close_timed_out(packet.timestamp)
+
+        result = parse_packet(packet.linktype, packet.data)
+        if result is None:
+            return []
+
+        (protocol, src, src_port, dst, dst_port, seq, flags, payload, payload_offset) = result
+        if self.ports is not None and src_port not in self.ports and dst_port not in self.ports:
+            return []
+
+        if protocol == IPPROTO_TCP:
+            # Data without SYN: the endpoint with the known port is the server
+            client_is_src = (flags & (TCP_SYN | TCP_ACK)) == TCP_SYN
+            if not flags & TCP_SYN:
+                client_is_src = self.ports is None or dst_port in self.ports
+            if not flags & TCP_SYN and len(payload) == 0 and not flags & (TCP_FIN | TCP_RST):
+                key = (protocol, (src, src_port), (dst, dst_port))
+                key_reverse = (protocol, (dst, dst_port), (src, src_port))
+                if key not in self._flows and key_reverse not in self._flows:
+                    # Do not create flows for ACKs
+                    return []
+        else:
+            client_is_src = self.ports is None or dst_port in self.ports
+
+        (flow, direction) = self._get_flow(protocol, (src, src_port), (dst, dst_port), client_is_src)
+        flow.packets += 1
+        if flow.first_timestamp is None:
+            flow.first_timestamp = packet.timestamp
+        flow.last_timestamp = packet.timestamp
+
+        decode = flow.errors[direction] is None and not flow.encrypted[direction]
+        if protocol == IPPROTO_UDP:
+            if not decode or len(payload) == 0:
+                return []
+            self._add_payload(flow, direction, None, payload, packet.offset + payload_offset)
+            return self._decode(flow, direction, [payload])
+
+        records = []
+        if decode:
+            stream = flow.streams[direction]
+            if stream is None:
+                stream = TCPStream(self.max_buffer_size)
+                flow.streams[direction] = stream
+
+            data_list = stream.add(seq, payload, syn=bool(flags & TCP_SYN))
+            if len(payload) > 0:
+                self._add_payload(flow, direction, seq, payload, packet.offset + payload_offset)
+            if data_list:
+                records = self._decode(flow, direction, data_list)
+
+        if flags & TCP_RST:
+            flow.closed = [True, True]
+        elif flags & TCP_FIN:
+            flow.closed[direction] = True
+
+        if flow.closed[CLIENT] and flow.closed[SERVER]:
+            self._flows.pop((protocol, flow.client, flow.server), None)
+            self._close_flow(flow)
+
+        return records
+
+    def process(self, packets):
+        """
+        Process all packets and close the remaining flows at the end.
+
+        :param packets: Iterable of packets e.g. a :class:`CaptureReader`
+        :return: Iterator of flow, direction and record tuples
+        """
+        for packet in packets:
+            for result in self.process_packet(packet):
+                yield result
+        self.close_all()
+
+
+def read_capture(filename, **kwargs):
+    """
+    Decode all records of a capture file.
+
+    :param String filename: The name of the file
+    :param kwargs: Passed to :class:`FlowTracker`
+    :return: Iterator of flow, direction and record tuples
+    """
+    with CaptureReader(filename) as reader:
+        tracker = FlowTracker(**kwargs)
+        for result in tracker.process(reader):
+            yield result
@@ -0,0 +1,240 @@
+"""
+Collect selected values of decoded handshake messages in NumPy structured
+arrays, one row per message. The rows are written to preallocated chunks,
+no dictionary or object is created per row.
+
+The module requires :mod:`numpy`.
+
+Example::
+
+    exporter = HandshakeExporter()
+    connection = SSLv30Connection(None, payload_auto_decode=LAZY, record_sink=exporter)
+    connection.decode(data)
+    exporter.save("handshakes.npz")
+
+    server_hello = exporter.to_arrays()["server_hello"]
+    numpy.bincount(server_hello["cipher_suite"])
+"""
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from flextls.protocol.handshake import ClientHello, DTLSv10ClientHello, DTLSv10Handshake, Handshake, \
+    ServerCertificate, ServerHello
+
+
+class Column(object):
+    """
+    A column of a table.
+
+    :param String name: The name of the column
+    :param dtype: NumPy type of the values e.g. "u2"
+    :param getter: Callable to get the value from a message
+    """
+    def __init__(self, name, dtype, getter):
+        self.name = name
+        self.dtype = dtype
+        self.getter = getter
+
+
+def get_extension_bitmap(message):
+    """
+    Get a bitmap of the extension types of a hello message. Bit n is set if
+    the message contains an extension of type n, types above 63 are not
+    included.
+
+    :param message: ClientHello or ServerHello message
+    :rtype: Integer
+    """
+    bitmap = 0
+    for extension_type in _iter_extension_types(message):
+        if extension_type < 64:
+            bitmap |= 1 << extension_type
+    return bitmap
+
+
+def _iter_extension_types(message):
+    return message.get_field("extensions").get_types()
+
+
+def _count_extension_types(message):
+    return len(_iter_extension_types(message))
+
+
+def _count_items(message, name, item_size):
+    return message.get_field(name).get_item_count(item_size=item_size)
+
+
+def _count_certificates(message):
+    count = 0
+    for certificate in message.iter_certificates():
+        count += 1
+    return count
+
+
+#: Default columns of ClientHello messages
+client_hello_columns = (
+    Column("version_major", "u1", lambda message: message.version.major),
+    Column("version_minor", "u1", lambda message: message.version.minor),
+    Column("cipher_suite_count", "u2", lambda message: _count_items(message, "cipher_suites", 2)),
+    Column("compression_method_count", "u1", lambda message: _count_items(message, "compression_methods", 1)),
+    Column("session_id_length", "u1", lambda message: len(message.session_id)),
+    Column("extension_type_count", "u2", _count_extension_types),
+    Column("extension_bitmap", "u8", get_extension_bitmap),
+)
+
+#: Default columns of ServerHello messages
+server_hello_columns = (
+    Column("version_major", "u1", lambda message: message.version.major),
+    Column("version_minor", "u1", lambda message: message.version.minor),
+    Column("cipher_suite", "u2", lambda message: message.cipher_suite),
+    Column("compression_method", "u1", lambda message: message.compression_method),
+    Column("session_id_length", "u1", lambda message: len(message.session_id)),
+    Column("extension_type_count", "u2", _count_extension_types),
+    Column("extension_bitmap", "u8", get_extension_bitmap),
+)
+
+#: Default columns of Certificate messages
+certificate_columns = (
+    Column("chain_length", "u2", _count_certificates),
+)
+
+
+class ColumnTable(object):
+    """
+    Table stored in NumPy structured arrays. The rows are written to a chunk
+    of chunk_size rows, a new chunk is allocated if the chunk is full.
+
+    :param columns: List of :class:`Column`
+    :param Integer chunk_size: Number of rows per chunk
+    :raises ImportError: If numpy is not available
+    """
+    def __init__(self, columns, chunk_size=4096):
+        if numpy is None:
+            raise ImportError("numpy is required to create tables")
+        if chunk_size < 1:
+            raise ValueError("The chunk size must be at least 1")
+
+        self.columns = tuple(columns)
+        self.dtype = numpy.dtype([(column.name, column.dtype) for column in self.columns])
+        self.chunk_size = chunk_size
+        self._getters = tuple([column.getter for column in self.columns])
+        self._chunks = []
+        self._chunk = numpy.zeros(chunk_size, dtype=self.dtype)
+        self._position = 0
+
+    def __len__(self):
+        return len(self._chunks) * self.chunk_size + self._position
+
+    def append(self, message):
+        """
+        Add a row with the values of a message.
+
+        :param message: The message passed to the getters of the columns
+        """
+        if self._position == self.chunk_size:
+            self._chunks.append(self._chunk)
+            self._chunk = numpy.zeros(self.chunk_size, dtype=self.dtype)
+            self._position = 0
+
+        self._chunk[self._position] = tuple([getter(message) for getter in self._getters])
+        self._position += 1
+
+    def clear(self):
+        """
+        Remove all rows.
+        """
+        self._chunks = []
+        self._position = 0
+
+    def to_array(self):
+        """
+        Get the rows as one array.
+
+        :rtype: numpy.ndarray
+        """
+        return numpy.concatenate(self._chunks + [self._chunk[:self._position]])
+
+    def save(self, filename):
+        """
+        Write the rows to a .npy file.
+
+        :param filename: The name of the file or a file object
+        """
+        numpy.save(filename, self.to_array())
+
+
+class HandshakeExporter(object):
+    """
+    Collect the values of handshake messages in tables. An exporter can be
+    used as record_sink of a connection, see
+    :class:`flextls.connection.BaseConnection`. Other records and messages
+    without a table are ignored.
+
+    :param tables: Dict of table names mapped to a tuple of the message classes and the columns, default: :attr:`default_tables`
+    :param Integer chunk_size: Number of rows per chunk
+    :raises ImportError: If numpy is not available
+    """
+
+    #: Tables of ClientHello, ServerHello and Certificate messages
+    default_tables = {
+        "client_hello": ((ClientHello, DTLSv10ClientHello), client_hello_columns),
+        "server_hello": ((ServerHello,), server_hello_columns),
+        "certificate": ((ServerCertificate,), certificate_columns),
+    }
+
+    def __init__(self, tables=None, chunk_size=4096):
+        if tables is None:
+            tables = self.default_tables
+
+        self.tables = {}
+        self._message_tables = {}
+        for (name, (message_classes, columns)) in tables.items():
+            table = ColumnTable(columns, chunk_size=chunk_size)
+            self.tables[name] = table
+            for message_class in message_classes:
+                self._message_tables[message_class] = table
+
+    def __call__(self, record):
+        self.add(record)
+
+    def add(self, record):
+        """
+        Add the message of a handshake record.
+
+        :param record: The record returned by the connection
+        """
+        if not isinstance(record, (Handshake, DTLSv10Handshake)):
+            return
+
+        message = record.payload
+        table = self._message_tables.get(message.__class__)
+        if table is not None:
+            table.append(message)
+
+    def clear(self):
+        """
+        Remove the rows of all tables.
+        """
+        for table in self.tables.values():
+            table.clear()
+
+    def to_arrays(self):
+        """
+        :return: Names of the tables mapped to the arrays
+        :rtype: Dict
+        """
+        return dict([(name, table.to_array()) for (name, table) in self.tables.items()])
+
+    def save(self, filename, compressed=False):
+        """
+        Write the tables to a .npz file, one array per table.
+
+        :param filename: The name of the file or a file object
+        :param Boolean compressed: Compress the file
+        """
+        if compressed:
+            numpy.savez_compressed(filename, **self.to_arrays())
+        else:
+            numpy.savez(filename, **self.to_arrays())
@@ -1,24 +1,152 @@
 """
 The class in this python module can be used to handle SSL/TLS/DTLS connections.
 """
+import copy
+import struct
+
 from flextls import helper
-from flextls.protocol import Protocol
+from flextls.protocol import Protocol, DecodeProfile, LAZY, SKIP, _ConnectionContext
 from flextls.protocol.record import DTLSv10Record
 from flextls.protocol.handshake import DTLSv10Handshake
-from flextls.exception import NotEnoughData
 from flextls.exception import NotEnoughData, WrongProtocolVersion
 from flextls.protocol.record import SSLv3Record
 from flextls.protocol.handshake import Handshake
+from flextls.protocol.handshake import ClientHello, DTLSv10ClientHello, ServerHello
+from flextls import trace
+from flextls.transcript import HandshakeTranscript
+
+
+def _get_missing_length(data, header_length, length_offset, length_size=2):
+    """
+    Get the number of bytes missing to complete a record or message.
+
+    :param data: The data starting with the header
+    :param Integer header_length: Length of the header
+    :param Integer length_offset: Offset of the length field in the header
+    :param Integer length_size: Size of the length field, 2 or 3 bytes
+    :return: Number of bytes missing or None if the data is complete
+    """
+    if len(data) < header_length:
+        # At least the header is missing
+        return header_length - len(data)
+
+    if length_size == 3:
+        (length_high, length_low) = struct.unpack_from("!BH", data, length_offset)
+        length = (length_high << 16) + length_low
+    else:
+        length = struct.unpack_from("!H", data, length_offset)[0]
+
+    missing = header_length + length - len(data)
+    if missing > 0:
+        return missing
+    return None
+
+
+#: Size of the messages with a fixed size by content type: ChangeCipherSpec and Alert
+_MESSAGE_SIZES = {20: 1, 21: 2}
+
+
+def _get_missing_message_length(content_type, data, header_length=4, length_offset=1):
+    """
+    Get the number of bytes missing to complete the next message of the
+    payload of a record. Messages of other content types e.g. Heartbeat
+    are not checked.
+
+    :param Integer content_type: The content type of the record
+    :param data: The payload data starting with the message
+    :param Integer header_length: Length of the header of handshake messages, 4 for TLS and 12 for DTLS
+    :param Integer length_offset: Offset of the (fragment) length field in the header of handshake messages
+    :return: Number of bytes missing or None if the data is complete or can not be checked
+    """
+    if content_type == 22:
+        return _get_missing_length(data, header_length, length_offset, length_size=3)
+
+    size = _MESSAGE_SIZES.get(content_type)
+    if size is not None and len(data) < size:
+        return size - len(data)
+    return None
 
 
 class BaseConnection(object):
     """
     Base class to handle SSL/TLS/DTLS connections and its state.
+
+    :param Integer protocol_version: Internal ID of the protocol version or None to decode records of all versions
+    :param payload_auto_decode: True to decode the records, LAZY to decode the payload on first access or a DecodeProfile
+    :param List transcript_hash_algorithms: Hash the handshake messages with the given algorithms (see :class:`flextls.transcript.HandshakeTranscript`)
+    :param flextls.cache.DecodeCache decode_cache: Reuse decoded handshake messages from the cache
+    :param flextls.cache.InternPool intern_pool: Share the values of vector fields with the same content, use the intern_pool of the DecodeProfile if a profile is used
+    :param record_sink: Callable called with every decoded record instead of storing the record to be returned by :meth:`pop_record`
+    :param tracer: Callable called with a :class:`flextls.trace.TraceEvent` for every event while decoding
     """
-    def __init__(self, protocol_version):
+    def __init__(self, protocol_version, payload_auto_decode=True, transcript_hash_algorithms=None,
+                 decode_cache=None, intern_pool=None, record_sink=None, tracer=None):
+        if intern_pool is not None:
+            if payload_auto_decode is not True and payload_auto_decode is not LAZY:
+                raise ValueError("Use the intern_pool of a DecodeProfile")
+            payload_auto_decode = intern_pool.get_profile(payload_auto_decode)
+
         self._decoded_records = []
         self._cur_protocol_version = protocol_version
+        self._payload_auto_decode = payload_auto_decode
+        self.decode_cache = decode_cache
+        self.record_sink = record_sink
+        self.tracer = tracer
         self.state = None
+        self.transcript = None
+        if transcript_hash_algorithms is not None:
+            self.transcript = HandshakeTranscript(transcript_hash_algorithms)
+
+    def _add_record(self, record):
+        if self.tracer is not None:
+            self._trace(trace.RECORD_DECODED, record)
+        if self.record_sink is None:
+            self._decoded_records.append(record)
+        else:
+            self.record_sink(record)
+
+    def _get_decode_cache_context(self, handshake_type):
+        # The payload of ServerKeyExchange messages depends on the cipher suite
+        if handshake_type == 12:
+            return (self._payload_auto_decode, self.state.cipher_suite)
+        return (self._payload_auto_decode, None)
+
+    def _add_to_decode_cache(self, record_class, handshake_type, data, payload, context):
+        # The cache keeps a copy for its own, it must not keep the connection
+        # only the state required to decode the payload
+        connection = None
+        if context[1] is not None:
+            connection = _ConnectionContext(context[1])
+        payload = copy.deepcopy(payload)
+        payload._set_connection(connection)
+        self.decode_cache.add(record_class, handshake_type, data, payload, context=context)
+
+    def _get_from_decode_cache(self, record_class, handshake_type, data, context):
+        payload = self.decode_cache.get(record_class, handshake_type, data, context=context)
+        if payload is not None:
+            payload._set_connection(self)
+        return payload
+
+    def _get_record_decode_mode(self, record):
+        if isinstance(self._payload_auto_decode, DecodeProfile):
+            return self._payload_auto_decode.get_mode(record.__class__, record.content_type)
+        return True
+
+    def _trace(self, name, record=None, **details):
+        self.tracer(trace.TraceEvent(name, self, record=record, **details))
+
+    def _trace_version_mismatch(self, record, version):
+        self._trace(
+            trace.VERSION_MISMATCH,
+            record,
+            expected=helper.get_version_name(self._cur_protocol_version),
+            received=helper.get_version_name(version)
+        )
+
+    def _update_transcript(self, handshake_type, data):
+        # HelloRequest messages are not included
+        if handshake_type != 0:
+            self.transcript.update(data)
 
     def clear_records(self):
         self._decoded_records.clear()
@@ -37,29 +165,105 @@ class BaseConnection(object):
 
 
 class BaseConnectionState(object):
+    """
+    Track the state of a connection.
+
+    The records are passed to handlers registered with
+    :meth:`add_update_handler`. A handler is called with the state and the
+    record as arguments. The handlers of a record class are also used for
+    its subclasses, the handlers of the most specific class are preferred.
+    """
+    update_handlers = None
+    #: Handlers of the state and record classes including the handlers of the base classes
+    _handler_cache = {}
+
     def __init__(self):
         self.cipher_suite = None
         self.compression_algorithm = None
         self.client_random = None
         self.server_random = None
 
+    @classmethod
+    def add_update_handler(cls, record_class, record_type, handler):
+        """
+        Register a handler to update the state.
+
+        :param record_class: Class of the record e.g. flextls.protocol.handshake.Handshake
+        :param record_type: Value of the payload identifier field e.g. the handshake type or None
+        :param handler: Callable with the state and the record as arguments
+        """
+        if cls.__dict__.get("update_handlers") is None:
+            update_handlers = {}
+            if cls.update_handlers is not None:
+                for tmp_class, tmp_handlers in cls.update_handlers.items():
+                    update_handlers[tmp_class] = dict(tmp_handlers)
+            cls.update_handlers = update_handlers
+
+        if record_class not in cls.update_handlers:
+            cls.update_handlers[record_class] = {}
+        cls.update_handlers[record_class][record_type] = handler
+        # The handlers might be inherited by other state classes
+        BaseConnectionState._handler_cache.clear()
+
+    @classmethod
+    def _get_update_handlers(cls, record_class):
+        key = (cls, record_class)
+        handlers = cls._handler_cache.get(key)
+        if handlers is None:
+            handlers = {}
+            for tmp_class in reversed(record_class.__mro__):
+                tmp_handlers = cls.update_handlers.get(tmp_class)
+                if tmp_handlers is not None:
+                    handlers.update(tmp_handlers)
+            cls._handler_cache[key] = handlers
+        return handlers
+
     def update(self, record):
-        from flextls.protocol.handshake import ClientHello, ServerHello
-        if isinstance(record, (Handshake, DTLSv10Handshake)):
-            if isinstance(record.payload, ClientHello):
-                self.client_random = record.payload.random
-            if isinstance(record.payload, ServerHello):
-                self.server_random = record.payload.random
-                self.compression_algorithm = record.payload.compression_method
-                self.cipher_suite = record.payload.cipher_suite
+        handlers = self._get_update_handlers(record.__class__)
+        if not handlers:
+            return
+
+        record_type = None
+        if record.payload_identifier_field:
+            record_type = record.get_field_value(record.payload_identifier_field)
+
+        handler = handlers.get(record_type)
+        if handler is not None:
+            handler(self, record)
+
+    def _update_client_hello(self, record):
+        if isinstance(record.payload, (ClientHello, DTLSv10ClientHello)):
+            self.client_random = record.payload.random
+
+    def _update_server_hello(self, record):
+        if isinstance(record.payload, ServerHello):
+            self.server_random = record.payload.random
+            self.compression_algorithm = record.payload.compression_method
+            self.cipher_suite = record.payload.cipher_suite
+
+
+BaseConnectionState.add_update_handler(Handshake, 1, BaseConnectionState._update_client_hello)
+BaseConnectionState.add_update_handler(Handshake, 2, BaseConnectionState._update_server_hello)
+BaseConnectionState.add_update_handler(DTLSv10Handshake, 1, BaseConnectionState._update_client_hello)
+BaseConnectionState.add_update_handler(DTLSv10Handshake, 2, BaseConnectionState._update_server_hello)
 
 
 class BaseDTLSConnection(BaseConnection):
     """
     Base class for DTLS connections.
     """
-    def __init__(self, protocol_version):
-        BaseConnection.__init__(self, protocol_version=protocol_version)
+    def __init__(self, protocol_version, payload_auto_decode=True, transcript_hash_algorithms=None,
+                 decode_cache=None, intern_pool=None, record_sink=None, tracer=None):
+        BaseConnection.__init__(
+            self,
+            protocol_version=protocol_version,
+            payload_auto_decode=payload_auto_decode,
+            transcript_hash_algorithms=transcript_hash_algorithms,
+            decode_cache=decode_cache,
+            intern_pool=intern_pool,
+            record_sink=record_sink,
+            tracer=tracer
+        )
         self._window = []
         self._window_next_seq = 0
 
@@ -76,21 +280,42 @@ class BaseDTLSConnection(BaseConnection):
 
         self.state = BaseConnectionState()
 
+    def _update_transcript(self, handshake_type, data):
+        # The initial ClientHello and the HelloVerifyRequest are not included
+        if handshake_type == 3:
+            self.transcript.reset()
+            return
+        BaseConnection._update_transcript(self, handshake_type, data)
+
     def _process(self, obj):
+        """
+        Process the payload of a record.
+
+        :return: The record to add or None
+        """
         if isinstance(obj, DTLSv10Handshake):
-            self._process_handshake(obj)
+            return self._process_handshake(obj)
         elif isinstance(obj, Protocol):
-            self.state.update(obj)
-            self._decoded_records.append(obj)
+            return obj
+        return None
 
     def _process_handshake(self, obj):
         """
+        Reassemble and decode a handshake message.
 
         :param obj:
         :type obj: flextls.protocol.handshake.DTLSv10Handshake
+        :return: The complete handshake message or None if it has been buffered or dropped
         """
         if obj.message_seq != self._handshake_next_receive_seq:
-            return
+            if self.tracer is not None:
+                self._trace(
+                    trace.OUT_OF_ORDER_DROPPED,
+                    obj,
+                    message_seq=obj.message_seq,
+                    expected_message_seq=self._handshake_next_receive_seq
+                )
+            return None
 
         self._handshake_msg_queue.append(obj)
 
@@ -99,45 +324,125 @@ class BaseDTLSConnection(BaseConnection):
 
         if obj.is_fragment() is True:
             self._handshake_msg_queue.insert(0, obj)
-            return
+            if self.tracer is not None:
+                self._trace(
+                    trace.FRAGMENT_BUFFERED,
+                    obj,
+                    message_seq=obj.message_seq,
+                    fragment_offset=obj.fragment_offset,
+                    fragment_length=obj.fragment_length,
+                    length=obj.length
+                )
+            return None
+
+        if self.transcript is not None:
+            # Use the header of the unfragmented message
+            length = obj.length
+            self._update_transcript(
+                obj.type,
+                struct.pack(
+                    "!BBHHBHBH",
+                    obj.type,
+                    length >> 16,
+                    length & 0xffff,
+                    obj.message_seq,
+                    0,
+                    0,
+                    length >> 16,
+                    length & 0xffff
+                ) + obj.payload
+            )
 
-        obj.decode_payload()
+        if self.decode_cache is not None and obj.type in self.decode_cache.message_types:
+            self._decode_handshake_payload_cached(obj)
+        else:
+            obj.decode_payload(payload_auto_decode=self._payload_auto_decode)
         self._handshake_next_receive_seq += 1
-        self.state.update(obj)
-        self._decoded_records.append(obj)
+        return obj
+
+    def _decode_handshake_payload_cached(self, obj):
+        data = obj.payload
+        context = self._get_decode_cache_context(obj.type)
+        payload = self._get_from_decode_cache(DTLSv10Handshake, obj.type, data, context)
+        if payload is not None:
+            obj.payload = payload
+            return
+
+        obj.decode_payload(payload_auto_decode=self._payload_auto_decode)
+        if isinstance(obj._payload, Protocol):
+            self._add_to_decode_cache(DTLSv10Handshake, obj.type, data, obj._payload, context)
 
     def decode(self, data):
-        while True and len(data) > 0:
-            try:
-                (obj, data) = DTLSv10Record.decode(
-                    data,
-                    connection=self,
-                    payload_auto_decode=False
-                )
+        while len(data) > 0:
+            # Check the length before decoding to not raise NotEnoughData for every incomplete record
+            bytes_needed = _get_missing_length(data, 13, 11)
+            if bytes_needed is not None:
+                if self.tracer is not None:
+                    self._trace(trace.INCOMPLETE, layer="record", bytes_needed=bytes_needed)
+                break
+
+            (obj, data) = DTLSv10Record.decode(
+                data,
+                connection=self,
+                payload_auto_decode=False
+            )
 
-                version = helper.get_version_by_version_id((
-                    obj.version.major,
-                    obj.version.minor
-                ))
+            version = helper.get_version_by_version_id((
+                obj.version.major,
+                obj.version.minor
+            ))
+
+            if self._cur_protocol_version is not None and version != self._cur_protocol_version:
+                if self.tracer is not None:
+                    self._trace_version_mismatch(obj, version)
+                # ToDo: Save data before exit?
+                raise WrongProtocolVersion(
+                    record=obj
+                )
 
-                if version != self._cur_protocol_version:
-                    # ToDo: Save data before exit?
-                    raise WrongProtocolVersion(
-                        record=obj
+            decode_mode = self._get_record_decode_mode(obj)
+            if decode_mode is SKIP:
+                continue
+            if decode_mode is False:
+                self._add_record(obj)
+                continue
+
+            bytes_needed = _get_missing_message_length(obj.content_type, obj.payload, 12, 9)
+            if bytes_needed is not None:
+                if self.tracer is not None:
+                    self._trace(
+                        trace.INCOMPLETE,
+                        layer="message",
+                        content_type=obj.content_type,
+                        bytes_needed=bytes_needed
                     )
+                break
+
+            try:
                 (record, tmp_data) = DTLSv10Record.decode_raw_payload(
                     obj.content_type,
                     obj.payload,
                     connection=self,
                     payload_auto_decode=False
                 )
-
-                self._process(record)
-
-            except NotEnoughData as e:
-                print(e)
+                record = self._process(record)
+            except NotEnoughData:
+                # The message is complete but the length fields of the payload are invalid
+                if self.tracer is not None:
+                    self._trace(
+                        trace.INCOMPLETE,
+                        layer="message",
+                        content_type=obj.content_type,
+                        bytes_needed=None
+                    )
                 break
 
+            # Call the handlers and the record sink outside of the try block
+            # to not handle their exceptions as incomplete data
+            if record is not None:
+                self.state.update(record)
+                self._add_record(record)
+
     def encode(self, records):
         if isinstance(records, Protocol):
             records = [records]
@@ -152,6 +457,8 @@ class BaseDTLSConnection(BaseConnection):
             if isinstance(record, DTLSv10Handshake):
                 record.message_seq = self._handshake_next_send_seq
                 self._handshake_next_send_seq += 1
+                if self.transcript is not None:
+                    self._update_transcript(record.type, record.encode())
 
             dtls_record = DTLSv10Record(
                 connection=self
@@ -186,8 +493,18 @@ class BaseTLSConnection(BaseConnection):
     """
     Class to handle SSL/TLS connections.
     """
-    def __init__(self, protocol_version):
-        BaseConnection.__init__(self, protocol_version=protocol_version)
+    def __init__(self, protocol_version, payload_auto_decode=True, transcript_hash_algorithms=None,
+                 decode_cache=None, intern_pool=None, record_sink=None, tracer=None):
+        BaseConnection.__init__(
+            self,
+            protocol_version=protocol_version,
+            payload_auto_decode=payload_auto_decode,
+            transcript_hash_algorithms=transcript_hash_algorithms,
+            decode_cache=decode_cache,
+            intern_pool=intern_pool,
+            record_sink=record_sink,
+            tracer=tracer
+        )
         self._raw_stream_data = b""
 
         self._cur_record_type = None
@@ -195,57 +512,141 @@ class BaseTLSConnection(BaseConnection):
 
         self.state = BaseConnectionState()
 
+    def _decode_handshake_cached(self, data):
+        """
+        Decode a handshake message and use the decode cache if the type of
+        the message is supported by the cache.
+
+        :param bytes data: The data
+        :return: The decoded message and the data not used to decode the message
+        :rtype: Tuple
+        """
+        if len(data) < 4:
+            raise NotEnoughData("Not enough data to decode handshake message")
+
+        (handshake_type, length_high, length_low) = struct.unpack_from("!BBH", data, 0)
+        length = (length_high << 16) + length_low
+        if handshake_type not in self.decode_cache.message_types or len(data) < length + 4:
+            return SSLv3Record.decode_raw_payload(
+                22,
+                data,
+                payload_auto_decode=self._payload_auto_decode,
+                connection=self
+            )
+
+        message_data = data[4:length + 4]
+        context = self._get_decode_cache_context(handshake_type)
+        payload = self._get_from_decode_cache(Handshake, handshake_type, message_data, context)
+        if payload is None:
+            (obj, tmp_data) = SSLv3Record.decode_raw_payload(
+                22,
+                data[:length + 4],
+                payload_auto_decode=self._payload_auto_decode,
+                connection=self
+            )
+            if isinstance(obj._payload, Protocol):
+                self._add_to_decode_cache(Handshake, handshake_type, message_data, obj._payload, context)
+        else:
+            obj = Handshake(connection=self)
+            obj.type = handshake_type
+            obj.length = length
+            obj.payload = payload
+
+        return (obj, data[length + 4:])
+
     def _decode_record_payload(self):
         while len(self._cur_record_data) > 0:
-            try:
-                (obj, data) = SSLv3Record.decode_raw_payload(
-                    self._cur_record_type,
-                    self._cur_record_data,
-                    payload_auto_decode=True,
-                    connection=self
-                )
-                self._cur_record_data = data
-                self.state.update(obj)
-                self._decoded_records.append(obj)
+            # Wait for the complete message without raising NotEnoughData
+            bytes_needed = _get_missing_message_length(self._cur_record_type, self._cur_record_data)
+            if bytes_needed is not None:
+                if self.tracer is not None:
+                    self._trace(
+                        trace.INCOMPLETE,
+                        layer="message",
+                        content_type=self._cur_record_type,
+                        bytes_needed=bytes_needed
+                    )
+                break
 
+            try:
+                if self.decode_cache is not None and self._cur_record_type == 22:
+                    (obj, data) = self._decode_handshake_cached(self._cur_record_data)
+                else:
+                    (obj, data) = SSLv3Record.decode_raw_payload(
+                        self._cur_record_type,
+                        self._cur_record_data,
+                        payload_auto_decode=self._payload_auto_decode,
+                        connection=self
+                    )
             except NotEnoughData:
+                # Incomplete message of other content types or invalid length fields
+                if self.tracer is not None:
+                    self._trace(
+                        trace.INCOMPLETE,
+                        layer="message",
+                        content_type=self._cur_record_type,
+                        bytes_needed=None
+                    )
                 break
 
-    def decode(self, data):
-        self._raw_stream_data += data
-        while True:
-            try:
-                (obj, data) = SSLv3Record.decode(
-                    self._raw_stream_data,
-                    connection=self,
-                    payload_auto_decode=False
+            if self.transcript is not None and self._cur_record_type == 22:
+                self._update_transcript(
+                    obj.type,
+                    memoryview(self._cur_record_data)[:len(self._cur_record_data) - len(data)]
                 )
-                version = helper.get_version_by_version_id((
-                    obj.version.major,
-                    obj.version.minor
-                ))
-
-                self._raw_stream_data = data
+            self._cur_record_data = data
+            # Call the handlers and the record sink outside of the try block
+            # to not handle their exceptions as incomplete data
+            self.state.update(obj)
+            self._add_record(obj)
 
-                if version != self._cur_protocol_version:
-                    raise WrongProtocolVersion(
-                        record=obj
-                    )
+    def decode(self, data):
+        self._raw_stream_data += data
+        while len(self._raw_stream_data) > 0:
+            # Check the length before decoding to not raise NotEnoughData for every incomplete record
+            bytes_needed = _get_missing_length(self._raw_stream_data, 5, 3)
+            if bytes_needed is not None:
+                if self.tracer is not None:
+                    self._trace(trace.INCOMPLETE, layer="record", bytes_needed=bytes_needed)
+                break
 
-                if self._cur_record_type is None:
-                    self._cur_record_type = obj.content_Type
+            (obj, data) = SSLv3Record.decode(
+                self._raw_stream_data,
+                connection=self,
+                payload_auto_decode=False
+            )
+            version = helper.get_version_by_version_id((
+                obj.version.major,
+                obj.version.minor
+            ))
+
+            self._raw_stream_data = data
+
+            if self._cur_protocol_version is not None and version != self._cur_protocol_version:
+                if self.tracer is not None:
+                    self._trace_version_mismatch(obj, version)
+                raise WrongProtocolVersion(
+                    record=obj
+                )
 
-                if self._cur_record_type != obj.content_type:
-                    self._decode_record_payload()
-                    self._cur_record_data = b""
-                    self._cur_record_type = obj.content_type
+            decode_mode = self._get_record_decode_mode(obj)
+            if decode_mode is SKIP:
+                continue
+            if decode_mode is False:
+                self._add_record(obj)
+                continue
 
-                self._cur_record_data += obj.payload
+            if self._cur_record_type is None:
+                self._cur_record_type = obj.content_Type
 
+            if self._cur_record_type != obj.content_type:
                 self._decode_record_payload()
+                self._cur_record_data = b""
+                self._cur_record_type = obj.content_type
 
-            except NotEnoughData:
-                break
+            self._cur_record_data += obj.payload
+
+            self._decode_record_payload()
 
     def encode(self, records):
         if isinstance(records, Protocol):
@@ -255,6 +656,8 @@ class BaseTLSConnection(BaseConnection):
         for record in records:
             if isinstance(record, Protocol):
                 self.state.update(record)
+                if self.transcript is not None and isinstance(record, Handshake):
+                    self._update_transcript(record.type, record.encode())
                 tls_record = SSLv3Record(
                     connection=self
                 )
@@ -0,0 +1,415 @@
+"""
+Generate synthetic TLS and DTLS handshakes for benchmarks, profiling and
+fuzzing.
+
+The messages are created with the protocol classes of flextls. The values
+are chosen by a random number generator initialized with a seed, the same
+seed and parameters always generate the same corpus. A handshake consists
+of the ClientHello sent by the client and the ServerHello, Certificate,
+ServerKeyExchange (depending on the cipher suite) and ServerHelloDone
+messages sent by the server.
+
+Example::
+
+    generator = CorpusGenerator(seed=1, cipher_suite_count=(20, 60), chain_length=(2, 4))
+    generator.write_pcap("tls.pcap", 1000)
+
+    generator = CorpusGenerator(seed=1, protocol_version=flextls.registry.version.DTLSv12)
+    generator.write_pcap("dtls.pcap", 1000, fragment_size=200, reorder=True)
+"""
+import random
+import struct
+
+import flextls
+from flextls import helper
+from flextls.capture import TCP_ACK, TCP_FIN, TCP_SYN, PcapWriter
+from flextls.field import CertificateField, CipherSuiteField, CompressionMethodField, ECParametersNamedCurveField, \
+    HostNameField, ServerNameField, SignatureAndHashAlgorithmField, UInt8Field, UInt16Field, VectorUInt8Field
+from flextls.protocol.handshake import ClientHello, DTLSv10ClientHello, DTLSv10Handshake, Handshake, \
+    ServerCertificate, ServerHello, ServerHelloDone, ServerKeyExchange, ServerKeyExchangeDHERSA, ServerKeyExchangeECDSA
+from flextls.protocol.handshake.extension import ApplicationLayerProtocolNegotiation, EcPointFormats, \
+    EllipticCurves, Extension, Heartbeat, ServerNameIndication, SessionTicketTLS, SignatureAlgorithms
+from flextls.protocol.record import DTLSv10Record, SSLv3Record
+
+#: Key exchange algorithms the server can select, the ServerKeyExchange message depends on the algorithm
+SERVER_KEY_EXCHANGES = ("RSA", "DHE_RSA", "ECDHE_RSA", "ECDHE_ECDSA")
+
+#: Extension types of the ClientHello supported by the generator
+EXTENSION_TYPES = (
+    0x0000,  # server_name
+    0x000a,  # elliptic_curves
+    0x000b,  # ec_point_formats
+    0x000d,  # signature_algorithms
+    0x000f,  # heartbeat
+    0x0010,  # ALPN
+    0x0023,  # session_ticket
+    0xff01,  # renegotiation_info
+)
+
+
+class CorpusGenerator(object):
+    """
+    Generate handshakes with random values.
+
+    Ranges are given as tuple with the minimum and the maximum value.
+
+    :param seed: Seed of the random number generator
+    :param Integer protocol_version: Internal ID of the protocol version, a DTLS version to generate DTLS handshakes
+    :param Tuple cipher_suite_count: Range of the number of cipher suites offered by the client
+    :param List extension_types: Types of the extensions to choose from, see :data:`EXTENSION_TYPES`
+    :param float extension_probability: Probability of every extension type to be included in a ClientHello
+    :param Tuple chain_length: Range of the number of certificates sent by the server
+    :param Tuple certificate_size: Range of the size of the certificates in bytes
+    :param List server_names: Server names to choose from
+    """
+    def __init__(self, seed=0, protocol_version=None, cipher_suite_count=(5, 40), extension_types=EXTENSION_TYPES,
+                 extension_probability=0.7, chain_length=(1, 3), certificate_size=(600, 1800), server_names=None):
+        if protocol_version is None:
+            protocol_version = flextls.registry.version.TLSv12
+        if server_names is None:
+            server_names = ["example.org", "www.example.org", "mail.example.com", "api.example.net"]
+
+        unsupported = set(extension_types) - set(EXTENSION_TYPES)
+        if unsupported:
+            raise ValueError("Unsupported extension types: %s" % ", ".join(["0x%04x" % t for t in unsupported]))
+
+        self.random = random.Random(seed)
+        self.protocol_version = protocol_version
+        self.dtls = protocol_version in (flextls.registry.version.DTLSv10, flextls.registry.version.DTLSv12)
+        self.cipher_suite_count = cipher_suite_count
+        self.extension_types = tuple(extension_types)
+        self.extension_probability = extension_probability
+        self.chain_length = chain_length
+        self.certificate_size = certificate_size
+        self.server_names = server_names
+
+        self._cipher_suites = sorted([cipher_suite.id for cipher_suite in flextls.registry.tls.cipher_suites])
+        self._key_exchanges = dict([
+            (cipher_suite.id, cipher_suite.key_exchange) for cipher_suite in flextls.registry.tls.cipher_suites
+        ])
+        self._server_cipher_suites = [
+            cipher_suite for cipher_suite in self._cipher_suites
+            if self._key_exchanges[cipher_suite] in SERVER_KEY_EXCHANGES
+        ]
+
+    def _random_bytes(self, length):
+        return bytes(bytearray([self.random.getrandbits(8) for i in range(length)]))
+
+    def _set_version(self, message):
+        (message.version.major, message.version.minor) = helper.get_tls_version(self.protocol_version)
+
+    def _create_extension(self, extension_type, server_name):
+        if extension_type == 0x0000:
+            tmp_server_name = ServerNameField()
+            tmp_server_name.payload = HostNameField("")
+            tmp_server_name.payload.value = server_name.encode("ascii")
+            payload = ServerNameIndication()
+            payload.server_name_list.append(tmp_server_name)
+        elif extension_type == 0x000a:
+            payload = EllipticCurves()
+            for curve in self.random.sample([0x0017, 0x0018, 0x0019, 0x001d, 0x001e], self.random.randint(1, 5)):
+                field = UInt16Field(None, None)
+                field.value = curve
+                payload.elliptic_curve_list.append(field)
+        elif extension_type == 0x000b:
+            payload = EcPointFormats()
+            field = UInt8Field(None, None)
+            field.value = 0
+            payload.point_format_list.append(field)
+        elif extension_type == 0x000d:
+            payload = SignatureAlgorithms()
+            for hash_algorithm in (4, 5, 6):
+                for signature in self.random.sample([1, 3], 2):
+                    field = SignatureAndHashAlgorithmField(None)
+                    field.hash = hash_algorithm
+                    field.signature = signature
+                    payload.supported_signature_algorithms.append(field)
+        elif extension_type == 0x000f:
+            payload = Heartbeat()
+            payload.mode = 1
+        elif extension_type == 0x0010:
+            payload = ApplicationLayerProtocolNegotiation()
+            for protocol in self.random.choice([[b"h2", b"http/1.1"], [b"http/1.1"], [b"h2"]]):
+                field = VectorUInt8Field(None)
+                field.value = protocol
+                payload.protocol_name_list.append(field)
+        elif extension_type == 0x0023:
+            payload = SessionTicketTLS()
+            payload.data = self._random_bytes(self.random.choice([0, 0, 128, 192]))
+        else:
+            # renegotiation_info is not decoded by flextls
+            extension = Extension()
+            extension.type = extension_type
+            extension.payload = b"\x00"
+            return extension
+
+        return Extension() + payload
+
+    def create_client_hello(self):
+        """
+        Create a ClientHello message.
+
+        :rtype: flextls.protocol.handshake.ClientHello|flextls.protocol.handshake.DTLSv10ClientHello
+        """
+        if self.dtls:
+            client_hello = DTLSv10ClientHello()
+        else:
+            client_hello = ClientHello()
+        self._set_version(client_hello)
+        client_hello.random = self._random_bytes(32)
+        client_hello.session_id = self._random_bytes(self.random.choice([0, 32]))
+
+        count = self.random.randint(*self.cipher_suite_count)
+        cipher_suites = self.random.sample(self._cipher_suites, min(count, len(self._cipher_suites)))
+        if not any([cipher_suite in self._server_cipher_suites for cipher_suite in cipher_suites]):
+            # The server must be able to select a cipher suite
+            cipher_suites[-1] = self.random.choice(self._server_cipher_suites)
+        for cipher_suite in cipher_suites:
+            field = CipherSuiteField()
+            field.value = cipher_suite
+            client_hello.cipher_suites.append(field)
+
+        field = CompressionMethodField()
+        field.value = 0
+        client_hello.compression_methods.append(field)
+
+        server_name = self.random.choice(self.server_names)
+        for extension_type in self.extension_types:
+            if self.random.random() < self.extension_probability:
+                client_hello.extensions.append(self._create_extension(extension_type, server_name))
+
+        return client_hello
+
+    def create_server_messages(self, client_hello):
+        """
+        Create the messages of the server to answer a ClientHello.
+
+        :param client_hello: The ClientHello message
+        :return: List of ServerHello, Certificate, ServerKeyExchange (optional) and ServerHelloDone messages
+        :rtype: List
+        """
+        server_hello = ServerHello()
+        self._set_version(server_hello)
+        server_hello.random = self._random_bytes(32)
+        server_hello.session_id = self._random_bytes(32)
+        cipher_suite = None
+        for field in client_hello.cipher_suites:
+            if field.value in self._server_cipher_suites:
+                cipher_suite = field.value
+                break
+        server_hello.cipher_suite = cipher_suite
+        server_hello.compression_method = 0
+        if client_hello.get_extension(0xff01) is not None:
+            server_hello.extensions.append(self._create_extension(0xff01, None))
+        messages = [server_hello]
+
+        certificate = ServerCertificate()
+        for i in range(self.random.randint(*self.chain_length)):
+            field = CertificateField()
+            field.value = self._random_bytes(self.random.randint(*self.certificate_size))
+            certificate.certificate_list.append(field)
+        messages.append(certificate)
+
+        key_exchange = self._key_exchanges[cipher_suite]
+        if key_exchange == "DHE_RSA":
+            payload = ServerKeyExchangeDHERSA()
+            size = self.random.choice([128, 256, 384])
+            payload.params.dh_p = self._random_bytes(size)
+            payload.params.dh_g = b"\x02"
+            payload.params.dh_Ys = self._random_bytes(size)
+            payload.signed_params = self._random_bytes(256)
+            messages.append(ServerKeyExchange() + payload)
+        elif key_exchange in ("ECDHE_RSA", "ECDHE_ECDSA"):
+            payload = ServerKeyExchangeECDSA()
+            curve = ECParametersNamedCurveField("curve_params")
+            curve.curve_type = 3
+            curve.namedcurve = self.random.choice([0x0017, 0x0018])
+            payload.params.curve_params = curve
+            payload.params.public = b"\x04" + self._random_bytes(64)
+            payload.signed_params = self._random_bytes(self.random.choice([72, 256]))
+            messages.append(ServerKeyExchange() + payload)
+
+        messages.append(ServerHelloDone())
+        return messages
+
+    def create_handshake(self):
+        """
+        Create the messages of a handshake.
+
+        :return: List of the messages of the client and list of the messages of the server
+        :rtype: Tuple
+        """
+        client_hello = self.create_client_hello()
+        return ([client_hello], self.create_server_messages(client_hello))
+
+    def encode_tls(self, messages, max_record_size=16384):
+        """
+        Encode handshake messages as SSLv3/TLS records. The messages are
+        packed into as few records as possible.
+
+        :param List messages: The handshake messages
+        :param Integer max_record_size: Maximum size of the payload of a record
+        :rtype: bytes
+        """
+        data = b"".join([(Handshake() + message).encode() for message in messages])
+        (major, minor) = helper.get_tls_version(self.protocol_version)
+        records = []
+        for offset in range(0, len(data), max_record_size):
+            record = SSLv3Record()
+            record.content_type = 22
+            record.version.major = major
+            record.version.minor = minor
+            record.payload = data[offset:offset + max_record_size]
+            records.append(record.encode())
+        return b"".join(records)
+
+    def encode_dtls(self, messages, fragment_size=None, reorder=False, message_seq=0, sequence_number=0):
+        """
+        Encode handshake messages as DTLS records, one record per datagram.
+
+        :param List messages: The handshake messages
+        :param Integer fragment_size: Split the messages into fragments of this size or None to not fragment them
+        :param Boolean reorder: Shuffle the datagrams
+        :param Integer message_seq: Message sequence number of the first message
+        :param Integer sequence_number: Record sequence number of the first record
+        :return: List of datagrams
+        :rtype: List
+        """
+        (major, minor) = helper.get_tls_version(self.protocol_version)
+        datagrams = []
+        for message in messages:
+            data = (DTLSv10Handshake() + message).encode()
+            (handshake_type,) = struct.unpack_from("!B", data, 0)
+            body = data[12:]
+            size = fragment_size or max(len(body), 1)
+            for offset in range(0, max(len(body), 1), size):
+                fragment = body[offset:offset + size]
+                record = DTLSv10Record()
+                record.content_type = 22
+                record.version.major = major
+                record.version.minor = minor
+                record.sequence_number = sequence_number
+                # The fragmentation is not supported by DTLSv10Handshake
+                record.payload = struct.pack(
+                    "!BBHHBHBH",
+                    handshake_type, len(body) >> 16, len(body) & 0xffff,
+                    message_seq,
+                    offset >> 16, offset & 0xffff,
+                    len(fragment) >> 16, len(fragment) & 0xffff
+                ) + fragment
+                datagrams.append(record.encode())
+                sequence_number += 1
+            message_seq += 1
+
+        if reorder:
+            self.random.shuffle(datagrams)
+        return datagrams
+
+    def iter_tls(self, count, max_record_size=16384):
+        """
+        Generate TLS handshakes.
+
+        :param Integer count: Number of handshakes
+        :param Integer max_record_size: Maximum size of the payload of a record
+        :return: Iterator of the encoded data of the client and the server
+        """
+        for i in range(count):
+            (client_messages, server_messages) = self.create_handshake()
+            yield (
+                self.encode_tls(client_messages, max_record_size=max_record_size),
+                self.encode_tls(server_messages, max_record_size=max_record_size)
+            )
+
+    def iter_dtls(self, count, fragment_size=None, reorder=False):
+        """
+        Generate DTLS handshakes.
+
+        :param Integer count: Number of handshakes
+        :param Integer fragment_size: Split the messages into fragments of this size or None to not fragment them
+        :param Boolean reorder: Shuffle the datagrams of every flight
+        :return: Iterator of the datagrams of the client and the server
+        """
+        for i in range(count):
+            (client_messages, server_messages) = self.create_handshake()
+            yield (
+                self.encode_dtls(client_messages, fragment_size=fragment_size, reorder=reorder),
+                self.encode_dtls(server_messages, fragment_size=fragment_size, reorder=reorder)
+            )
+
+    def write_raw(self, client_file, server_file, count, max_record_size=16384):
+        """
+        Write the data of TLS handshakes as two raw streams, one per direction.
+
+        :param client_file: File object to write the data of the clients to
+        :param server_file: File object to write the data of the servers to
+        :param Integer count: Number of handshakes
+        :param Integer max_record_size: Maximum size of the payload of a record
+        """
+        if self.dtls:
+            raise ValueError("DTLS datagrams can not be written as stream")
+
+        for (client_data, server_data) in self.iter_tls(count, max_record_size=max_record_size):
+            client_file.write(client_data)
+            server_file.write(server_data)
+
+    def write_pcap(self, filename, count, segment_size=1460, fragment_size=None, reorder=False,
+                   port=443, start_time=1000000000.0):
+        """
+        Write handshakes to a pcap file, every handshake uses its own flow.
+        TLS handshakes are sent in TCP segments, DTLS handshakes in UDP
+        datagrams.
+
+        :param String filename: The name of the file
+        :param Integer count: Number of handshakes
+        :param Integer segment_size: Maximum payload size of the TCP segments
+        :param Integer fragment_size: Split the DTLS messages into fragments of this size
+        :param Boolean reorder: Shuffle the TCP segments or the datagrams of every flight
+        :param Integer port: Port of the server
+        :param float start_time: Timestamp of the first packet
+        """
+        timestamp = [start_time]
+
+        def next_timestamp():
+            timestamp[0] += 0.0001
+            return timestamp[0]
+
+        with PcapWriter(filename) as writer:
+            for i in range(count):
+                client = ("10.%d.%d.%d" % ((i >> 16) & 0xff, (i >> 8) & 0xff, i & 0xff), 1024 + i % 60000)
+                server = ("192.0.2.1", port)
+                if self.dtls:
+                    (client_messages, server_messages) = self.create_handshake()
+                    flights = (
+                        (client, server, client_messages),
+                        (server, client, server_messages),
+                    )
+                    for (src, dst, messages) in flights:
+                        for datagram in self.encode_dtls(messages, fragment_size=fragment_size, reorder=reorder):
+                            writer.write_udp(next_timestamp(), src[0], src[1], dst[0], dst[1], datagram)
+                    continue
+
+                (client_messages, server_messages) = self.create_handshake()
+                seq = {client: self.random.getrandbits(32), server: self.random.getrandbits(32)}
+                writer.write_tcp(next_timestamp(), client[0], client[1], server[0], server[1], seq[client], TCP_SYN)
+                writer.write_tcp(
+                    next_timestamp(), server[0], server[1], client[0], client[1], seq[server], TCP_SYN | TCP_ACK
+                )
+                flights = (
+                    (client, server, self.encode_tls(client_messages)),
+                    (server, client, self.encode_tls(server_messages)),
+                )
+                for (src, dst, data) in flights:
+                    segments = []
+                    for offset in range(0, len(data), segment_size):
+                        segments.append((seq[src] + 1 + offset, data[offset:offset + segment_size]))
+                    if reorder:
+                        self.random.shuffle(segments)
+                    for (segment_seq, payload) in segments:
+                        writer.write_tcp(
+                            next_timestamp(), src[0], src[1], dst[0], dst[1], segment_seq, TCP_ACK, payload
+                        )
+                    seq[src] += len(data)
+                for (src, dst) in ((client, server), (server, client)):
+                    writer.write_tcp(
+                        next_timestamp(), src[0], src[1], dst[0], dst[1], seq[src] + 1, TCP_FIN | TCP_ACK
+                    )
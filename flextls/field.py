@@ -3,6 +3,7 @@ import struct
 import six
 
 from flextls.exception import NotEnoughData
+from flextls.protocol import LAZY, DecodeProfile, _copy_attributes
 
 
 class Field(object):
@@ -23,6 +24,9 @@ class Field(object):
             self.fmt = "!"+fmt
         self.size = struct.calcsize(self.fmt)
 
+    def __deepcopy__(self, memo):
+        return _copy_attributes(self, memo)
+
     def assemble(self):
         """
         Assemble the field by using the given value.
@@ -32,11 +36,12 @@ class Field(object):
         """
         return struct.pack(self.fmt, self.value)
 
-    def dissect(self, data):
+    def dissect(self, data, payload_auto_decode=True):
         """
         Dissect the field.
 
         :param bytes data: The data to extract the field value from
+        :param payload_auto_decode: True to decode sub items or LAZY to decode them on first access
         :return: The rest of the data not used to dissect the field value
         :rtype: bytes
         """
@@ -46,8 +51,15 @@ class Field(object):
             )
 
         self.value = struct.unpack(self.fmt, data[:self.size])[0]
+        self._dirty = False
         return data[self.size:]
 
+    def clear_dirty(self):
+        """
+        Mark the field as unchanged.
+        """
+        self._dirty = False
+
     def get_value(self):
         """
         Return the field value.
@@ -64,6 +76,15 @@ class Field(object):
         :param Mixed value: The value
         """
         self._value = value
+        self._dirty = True
+
+    def is_dirty(self):
+        """
+        Check if the value has been changed since the field has been dissected or assembled.
+
+        :rtype: Boolean
+        """
+        return self._dirty
 
     value = property(get_value, set_value)
 
@@ -97,7 +118,7 @@ class UInt24Field(Field):
         value = (int(self.value / (2**16)), int(self.value % (2**16)))
         return struct.pack(self.fmt, *value)
 
-    def dissect(self, data):
+    def dissect(self, data, payload_auto_decode=True):
         if len(data) < self.size:
             raise NotEnoughData(
                 "Not enough data to decode field '%s' value" % self.name
@@ -105,6 +126,7 @@ class UInt24Field(Field):
 
         tmp = struct.unpack(self.fmt, data[:self.size])
         self.value = (tmp[0] * (2 ** 16)) + tmp[1]
+        self._dirty = False
         return data[self.size:]
 
 
@@ -119,7 +141,7 @@ class UInt48Field(Field):
         value = (int(self.value / (2**32)), int(self.value % (2**32)))
         return struct.pack(self.fmt, *value)
 
-    def dissect(self, data):
+    def dissect(self, data, payload_auto_decode=True):
         if len(data) < self.size:
             raise NotEnoughData(
                 "Not enough data to decode field '%s' value" % self.name
@@ -127,6 +149,7 @@ class UInt48Field(Field):
 
         tmp = struct.unpack(self.fmt, data[:self.size])
         self.value = (tmp[0] * (2 ** 32)) + tmp[1]
+        self._dirty = False
         return data[self.size:]
 
 
@@ -180,6 +203,7 @@ class EnumField(Field):
         :raises ValueError: If value name given but it isn't available
         :raises TypeError: If value is not String or Integer
         """
+        self._dirty = True
         if force:
             self._value = value
             return
@@ -251,19 +275,55 @@ class VectorListBaseField(object):
         if item_class_args is None:
             item_class_args = []
         self.item_class_args = item_class_args
+        self._clean_items = ()
         self.items = []
         if fmt[0] in "@=<>!":
             self.fmt = fmt
         else:
             self.fmt = "!"+fmt
 
+    def __deepcopy__(self, memo):
+        # The raw items are not changed, the copy decodes them on its own
+        return _copy_attributes(self, memo, shared=("_raw_items",))
+
+    def __getstate__(self):
+        # Store the items as raw data, they are decoded on first access after unpickling
+        if self._raw_items is not None:
+            data = bytes(self._raw_items[0])
+        else:
+            data = b"".join([item.assemble() for item in self._items])
+        return {
+            "name": self.name,
+            "item_class": self.item_class,
+            "item_class_args": self.item_class_args,
+            "fmt": self.fmt,
+            "data": data,
+            "dirty": self.is_dirty()
+        }
+
+    def __setstate__(self, state):
+        self.name = state["name"]
+        self.item_class = state["item_class"]
+        self.item_class_args = state["item_class_args"]
+        self.fmt = state["fmt"]
+        self.dissect_items(state["data"], payload_auto_decode=LAZY)
+        self._dirty = state["dirty"]
+
     def assemble(self):
-        data = b""
-        for item in self.items:
-            data = data + item.assemble()
+        data = b"".join([item.assemble() for item in self.items])
         return struct.pack(self.fmt, len(data)) + data
 
-    def dissect(self, data):
+    def clear_dirty(self):
+        """
+        Mark the field and its items as unchanged.
+        """
+        self._dirty = False
+        if self._raw_items is None:
+            for item in self._items:
+                item.clear_dirty()
+            self._set_clean_items()
+
+    def dissect(self, data, payload_auto_decode=True):
         len_size = struct.calcsize(self.fmt)
 
         if len(data) < len_size:
@@ -278,14 +338,114 @@ class VectorListBaseField(object):
                 "Not enough data to decode field '%s' value" % self.name
             )
 
-        payload_data = data[:payload_size]
-        while len(payload_data) > 0:
-            item = self.item_class(*self.item_class_args)
-            payload_data = item.dissect(payload_data)
-            self.items.append(item)
+        self.dissect_items(data[:payload_size], payload_auto_decode=payload_auto_decode)
 
         return data[payload_size:]
 
+    def dissect_items(self, data, payload_auto_decode=True):
+        """
+        Dissect the items of the vector.
+
+        :param bytes data: The payload of the vector without the length identifier
+        :param payload_auto_decode: True to decode the items, LAZY to decode them on first access or a DecodeProfile
+        """
+        item_mode = payload_auto_decode
+        if isinstance(payload_auto_decode, DecodeProfile):
+            item_mode = payload_auto_decode.item_mode
+
+        self._dirty = False
+        if item_mode is LAZY:
+            self._items = None
+            self._raw_items = (memoryview(data), payload_auto_decode)
+            return
+
+        self._items = self._decode_items(data, payload_auto_decode)
+        self._raw_items = None
+        self._set_clean_items()
+
+    def _decode_items(self, data, payload_auto_decode):
+        items = []
+        while len(data) > 0:
+            item = self.item_class(*self.item_class_args)
+            data = item.dissect(data, payload_auto_decode=payload_auto_decode)
+            items.append(item)
+        return items
+
+    def _set_clean_items(self):
+        # Remember the items and their order to detect changes of the list
+        self._clean_items = tuple(self._items)
+
+    def _is_list_changed(self):
+        items = self._items
+        clean_items = self._clean_items
+        if len(items) != len(clean_items):
+            return True
+        for (item, clean_item) in zip(items, clean_items):
+            if item is not clean_item:
+                return True
+        return False
+
+    def get_item_count(self, item_size=None):
+        """
+        Get the number of items. Items dissected in lazy mode are only
+        decoded if the size of the items is not given.
+
+        :param Integer item_size: Size of every item in bytes if all items have the same size
+        :rtype: Integer
+        """
+        if self._raw_items is not None and item_size is not None:
+            return len(self._raw_items[0]) // item_size
+        return len(self.items)
+
+    def get_items(self):
+        """
+        Get the items. Decode them if they have been dissected in lazy mode.
+
+        :return: List of items
+        :rtype: List
+        """
+        if self._raw_items is not None:
+            (data, payload_auto_decode) = self._raw_items
+            self._items = self._decode_items(data, payload_auto_decode)
+            self._raw_items = None
+            self._set_clean_items()
+        return self._items
+
+    def is_dirty(self):
+        """
+        Check if the list or one of its items has been changed since the field
+        has been dissected or assembled. Added, removed, replaced and reordered
+        items are detected.
+
+        :rtype: Boolean
+        """
+        if self._dirty:
+            return True
+
+        if self._raw_items is not None:
+            return False
+
+        if self._is_list_changed():
+            return True
+
+        for item in self._items:
+            if item.is_dirty():
+                return True
+
+        return False
+
+    def set_items(self, items):
+        """
+        Set the items.
+
+        :param List items: List of items
+        """
+        self._items = items
+        self._raw_items = None
+        self._dirty = True
+
+    items = property(get_items, set_items)
+
     @property
     def size(self):
         size = struct.calcsize(self.fmt)
@@ -340,34 +500,29 @@ class VectorListInt24Field(VectorListBaseField):
         VectorListBaseField.__init__(self, name, item_class, item_class_args, fmt="BH")
 
     def assemble(self):
-        data = b""
-        for item in self.items:
-            data = data + item.assemble()
+        data = b"".join([item.assemble() for item in self.items])
 
-        value = (int(self.value / (2**16)), int(self.value % (2**16)))
+        value = (int(len(data) / (2**16)), int(len(data) % (2**16)))
         return struct.pack(self.fmt, *value) + data
 
-    def dissect(self, data):
-        if len(data) < self.size:
+    def dissect(self, data, payload_auto_decode=True):
+        len_size = struct.calcsize(self.fmt)
+
+        if len(data) < len_size:
             raise NotEnoughData(
                 "Not enough data to decode field '%s' value" % self.name
             )
 
-        tmp = struct.unpack(self.fmt, data[:self.size])
+        tmp = struct.unpack(self.fmt, data[:len_size])
         payload_length = (tmp[0] * (2 ** 16)) + tmp[1]
-        data = data[self.size:]
-
+        data = data[len_size:]
 
         if len(data) < payload_length:
             raise NotEnoughData(
                 "Not enough data to decode field '%s' value" % self.name
             )
 
-        payload_data = data[:payload_length]
-        while len(payload_data) > 0:
-            item = self.item_class()
-            payload_data = item.dissect(payload_data)
-            self.items.append(item)
+        self.dissect_items(data[:payload_length], payload_auto_decode=payload_auto_decode)
 
         return data[payload_length:]
 
@@ -385,6 +540,37 @@ class CertificateListField(VectorListInt24Field):
             CertificateField,
         )
 
+    def iter_values(self):
+        """
+        Iterate over the DER encoded certificates. If the field has been
+        dissected in lazy mode the certificates are read from the raw data
+        without decoding the items.
+
+        :return: Iterator of memoryview objects
+        """
+        if self._raw_items is None:
+            for item in self._items:
+                yield memoryview(item._value)
+            return
+
+        (data, payload_auto_decode) = self._raw_items
+        offset = 0
+        data_length = len(data)
+        while offset < data_length:
+            if offset + 3 > data_length:
+                raise NotEnoughData(
+                    "Not enough data to decode field '%s' value" % self.name
+                )
+            (length_high, length_low) = struct.unpack_from("!BH", data, offset)
+            offset += 3
+            length = (length_high << 16) + length_low
+            if offset + length > data_length:
+                raise NotEnoughData(
+                    "Not enough data to decode field '%s' value" % self.name
+                )
+            yield data[offset:offset + length]
+            offset += length
+
 
 class CipherSuitesField(VectorListUInt16Field):
     """
@@ -418,6 +604,10 @@ class ExtensionsField(VectorListUInt16Field):
     """
     List of extensions
 
+    An index of the extension types is build while dissecting the field. Use
+    :meth:`get_extension` to find an extension without iterating over all
+    items. In lazy mode only the requested extension is decoded.
+
     :param String name: The name of the field
     """
     def __init__(self, name):
@@ -427,16 +617,176 @@ class ExtensionsField(VectorListUInt16Field):
             name,
             Extension
         )
+        self._index = None
+        self._positions = None
+        self._decoded_extensions = {}
+        self._clean_generations = ()
 
     def assemble(self):
         if len(self.items) == 0:
             return b""
         return VectorListUInt16Field.assemble(self)
 
-    def dissect(self, data):
+    def clear_dirty(self):
+        VectorListUInt16Field.clear_dirty(self)
+        for extension in self._decoded_extensions.values():
+            extension.clear_dirty()
+            self._decoded_generations[extension.type] = extension._generation
+
+    def _set_clean_items(self):
+        VectorListUInt16Field._set_clean_items(self)
+        # The extensions are Protocol objects and might be encoded on their own
+        self._clean_generations = tuple([item._generation for item in self._items])
+
+    def dissect(self, data, payload_auto_decode=True):
         if len(data) == 0:
+            self.items = []
+            self._index = {}
+            self._positions = {}
+            self.clear_dirty()
             return data
-        return VectorListUInt16Field.dissect(self, data)
+        return VectorListUInt16Field.dissect(
+            self,
+            data,
+            payload_auto_decode=payload_auto_decode
+        )
+
+    def dissect_items(self, data, payload_auto_decode=True):
+        index = {}
+        positions = {}
+        offset = 0
+        position = 0
+        data_length = len(data)
+        while offset < data_length:
+            if offset + 4 > data_length:
+                raise NotEnoughData(
+                    "Not enough data to decode field '%s' value" % self.name
+                )
+            (extension_type, length) = struct.unpack_from("!HH", data, offset)
+            if offset + 4 + length > data_length:
+                raise NotEnoughData(
+                    "Not enough data to decode field '%s' value" % self.name
+                )
+            if extension_type not in index:
+                index[extension_type] = (offset, length + 4)
+                positions[extension_type] = position
+            offset += 4 + length
+            position += 1
+
+        self._index = index
+        self._positions = positions
+        self._decoded_extensions = {}
+        self._decoded_generations = {}
+        VectorListUInt16Field.dissect_items(
+            self,
+            data,
+            payload_auto_decode=payload_auto_decode
+        )
+
+    def _decode_items(self, data, payload_auto_decode):
+        items = VectorListUInt16Field._decode_items(self, data, payload_auto_decode)
+        # Use the extensions already decoded by get_extension()
+        if self._is_decoded_extension_dirty():
+            self._dirty = True
+        for extension_type, extension in self._decoded_extensions.items():
+            items[self._positions[extension_type]] = extension
+        self._decoded_extensions = {}
+        self._decoded_generations = {}
+        return items
+
+    def _is_decoded_extension_dirty(self):
+        for extension_type, extension in self._decoded_extensions.items():
+            if extension._generation != self._decoded_generations[extension_type] or extension.is_dirty():
+                return True
+        return False
+
+    def get_extension(self, extension_type):
+        """
+        Get the first extension of the given type. In lazy mode only this
+        extension is decoded.
+
+        :param Integer extension_type: The type of the extension
+        :return: The extension or None if not found
+        :rtype: flextls.protocol.handshake.extension.Extension
+        """
+        if self._raw_items is None:
+            items = self._items
+            if self._positions is not None and not self._dirty and not self._is_list_changed():
+                position = self._positions.get(extension_type)
+                if position is None:
+                    return None
+                if items[position].type == extension_type:
+                    return items[position]
+
+            for item in items:
+                if item.type == extension_type:
+                    return item
+            return None
+
+        extension = self._decoded_extensions.get(extension_type)
+        if extension is not None:
+            return extension
+
+        tmp = self._index.get(extension_type)
+        if tmp is None:
+            return None
+
+        (offset, length) = tmp
+        (data, payload_auto_decode) = self._raw_items
+        (extension, data) = self.item_class.decode(
+            data[offset:offset + length],
+            payload_auto_decode=payload_auto_decode
+        )
+        self._decoded_extensions[extension_type] = extension
+        self._decoded_generations[extension_type] = extension._generation
+        return extension
+
+    def get_types(self):
+        """
+        Get the types of the extensions. In lazy mode the index is used and
+        the extensions are not decoded.
+
+        :return: The extension types, every type only once
+        :rtype: List
+        """
+        if self._raw_items is not None:
+            return list(self._index.keys())
+
+        types = []
+        for item in self._items:
+            if item.type not in types:
+                types.append(item.type)
+        return types
+
+    def get_index(self):
+        """
+        Get the index build while dissecting the field.
+
+        :return: Type of the extension mapped to the offset and the length of the extension in the data of the vector or None if the field has not been dissected
+        :rtype: Dict
+        """
+        return self._index
+
+    def is_dirty(self):
+        if VectorListUInt16Field.is_dirty(self):
+            return True
+
+        if self._raw_items is None:
+            for (item, generation) in zip(self._items, self._clean_generations):
+                if item._generation != generation:
+                    return True
+            return False
+
+        return self._is_decoded_extension_dirty()
+
+    def set_items(self, items):
+        self._index = None
+        self._positions = None
+        self._decoded_extensions = {}
+        self._decoded_generations = {}
+        VectorListUInt16Field.set_items(self, items)
+
+    items = property(VectorListUInt16Field.get_items, set_items)
 
 
 class CompressionMethodsField(VectorListUInt8Field):
@@ -469,13 +819,60 @@ class VectorBaseField(object):
         else:
             self.fmt = "!"+fmt
 
+    def __deepcopy__(self, memo):
+        return _copy_attributes(self, memo)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Data dissected from a memoryview can not be pickled
+        state["_value"] = self.value
+        return state
+
+    def get_value(self):
+        """
+        Return the field value. Data dissected from a memoryview is converted to bytes on first access.
+
+        :return: The value of the field
+        :rtype: bytes
+        """
+        value = self._value
+        if value.__class__ is memoryview:
+            value = value.tobytes()
+            self._value = value
+        return value
+
+    def set_value(self, value):
+        """
+        Set the value of the field
+
+        :param bytes value: The value
+        """
+        self._value = value
+        self._dirty = True
+
+    def clear_dirty(self):
+        """
+        Mark the field as unchanged.
+        """
+        self._dirty = False
+
+    def is_dirty(self):
+        """
+        Check if the value has been changed since the field has been dissected or assembled.
+
+        :rtype: Boolean
+        """
+        return self._dirty
+
+    value = property(get_value, set_value)
+
     def assemble(self):
         data = self.value
         if data is None:
             data = b""
         return struct.pack(self.fmt, len(data)) + data
 
-    def dissect(self, data):
+    def dissect(self, data, payload_auto_decode=True):
         len_size = struct.calcsize(self.fmt)
 
         if len(data) < len_size:
@@ -485,9 +882,16 @@ class VectorBaseField(object):
 
         value_size = struct.unpack(self.fmt, data[:len_size])[0]
         data = data[len_size:]
-        self.value = data[:value_size]
+        self._value = self._intern_value(data[:value_size], payload_auto_decode)
+        self._dirty = False
         return data[value_size:]
 
+    @staticmethod
+    def _intern_value(value, payload_auto_decode):
+        if isinstance(payload_auto_decode, DecodeProfile) and payload_auto_decode.intern_pool is not None:
+            return payload_auto_decode.intern_pool.intern(value)
+        return value
+
     @property
     def size(self):
         size = struct.calcsize(self.fmt)
@@ -536,7 +940,7 @@ class VectorInt24Field(VectorBaseField):
         len_value = (int(data_length / (2**16)), int(data_length % (2**16)))
         return struct.pack(self.fmt, *len_value) + self.value
 
-    def dissect(self, data):
+    def dissect(self, data, payload_auto_decode=True):
         if len(data) < self.size:
             raise NotEnoughData(
                 "Not enough data to decode field '%s' value" % self.name
@@ -551,7 +955,8 @@ class VectorInt24Field(VectorBaseField):
                 "Not enough data to decode field '%s' value" % self.name
             )
 
-        self.value = data[:data_length]
+        self._value = self._intern_value(data[:data_length], payload_auto_decode)
+        self._dirty = False
         return data[data_length:]
 
 
@@ -574,6 +979,16 @@ class HostNameField(VectorUInt16Field):
 # Multipart
 
 
+def _restore_field(field_class, name, data, dirty):
+    """
+    Create a field from the values of :meth:`MultiPartField.__reduce__`.
+    """
+    field = field_class(name)
+    field.dissect(data, payload_auto_decode=LAZY)
+    object.__setattr__(field, "_dirty", dirty)
+    return field
+
+
 class MultiPartField(object):
     """
     A field consisting of more than one value.
@@ -590,11 +1005,21 @@ class MultiPartField(object):
         self.payload_identifier_field = None
         self.payload_length_field = None
 
+    def __deepcopy__(self, memo):
+        return _copy_attributes(self, memo)
+
     def __getattr__(self, name):
         return self.get_field_value(name)
 
+    def __reduce__(self):
+        # Subclasses must accept the name as only argument
+        # Check before assembling, assembling updates the sub fields
+        dirty = self.is_dirty()
+        return (_restore_field, (self.__class__, self.name, self.assemble(), dirty))
+
     def __setattr__(self, name, value):
         if name == "fields":
+            object.__setattr__(self, "_dirty", True)
             object.__setattr__(self, name, value)
             return
 
@@ -603,6 +1028,8 @@ class MultiPartField(object):
                 field.value = value
                 return
 
+        if name[0] != "_":
+            object.__setattr__(self, "_dirty", True)
         object.__setattr__(self, name, value)
 
     @classmethod
@@ -611,6 +1038,38 @@ class MultiPartField(object):
             cls.payload_list = {}
         cls.payload_list[pattern] = payload_class
 
+    def clear_dirty(self):
+        """
+        Mark the field, its sub fields and its payload as unchanged.
+        """
+        object.__setattr__(self, "_dirty", False)
+        for field in self.fields:
+            field.clear_dirty()
+
+        payload = self.payload
+        if payload is not None and not isinstance(payload, bytes):
+            payload.clear_dirty()
+
+    def is_dirty(self):
+        """
+        Check if the field, one of its sub fields or its payload has been
+        changed since it has been dissected or assembled.
+
+        :rtype: Boolean
+        """
+        if self._dirty:
+            return True
+
+        for field in self.fields:
+            if field.is_dirty():
+                return True
+
+        payload = self.payload
+        if payload is not None and not isinstance(payload, bytes):
+            return payload.is_dirty()
+
+        return False
+
     def assemble(self):
         data = b""
         payload = b""
@@ -639,9 +1098,12 @@ class MultiPartField(object):
         data = data + payload
         return data
 
-    def dissect(self, data):
+    def dissect(self, data, payload_auto_decode=True):
         for field in self.fields:
-            data = field.dissect(data)
+            data = field.dissect(
+                data,
+                payload_auto_decode=payload_auto_decode
+            )
 
         if self.payload_identifier_field is not None:
             if self.payload_length_field is None:
@@ -662,9 +1124,13 @@ class MultiPartField(object):
                 self.payload = payload_data
             else:
                 obj = payload_class("onknown")
-                payload_data = obj.dissect(payload_data)
+                payload_data = obj.dissect(
+                    payload_data,
+                    payload_auto_decode=payload_auto_decode
+                )
                 self.payload = obj
 
+        object.__setattr__(self, "_dirty", False)
         return data
 
     def get_field_value(self, name):
@@ -768,11 +1234,17 @@ class ServerECDHParamsField(MultiPartField):
 
 
 class ECParametersField(Field):
-    def dissect(self, data):
+    def assemble(self):
+        if self._value is None:
+            return b""
+        return self._value.assemble()
+
+    def dissect(self, data, payload_auto_decode=True):
         """
         Dissect the field.
 
         :param bytes data: The data to extract the field value from
+        :param payload_auto_decode: True to decode sub items or LAZY to decode them on first access
         :return: The rest of the data not used to dissect the field value
         :rtype: bytes
         """
@@ -786,13 +1258,27 @@ class ECParametersField(Field):
         curve_type = struct.unpack("B", data[:size])[0]
         if curve_type == 0x03:
             self._value = ECParametersNamedCurveField("none")
-            data = self._value.dissect(data)
+            data = self._value.dissect(
+                data,
+                payload_auto_decode=payload_auto_decode
+            )
         else:
             raise NotImplementedError(
                 "Decoding of KeyExchange message for curve 0x%.2X not implemented" % curve_type
             )
+        self._dirty = False
         return data
 
+    def clear_dirty(self):
+        self._dirty = False
+        if self._value is not None:
+            self._value.clear_dirty()
+
+    def is_dirty(self):
+        if self._dirty:
+            return True
+        return self._value is not None and self._value.is_dirty()
+
 
 class ECParametersNamedCurveField(MultiPartField):
     """
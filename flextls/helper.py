@@ -1,3 +1,5 @@
+import hashlib
+
 from flextls import registry
 
 
@@ -47,4 +49,16 @@ def get_version_id(protocol_version):
 
 
 def get_tls_version(protocol_version):
-    return get_version_id(protocol_version)
\ No newline at end of file
+    return get_version_id(protocol_version)
+
+
+def hash_certificates(certificates, algorithm="sha256"):
+    """
+    Hash DER encoded certificates without copying the data.
+
+    :param certificates: Iterable of bytes or memoryview objects e.g. :meth:`flextls.protocol.handshake.ServerCertificate.iter_certificates`
+    :param String algorithm: Name of the hash algorithm passed to :func:`hashlib.new`
+    :return: Iterator of hex digests
+    """
+    for certificate in certificates:
+        yield hashlib.new(algorithm, certificate).hexdigest()
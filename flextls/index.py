@@ -0,0 +1,482 @@
+"""
+Index the records of a capture file to read selected records without
+decoding the whole capture again.
+
+The index is a side-car file with three tables of fixed size rows:
+
+* the flows with their addresses
+* the segments: TCP segments and UDP datagrams with payload by flow, direction and stream offset
+* the records: flow ID, direction, capture offset, stream offset, content type and handshake type
+
+The segments and the records are sorted by flow ID, direction and stream
+offset. The stream offset is the position in the reassembled data of one
+direction of a flow. The capture offset is the offset of the payload
+containing the first byte of the record in the capture file. Records may span
+multiple segments.
+
+The :class:`IndexReader` maps the capture and the index into memory and
+reads the data of the selected records only.
+
+Example::
+
+    build_index("capture.pcap", "capture.pcap.idx", ports=[443])
+    with IndexReader("capture.pcap", "capture.pcap.idx") as reader:
+        for entry in reader.find_records(flow_id=42, handshake_type=2):
+            server_hello = reader.decode_record(entry)
+"""
+from array import array
+import bisect
+import mmap
+import socket
+import struct
+
+from flextls.capture import IPPROTO_TCP, IPPROTO_UDP, CaptureReader, FlowTracker
+from flextls.protocol.record import DTLSv10Record, SSLv3Record
+
+#: Handshake type of records without the start of a handshake message
+NO_HANDSHAKE_TYPE = 255
+
+_MAGIC = b"FLEXTLSIDX\x00\x01"
+_HEADER = struct.Struct("<12sIII")
+_FLOW = struct.Struct("<IBB16sH16sH")
+_SEGMENT = struct.Struct("<IB3xQQI")
+_RECORD = struct.Struct("<IBBBxQQ")
+
+
+class IndexEntry(object):
+    """
+    A record of the index.
+    """
+    __slots__ = ("flow_id", "direction", "capture_offset", "stream_offset", "content_type", "handshake_type")
+
+    def __init__(self, flow_id, direction, capture_offset, stream_offset, content_type, handshake_type):
+        self.flow_id = flow_id
+        self.direction = direction
+        self.capture_offset = capture_offset
+        self.stream_offset = stream_offset
+        self.content_type = content_type
+        self.handshake_type = handshake_type
+
+    def __repr__(self):
+        return "<IndexEntry flow=%d direction=%d stream_offset=%d content_type=%d handshake_type=%d>" % (
+            self.flow_id,
+            self.direction,
+            self.stream_offset,
+            self.content_type,
+            self.handshake_type
+        )
+
+
+class _DirectionState(object):
+    """
+    Find the records in the data of one direction of a flow.
+    """
+    __slots__ = ("position", "buffer", "handshake_remaining", "segment_offset", "tcp_offset", "encrypted")
+
+    def __init__(self):
+        #: Stream offset of the first byte in the buffer
+        self.position = 0
+        self.buffer = b""
+        #: Bytes of a handshake message continued in the next record
+        self.handshake_remaining = 0
+        #: Stream offset of the next UDP datagram
+        self.segment_offset = 0
+        #: Highest stream offset of a TCP segment, used to extend the 32 bit sequence numbers
+        self.tcp_offset = 0
+        #: True after the ChangeCipherSpec message
+        self.encrypted = False
+
+
+class RecordIndexer(FlowTracker):
+    """
+    Build the index of a capture file. The records are not decoded, only the
+    record and handshake headers are read. The records are indexed even after
+    the ChangeCipherSpec message.
+
+    :param kwargs: Passed to :class:`flextls.capture.FlowTracker`
+    """
+    def __init__(self, **kwargs):
+        FlowTracker.__init__(self, **kwargs)
+        self._flow_table = {}
+        self._states = {}
+        # Columns of the tables, offsets are stored as double (exact up to 2^53, available in Python 2 and 3)
+        self._segments = (array("L"), array("B"), array("d"), array("d"), array("L"))
+        self._records = (array("L"), array("B"), array("d"), array("B"), array("B"))
+
+    def _get_state(self, flow, direction):
+        if flow.flow_id not in self._flow_table:
+            self._flow_table[flow.flow_id] = (flow.protocol, flow.client, flow.server)
+        key = (flow.flow_id, direction)
+        state = self._states.get(key)
+        if state is None:
+            state = _DirectionState()
+            self._states[key] = state
+        return state
+
+    def _add_payload(self, flow, direction, seq, payload, offset):
+        state = self._get_state(flow, direction)
+        if seq is None:
+            stream_offset = state.segment_offset
+            state.segment_offset += len(payload)
+        else:
+            # The sequence numbers wrap after 4 GB, use the offset nearest to the highest offset
+            diff = (seq - flow.streams[direction].initial_seq - state.tcp_offset) & 0xffffffff
+            if diff >= 0x80000000:
+                diff -= 0x100000000
+            stream_offset = state.tcp_offset + diff
+            if stream_offset < 0:
+                # Retransmitted data before the initial sequence number
+                return
+            state.tcp_offset = max(state.tcp_offset, stream_offset)
+
+        for (column, value) in zip(self._segments, (flow.flow_id, direction, stream_offset, offset, len(payload))):
+            column.append(value)
+
+    def _add_record(self, flow, direction, stream_offset, content_type, handshake_type):
+        for (column, value) in zip(self._records, (flow.flow_id, direction, stream_offset, content_type, handshake_type)):
+            column.append(value)
+
+    def _close_flow(self, flow):
+        for direction in (0, 1):
+            self._states.pop((flow.flow_id, direction), None)
+        FlowTracker._close_flow(self, flow)
+
+    def _decode(self, flow, direction, data_list):
+        state = self._get_state(flow, direction)
+        for data in data_list:
+            if isinstance(data, memoryview):
+                data = data.tobytes()
+            if flow.protocol == IPPROTO_UDP:
+                self._index_datagram(flow, direction, state, data)
+            else:
+                self._index_stream(flow, direction, state, data)
+        return []
+
+    def _index_datagram(self, flow, direction, state, data):
+        offset = 0
+        while offset + 13 <= len(data):
+            (content_type, epoch, length) = struct.unpack_from("!BxxH6xH", data, offset)
+            handshake_type = NO_HANDSHAKE_TYPE
+            if content_type == 22 and epoch == 0 and length > 0:
+                handshake_type = struct.unpack_from("!B", data, offset + 13)[0]
+            self._add_record(flow, direction, state.position + offset, content_type, handshake_type)
+            offset += 13 + length
+        state.position += len(data)
+
+    def _index_stream(self, flow, direction, state, data):
+        data = state.buffer + data
+        offset = 0
+        while offset + 5 <= len(data):
+            (content_type, length) = struct.unpack_from("!B2xH", data, offset)
+            if offset + 5 + length > len(data):
+                break
+
+            handshake_types = [NO_HANDSHAKE_TYPE]
+            if content_type == 20:
+                state.encrypted = True
+            elif content_type == 22 and not state.encrypted:
+                handshake_types = self._get_handshake_types(state, data[offset + 5:offset + 5 + length])
+            for handshake_type in handshake_types:
+                self._add_record(flow, direction, state.position + offset, content_type, handshake_type)
+            offset += 5 + length
+
+        state.buffer = data[offset:]
+        state.position += offset
+
+    @staticmethod
+    def _get_handshake_types(state, payload):
+        handshake_types = []
+        offset = state.handshake_remaining
+        while offset + 4 <= len(payload):
+            (handshake_type, length_high, length_low) = struct.unpack_from("!BBH", payload, offset)
+            handshake_types.append(handshake_type)
+            offset += 4 + (length_high << 16) + length_low
+        if offset >= len(payload):
+            state.handshake_remaining = offset - len(payload)
+        else:
+            # Message header split across records
+            state.handshake_remaining = 0
+        if not handshake_types:
+            handshake_types.append(NO_HANDSHAKE_TYPE)
+        return handshake_types
+
+    @staticmethod
+    def _find_segment(segment_keys, max_length, flow_id, direction, stream_offset):
+        """
+        Find the segment containing the first byte of a record.
+
+        :param List segment_keys: Sorted flow ID, direction, stream offset and length of the segments
+        :param Integer max_length: Length of the longest segment
+        :return: The position of the segment or None if not found
+        """
+        # The last segment of the flow and direction starting at or before the offset
+        pos = bisect.bisect_right(segment_keys, (flow_id, direction, stream_offset, max_length)) - 1
+        # Retransmitted segments overlap, an earlier segment might contain the offset
+        while pos >= 0:
+            (tmp_flow_id, tmp_direction, segment_offset, segment_length) = segment_keys[pos]
+            if tmp_flow_id != flow_id or tmp_direction != direction or segment_offset + max_length <= stream_offset:
+                break
+            if stream_offset < segment_offset + segment_length:
+                return pos
+            pos -= 1
+        return None
+
+    def write(self, filename):
+        """
+        Write the index. Records without a segment containing their first byte
+        are not written.
+
+        :param String filename: The name of the index file
+        :return: Number of flows, segments and records
+        :rtype: Tuple
+        """
+        segments = self._segments
+        records = self._records
+        segment_order = sorted(range(len(segments[0])), key=lambda i: (segments[0][i], segments[1][i], segments[2][i]))
+        # Records of a direction are added in stream order, a stable sort by flow and direction is enough
+        record_order = sorted(range(len(records[0])), key=lambda i: records[0][i] * 2 + records[1][i])
+
+        segment_keys = [
+            (segments[0][i], segments[1][i], int(segments[2][i]), segments[4][i])
+            for i in segment_order
+        ]
+        max_length = max(segments[4]) if segment_keys else 0
+
+        record_rows = []
+        for i in record_order:
+            (flow_id, direction, stream_offset) = (records[0][i], records[1][i], int(records[2][i]))
+            pos = self._find_segment(segment_keys, max_length, flow_id, direction, stream_offset)
+            if pos is None:
+                continue
+            capture_offset = int(segments[3][segment_order[pos]]) + stream_offset - segment_keys[pos][2]
+            record_rows.append(_RECORD.pack(
+                flow_id,
+                direction,
+                records[3][i],
+                records[4][i],
+                capture_offset,
+                stream_offset
+            ))
+
+        with open(filename, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, len(self._flow_table), len(segment_order), len(record_rows)))
+            for flow_id in sorted(self._flow_table.keys()):
+                (protocol, client, server) = self._flow_table[flow_id]
+                f.write(_FLOW.pack(flow_id, protocol, len(client[0]), client[0], client[1], server[0], server[1]))
+
+            for i in segment_order:
+                f.write(_SEGMENT.pack(
+                    segments[0][i],
+                    segments[1][i],
+                    int(segments[2][i]),
+                    int(segments[3][i]),
+                    segments[4][i]
+                ))
+
+            for row in record_rows:
+                f.write(row)
+
+        return (len(self._flow_table), len(segment_order), len(record_rows))
+
+
+def build_index(capture_filename, index_filename, **kwargs):
+    """
+    Build the index of a capture file.
+
+    :param String capture_filename: The name of the capture file
+    :param String index_filename: The name of the index file
+    :param kwargs: Passed to :class:`RecordIndexer`
+    :return: Number of flows, segments and records
+    :rtype: Tuple
+    """
+    indexer = RecordIndexer(**kwargs)
+    with CaptureReader(capture_filename) as reader:
+        for result in indexer.process(reader):
+            pass
+    return indexer.write(index_filename)
+
+
+class IndexReader(object):
+    """
+    Read the records of a capture file using the index.
+
+    :param String capture_filename: The name of the capture file
+    :param String index_filename: The name of the index file
+    :raises ValueError: If the index file is invalid
+    """
+    def __init__(self, capture_filename, index_filename):
+        self._capture = CaptureReader(capture_filename)
+        self._file = open(index_filename, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.close()
+            raise ValueError("Invalid index file")
+
+        (magic, flow_count, self._segment_count, self._record_count) = _HEADER.unpack_from(self._mmap, 0)
+        self._segment_start = _HEADER.size + flow_count * _FLOW.size
+        self._record_start = self._segment_start + self._segment_count * _SEGMENT.size
+        if magic != _MAGIC or len(self._mmap) != self._record_start + self._record_count * _RECORD.size:
+            self.close()
+            raise ValueError("Invalid index file")
+
+        #: Flow ID to protocol, client address and port and server address and port
+        self.flows = {}
+        for i in range(flow_count):
+            (flow_id, protocol, address_length, client, client_port, server, server_port) = _FLOW.unpack_from(
+                self._mmap,
+                _HEADER.size + i * _FLOW.size
+            )
+            family = socket.AF_INET if address_length == 4 else socket.AF_INET6
+            self.flows[flow_id] = (
+                protocol,
+                (socket.inet_ntop(family, client[:address_length]), client_port),
+                (socket.inet_ntop(family, server[:address_length]), server_port)
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._record_count
+
+    def close(self):
+        if getattr(self, "_mmap", None) is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+        self._capture.close()
+
+    def _get_record(self, i):
+        (flow_id, direction, content_type, handshake_type, capture_offset, stream_offset) = _RECORD.unpack_from(
+            self._mmap,
+            self._record_start + i * _RECORD.size
+        )
+        return IndexEntry(flow_id, direction, capture_offset, stream_offset, content_type, handshake_type)
+
+    def _get_segment(self, i):
+        return _SEGMENT.unpack_from(self._mmap, self._segment_start + i * _SEGMENT.size)
+
+    @staticmethod
+    def _bisect(count, get_key, key):
+        low = 0
+        high = count
+        while low < high:
+            mid = (low + high) // 2
+            if get_key(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def find_records(self, flow_id=None, direction=None, content_type=None, handshake_type=None):
+        """
+        Find records. The rows of a flow are found by binary search.
+
+        :param Integer flow_id: Only records of the flow
+        :param Integer direction: Only records sent by the client or the server (see :mod:`flextls.capture`)
+        :param Integer content_type: Only records with the content type
+        :param Integer handshake_type: Only records containing the start of a handshake message of the type
+        :return: Iterator of :class:`IndexEntry` in the order of the flows and the streams
+        """
+        start = 0
+        end = self._record_count
+        if flow_id is not None:
+            get_key = lambda i: _RECORD.unpack_from(self._mmap, self._record_start + i * _RECORD.size)[:2]
+            start = self._bisect(self._record_count, get_key, (flow_id, direction or 0))
+            end = self._bisect(self._record_count, get_key, (flow_id, 2) if direction is None else (flow_id, direction + 1))
+
+        for i in range(start, end):
+            entry = self._get_record(i)
+            if direction is not None and entry.direction != direction:
+                continue
+            if content_type is not None and entry.content_type != content_type:
+                continue
+            if handshake_type is not None and entry.handshake_type != handshake_type:
+                continue
+            yield entry
+
+    def read_stream(self, flow_id, direction, stream_offset, length):
+        """
+        Read data of one direction of a flow from the capture.
+
+        :param Integer flow_id: The flow
+        :param Integer direction: The direction
+        :param Integer stream_offset: The stream offset of the first byte
+        :param Integer length: Number of bytes
+        :rtype: bytes
+        :raises ValueError: If the data is not available in the capture
+        """
+        get_key = lambda i: self._get_segment(i)[:3]
+        i = self._bisect(self._segment_count, get_key, (flow_id, direction, stream_offset + 1)) - 1
+        if i < 0:
+            raise ValueError("Data not found")
+
+        # Retransmitted segments overlap, find a segment containing the offset
+        while i > 0 and get_key(i - 1)[:2] == (flow_id, direction):
+            (tmp, tmp, segment_offset, tmp, segment_length) = self._get_segment(i)
+            if segment_offset + segment_length > stream_offset:
+                break
+            i -= 1
+
+        data = []
+        position = stream_offset
+        end = stream_offset + length
+        while position < end and i < self._segment_count:
+            (tmp_flow_id, tmp_direction, segment_offset, capture_offset, segment_length) = self._get_segment(i)
+            if (tmp_flow_id, tmp_direction) != (flow_id, direction) or segment_offset > position:
+                break
+            if position < segment_offset + segment_length:
+                start = position - segment_offset
+                stop = min(segment_length, end - segment_offset)
+                data.append(self._capture.read(capture_offset + start, stop - start).tobytes())
+                position = segment_offset + stop
+            i += 1
+
+        if position < end:
+            raise ValueError("Data not found")
+        return b"".join(data)
+
+    def read_record(self, entry):
+        """
+        Read the raw data of a record.
+
+        :param IndexEntry entry: The record
+        :return: The record including the header
+        :rtype: bytes
+        """
+        protocol = self.flows[entry.flow_id][0]
+        if protocol == IPPROTO_TCP:
+            header = self.read_stream(entry.flow_id, entry.direction, entry.stream_offset, 5)
+            (length,) = struct.unpack_from("!H", header, 3)
+            return self.read_stream(entry.flow_id, entry.direction, entry.stream_offset, 5 + length)
+
+        header = self.read_stream(entry.flow_id, entry.direction, entry.stream_offset, 13)
+        (length,) = struct.unpack_from("!H", header, 11)
+        return self.read_stream(entry.flow_id, entry.direction, entry.stream_offset, 13 + length)
+
+    def decode_record(self, entry, connection=None, payload_auto_decode=True):
+        """
+        Read and decode a record. Handshake messages split across records and
+        messages requiring the state of the connection (e.g.
+        ServerKeyExchange) can not be decoded without the other records of
+        the flow.
+
+        :param IndexEntry entry: The record
+        :param connection: Passed to the decode method of the record
+        :param payload_auto_decode: Passed to the decode method of the record
+        :return: The decoded record
+        :rtype: flextls.protocol.record.Record
+        """
+        record_class = SSLv3Record
+        if self.flows[entry.flow_id][0] == IPPROTO_UDP:
+            record_class = DTLSv10Record
+        (record, data) = record_class.decode(
+            self.read_record(entry),
+            connection=connection,
+            payload_auto_decode=payload_auto_decode
+        )
+        return record
@@ -0,0 +1,292 @@
+"""
+Opt-in instrumentation to find the protocol classes and connections using
+the most CPU time.
+
+:func:`enable` wraps :meth:`flextls.protocol.Protocol.decode`,
+:meth:`flextls.protocol.Protocol.decode_payload`,
+:meth:`flextls.protocol.Protocol.encode` of all protocol classes and the
+``decode()`` methods of the connections. :func:`disable` restores the
+original methods, there is no overhead if the instrumentation is disabled.
+Classes defined after :func:`enable` has been called are only measured if
+they inherit the methods.
+
+For every class and method the number of calls, the number of bytes, the
+wall time and the number of :class:`flextls.exception.NotEnoughData`
+exceptions (incomplete data to be retried with more data) are counted. For
+connections the calls leaving incomplete data in the buffer are counted as
+incomplete, the connections check the length before decoding a record. The
+time includes the time of nested calls e.g. the time of decoding a
+Handshake message includes the time of decoding its payload. The counters
+are not thread-safe.
+
+Example::
+
+    instrumentation.enable()
+    conn.decode(data)
+    metrics = instrumentation.snapshot()
+    instrumentation.reset()
+"""
+import time
+import weakref
+
+from flextls.connection import BaseConnection
+from flextls.exception import NotEnoughData
+from flextls.protocol import Protocol
+
+_timer = getattr(time, "perf_counter", time.time)
+
+#: Methods of the protocol classes to measure
+PROTOCOL_METHODS = ("decode", "decode_payload", "encode")
+
+_originals = []
+_class_counters = {}
+_connection_class_counters = {}
+_connection_counters = weakref.WeakKeyDictionary()
+
+
+class Counter(object):
+    """
+    Counters of one method.
+    """
+    __slots__ = ("calls", "bytes", "time", "incomplete", "records")
+
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+        self.time = 0.0
+        self.incomplete = 0
+        self.records = 0
+
+    def as_dict(self):
+        """
+        :return: Calls, bytes, time in seconds, incomplete data and decoded records (connections only)
+        :rtype: Dict
+        """
+        return {
+            "calls": self.calls,
+            "bytes": self.bytes,
+            "time": self.time,
+            "incomplete": self.incomplete,
+            "records": self.records
+        }
+
+
+def _get_counter(counters, key, method):
+    tmp = counters.get(key)
+    if tmp is None:
+        tmp = {}
+        counters[key] = tmp
+    counter = tmp.get(method)
+    if counter is None:
+        counter = Counter()
+        tmp[method] = counter
+    return counter
+
+
+def _get_connection_counter(connection):
+    counter = _connection_counters.get(connection)
+    if counter is None:
+        counter = Counter()
+        _connection_counters[connection] = counter
+    return counter
+
+
+def _length(data):
+    if data is None or data is False:
+        return 0
+    try:
+        return len(data)
+    except TypeError:
+        return 0
+
+
+def _has_buffered_data(connection):
+    # Only the TLS connections keep incomplete data
+    return len(getattr(connection, "_raw_stream_data", b"")) > 0 or \
+        len(getattr(connection, "_cur_record_data", b"")) > 0
+
+
+def _wrap_decode(func):
+    def decode(cls, data, connection=None, *args, **kwargs):
+        counter = _get_counter(_class_counters, cls.__name__, "decode")
+        counter.calls += 1
+        start_time = _timer()
+        try:
+            (obj, tmp_data) = func(cls, data, connection, *args, **kwargs)
+        except NotEnoughData:
+            counter.incomplete += 1
+            if connection is not None and isinstance(connection, BaseConnection):
+                _get_connection_counter(connection).incomplete += 1
+            raise
+        finally:
+            counter.time += _timer() - start_time
+        counter.bytes += len(data) - len(tmp_data)
+        return (obj, tmp_data)
+
+    return classmethod(decode)
+
+
+def _wrap_decode_payload(func):
+    def decode_payload(self, data=None, *args, **kwargs):
+        counter = _get_counter(_class_counters, self.__class__.__name__, "decode_payload")
+        counter.calls += 1
+        size = _length(data if data is not None else self._payload)
+        start_time = _timer()
+        try:
+            tmp_data = func(self, data, *args, **kwargs)
+        except NotEnoughData:
+            counter.incomplete += 1
+            raise
+        finally:
+            counter.time += _timer() - start_time
+        counter.bytes += size - _length(tmp_data)
+        return tmp_data
+
+    return decode_payload
+
+
+def _wrap_encode(func):
+    def encode(self, *args, **kwargs):
+        counter = _get_counter(_class_counters, self.__class__.__name__, "encode")
+        counter.calls += 1
+        start_time = _timer()
+        try:
+            data = func(self, *args, **kwargs)
+        finally:
+            counter.time += _timer() - start_time
+        counter.bytes += _length(data)
+        return data
+
+    return encode
+
+
+def _wrap_connection_decode(func):
+    def decode(self, data, *args, **kwargs):
+        counters = (
+            _get_counter(_connection_class_counters, self.__class__.__name__, "decode"),
+            _get_connection_counter(self)
+        )
+        record_count = len(self._decoded_records)
+        start_time = _timer()
+        try:
+            return func(self, data, *args, **kwargs)
+        finally:
+            duration = _timer() - start_time
+            incomplete = _has_buffered_data(self)
+            for counter in counters:
+                counter.calls += 1
+                counter.bytes += len(data)
+                counter.time += duration
+                if incomplete:
+                    counter.incomplete += 1
+            if self.record_sink is None:
+                # Only records stored in the connection are counted
+                counters[0].records += len(self._decoded_records) - record_count
+                counters[1].records += len(self._decoded_records) - record_count
+
+    return decode
+
+
+def _iter_subclasses(cls):
+    yield cls
+    for subclass in cls.__subclasses__():
+        for tmp in _iter_subclasses(subclass):
+            yield tmp
+
+
+def _wrap(cls, name, wrapper):
+    original = cls.__dict__[name]
+    func = original
+    if isinstance(original, classmethod):
+        func = original.__func__
+    _originals.append((cls, name, original))
+    setattr(cls, name, wrapper(func))
+
+
+def enable():
+    """
+    Enable the instrumentation. Nothing happens if it is already enabled.
+    """
+    if _originals:
+        return
+
+    wrappers = {
+        "decode": _wrap_decode,
+        "decode_payload": _wrap_decode_payload,
+        "encode": _wrap_encode,
+    }
+    for cls in set(_iter_subclasses(Protocol)):
+        for name in PROTOCOL_METHODS:
+            if name in cls.__dict__:
+                _wrap(cls, name, wrappers[name])
+
+    for cls in set(_iter_subclasses(BaseConnection)):
+        if "decode" in cls.__dict__:
+            _wrap(cls, "decode", _wrap_connection_decode)
+
+
+def disable():
+    """
+    Disable the instrumentation and restore the original methods. The
+    counters are kept.
+    """
+    while _originals:
+        (cls, name, original) = _originals.pop()
+        setattr(cls, name, original)
+
+
+def is_enabled():
+    """
+    :rtype: Boolean
+    """
+    return len(_originals) > 0
+
+
+def get_connection_stats(connection):
+    """
+    Get the counters of a connection.
+
+    :param flextls.connection.BaseConnection connection: The connection
+    :return: The counters, see :meth:`Counter.as_dict`
+    :rtype: Dict
+    """
+    counter = _connection_counters.get(connection)
+    if counter is None:
+        counter = Counter()
+    return counter.as_dict()
+
+
+def snapshot():
+    """
+    Get the counters of the protocol classes and of the connections
+    aggregated by class.
+
+    Example::
+
+        {
+            "classes": {"ClientHello": {"decode": {"calls": 1, "bytes": 70, ...}}},
+            "connections": {"SSLv30Connection": {"decode": {"calls": 3, "bytes": 75, ...}}}
+        }
+
+    :return: Names of the classes mapped to the methods and their counters
+    :rtype: Dict
+    """
+    def export(counters):
+        return dict([
+            (name, dict([(method, counter.as_dict()) for (method, counter) in methods.items()]))
+            for (name, methods) in counters.items()
+        ])
+
+    return {
+        "classes": export(_class_counters),
+        "connections": export(_connection_class_counters),
+    }
+
+
+def reset():
+    """
+    Reset all counters.
+    """
+    _class_counters.clear()
+    _connection_class_counters.clear()
+    _connection_counters.clear()
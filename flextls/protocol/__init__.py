@@ -1,18 +1,184 @@
 """
 The SSL/TLS Protocol
 """
+import copy
+
+import six
 
 from flextls.exception import NotEnoughData
 
+#: Use as value for payload_auto_decode to decode the payload on first access
+LAZY = "lazy"
+#: Decode mode to drop the payload
+SKIP = "skip"
+
+
+class DecodeProfile(object):
+    """
+    Select the payloads to decode. Pass the profile as payload_auto_decode to
+    :meth:`Protocol.decode` or to a connection.
+
+    The rules use the payload types registered with
+    :meth:`Protocol.add_payload_type`. A mode is one of True (decode), False
+    (keep the raw data), LAZY (decode on first access) or SKIP (drop the
+    payload).
+
+    Example: Only decode the SNI and ALPN extensions of ClientHello messages::
+
+        profile = DecodeProfile(default=False)
+        profile.add_rule(SSLv3Record, 22, True)
+        profile.add_rule(Handshake, 1, True)
+        profile.add_rule(Handshake, 11, SKIP)
+        profile.add_rule(Extension, 0x0000, True)
+        profile.add_rule(Extension, 0x0010, True)
+
+    :param default: Mode used if no rule matches
+    :param item_mode: True to decode the items of vector fields or LAZY to decode them on first access
+    :param flextls.cache.InternPool intern_pool: Share the values of vector fields with the same content
+    """
+    def __init__(self, default=True, item_mode=True, intern_pool=None):
+        self.default = default
+        self.item_mode = item_mode
+        self.intern_pool = intern_pool
+        self._rules = {}
+
+    def add_rule(self, protocol_class, payload_type, mode):
+        """
+        Set the mode for a payload type.
+
+        :param protocol_class: The class containing the payload e.g. flextls.protocol.handshake.Handshake
+        :param payload_type: Value of the payload identifier field e.g. the handshake type
+        :param mode: True, False, LAZY or SKIP
+        """
+        if protocol_class not in self._rules:
+            self._rules[protocol_class] = {}
+        self._rules[protocol_class][payload_type] = mode
+
+    def get_mode(self, protocol_class, payload_type):
+        """
+        Get the mode for a payload type.
+
+        :param protocol_class: The class containing the payload
+        :param payload_type: Value of the payload identifier field
+        :return: True, False, LAZY or SKIP
+        """
+        rules = self._rules.get(protocol_class)
+        if rules is None:
+            return self.default
+        return rules.get(payload_type, self.default)
+
+
+def _copy_attributes(obj, memo, shared=()):
+    """
+    Create a deep copy of an object for :func:`copy.deepcopy`. The raw data,
+    the decode profiles and the attributes listed in shared are not copied.
+
+    :param obj: The object to copy
+    :param Dict memo: The memo of :func:`copy.deepcopy`
+    :param shared: Names of the attributes to use without copying
+    :return: The new object
+    """
+    new_obj = obj.__class__.__new__(obj.__class__)
+    memo[id(obj)] = new_obj
+    attributes = {}
+    for (name, value) in obj.__dict__.items():
+        if name in shared or isinstance(value, _SHARED_TYPES):
+            attributes[name] = value
+        else:
+            attributes[name] = copy.deepcopy(value, memo)
+    # Do not use setattr(), it would mark the new object as changed
+    new_obj.__dict__.update(attributes)
+    return new_obj
+
+
+class _LazyPayload(object):
+    """
+    Raw payload data to decode on first access.
+    """
+    def __init__(self, payload_class, data, connection=None, payload_auto_decode=LAZY):
+        self.payload_class = payload_class
+        self.data = data
+        self.connection = connection
+        self.payload_auto_decode = payload_auto_decode
+
+    def __deepcopy__(self, memo):
+        return _copy_attributes(self, memo, shared=("connection", "payload_auto_decode"))
+
+    def decode(self):
+        (obj, data) = self.payload_class.decode(
+            self.data,
+            connection=self.connection,
+            payload_auto_decode=self.payload_auto_decode
+        )
+        return obj
+
+
+#: Values used by copies without copying them, memoryviews can not be copied
+_SHARED_TYPES = (bytes, memoryview, six.text_type, bool, float, type(None), type, DecodeProfile) + six.integer_types
+
+
+class _ConnectionContext(object):
+    """
+    Replacement for the connection of unpickled objects and of objects shared
+    by the decode cache. Provides the values of the connection state required
+    to decode the payload e.g. of ServerKeyExchange messages.
+    """
+    def __init__(self, cipher_suite):
+        self.cipher_suite = cipher_suite
+
+    @property
+    def state(self):
+        return self
+
+
+def _restore_protocol(protocol_class, data, decode_payload, cipher_suite):
+    """
+    Create an object from the values of :meth:`Protocol.__reduce__`.
+    """
+    # The modes are compared by identity, they are not pickled
+    payload_auto_decode = False
+    if decode_payload:
+        payload_auto_decode = LAZY
+
+    connection = None
+    if cipher_suite is not None:
+        connection = _ConnectionContext(cipher_suite)
+    (obj, data) = protocol_class.decode(
+        data,
+        connection=connection,
+        payload_auto_decode=payload_auto_decode
+    )
+    return obj
+
 
 class Protocol(object):
     """
     Base Class to decode protocols.
+
+    The encoded data is cached. The cache is used until the object, one of
+    its fields or its payload is changed. Decoded objects use the original
+    data as cache. Every time the data is assembled again the generation of
+    the object is increased. The containing objects compare the generation
+    with the value at the time they have been encoded, the changes are
+    detected even if a payload has been encoded on its own.
+
+    Objects are pickled as class and encoded data. The connection is not
+    included, only the negotiated cipher suite is kept to decode the payload.
+    The data is decoded in lazy mode on unpickling.
+
+    Copies created with :func:`copy.deepcopy` share the connection and the
+    raw data with the original object.
     """
     payload_list = None
+    #: Increased every time the object is assembled
+    _generation = 0
+    #: Generation of the payload used for the cached data
+    _payload_generation = 0
 
     def __init__(self, connection=None):
         self.fields = []
+        self._encoded = None
+        self._dirty = True
         self._connection = connection
         self.payload = None
         self.payload_identifier_field = None
@@ -25,11 +191,30 @@ class Protocol(object):
         self.set_payload(payload)
         return self
 
+    def __reduce__(self):
+        cipher_suite = None
+        state = getattr(self._connection, "state", None)
+        if state is not None:
+            cipher_suite = state.cipher_suite
+
+        # Keep the raw payload
+        payload = self._payload
+        decode_payload = payload is None or isinstance(payload, (Protocol, _LazyPayload))
+
+        return (
+            _restore_protocol,
+            (self.__class__, bytes(self.encode()), decode_payload, cipher_suite)
+        )
+
+    def __deepcopy__(self, memo):
+        return _copy_attributes(self, memo, shared=("_connection",))
+
     def __getattr__(self, name):
         return self.get_field_value(name)
 
     def __setattr__(self, name, value):
         if name == "fields":
+            object.__setattr__(self, "_dirty", True)
             object.__setattr__(self, name, value)
             return
 
@@ -39,8 +224,22 @@ class Protocol(object):
                 #print("set")
                 return
 
+        if name[0] != "_":
+            object.__setattr__(self, "_dirty", True)
         object.__setattr__(self, name, value)
 
+    def _get_payload(self):
+        payload = self._payload
+        if payload.__class__ is _LazyPayload:
+            payload = payload.decode()
+            object.__setattr__(self, "_payload", payload)
+        return payload
+
+    def _set_payload(self, payload):
+        object.__setattr__(self, "_payload", payload)
+
+    payload = property(_get_payload, _set_payload)
+
     @classmethod
     def add_payload_type(cls, pattern, payload_class):
         if cls.payload_list is None:
@@ -48,10 +247,34 @@ class Protocol(object):
         cls.payload_list[pattern] = payload_class
 
     def assemble(self):
-        data = b""
-        payload = b""
-        if isinstance(self.payload, Protocol):
-            payload = self.payload.encode()
+        payload = self.assemble_payload()
+
+        if self.payload_length_field is not None and payload is not None:
+            self.set_field_value(
+                self.payload_length_field,
+                len(payload)
+            )
+
+        return self.assemble_fields() + payload
+
+    def assemble_fields(self):
+        """
+        Assemble all fields.
+
+        :return: The assembled fields
+        :rtype: bytes
+        """
+        return b"".join([field.assemble() for field in self.fields])
+
+    def assemble_payload(self):
+        """
+        Encode the payload and update the payload identifier field.
+
+        :return: The encoded payload
+        :rtype: bytes
+        """
+        payload = self.payload
+        if isinstance(payload, Protocol):
             if self.payload_identifier_field is not None:
                 for pay_pattern, pay_class in self.payload_list.items():
                     if isinstance(payload, pay_class):
@@ -60,26 +283,56 @@ class Protocol(object):
                             pay_pattern
                         )
                         break
-        elif self.payload is not None:
-            payload = self.payload
-
-        if self.payload_length_field is not None and payload is not None:
-            self.set_field_value(
-                self.payload_length_field,
-                len(payload)
-            )
-
+            return payload.encode()
+
+        if payload is None:
+            return b""
+
+        return payload
+
+    def clear_dirty(self):
+        """
+        Mark the object and its fields as unchanged and drop the cached
+        encoded data.
+        """
+        object.__setattr__(self, "_encoded", None)
+        self._set_clean()
+
+    def _set_connection(self, connection):
+        """
+        Replace the connection of the object and of its payloads.
+        """
+        object.__setattr__(self, "_connection", connection)
+        payload = self._payload
+        if isinstance(payload, Protocol):
+            payload._set_connection(connection)
+        elif payload.__class__ is _LazyPayload:
+            payload.connection = connection
+
+    def _set_clean(self):
+        """
+        Mark the object and its fields as unchanged and remember the
+        generation of the payload.
+        """
+        object.__setattr__(self, "_dirty", False)
         for field in self.fields:
-#            print(self)
-#            print(field)
-#            print(field.name)
-            data = data + field.assemble()
+            field.clear_dirty()
 
-        data = data + payload
-        return data
+        payload = self._payload
+        if isinstance(payload, Protocol):
+            object.__setattr__(self, "_payload_generation", payload._generation)
 
     @classmethod
     def decode(cls, data, connection=None, payload_auto_decode=True):
+        """
+        Decode the data.
+
+        :param bytes data: The data to decode
+        :param connection: The connection
+        :param payload_auto_decode: True to decode the payload, False to keep the raw data, LAZY to decode the payload on first access or a DecodeProfile
+        :return: The decoded object and the data not used to decode the object
+        :rtype: Tuple
+        """
         obj = cls(
             connection=connection
         )
@@ -120,15 +373,26 @@ class Protocol(object):
                 payload_data = data[:payload_length]
                 data = data[payload_length:]
 
+            payload_type = self.get_field_value(self.payload_identifier_field)
             payload_class = None
             if self.payload_list is not None:
-                payload_class = self.payload_list.get(
-                    self.get_field_value(self.payload_identifier_field),
-                    None
-                )
+                payload_class = self.payload_list.get(payload_type, None)
+
+            decode_mode = payload_auto_decode
+            if isinstance(payload_auto_decode, DecodeProfile):
+                decode_mode = payload_auto_decode.get_mode(self.__class__, payload_type)
 
-            if payload_class is None or payload_auto_decode is False:
+            if decode_mode is SKIP:
+                self.payload = None
+            elif payload_class is None or decode_mode is False:
                 self.payload = payload_data
+            elif decode_mode is LAZY:
+                self.payload = _LazyPayload(
+                    payload_class,
+                    memoryview(payload_data),
+                    connection=self._connection,
+                    payload_auto_decode=payload_auto_decode
+                )
             else:
                 (obj, payload_data) = payload_class.decode(
                     payload_data,
@@ -155,21 +419,53 @@ class Protocol(object):
     def dissect(self, data, connection=None, payload_auto_decode=True):
         if connection is not None:
             self._connection = connection
-        # print(">>>")
-        # print(self)
-        # print(data)
+        raw_data = data
         for field in self.fields:
-            data = field.dissect(data)
+            data = field.dissect(
+                data,
+                payload_auto_decode=payload_auto_decode
+            )
 
         data = self.decode_payload(
             data,
             payload_auto_decode=payload_auto_decode
         )
 
+        object.__setattr__(self, "_dirty", False)
+        payload = self._payload
+        if isinstance(payload, Protocol):
+            object.__setattr__(self, "_payload_generation", payload._generation)
+        else:
+            # Payloads decoded on first access start with generation 0
+            object.__setattr__(self, "_payload_generation", 0)
+        # Keep the original data used to decode the object
+        if not data:
+            object.__setattr__(self, "_encoded", raw_data)
+        else:
+            object.__setattr__(self, "_encoded", raw_data[:len(raw_data) - len(data)])
+
         return data
 
     def encode(self):
-        return self.assemble()
+        """
+        Encode the object. The cached data is returned if nothing has changed
+        since the last call or since the object has been decoded.
+
+        :return: The encoded data
+        :rtype: bytes
+        """
+        data = self._encoded
+        if data is not None and not self.is_dirty():
+            if data.__class__ is not bytes:
+                data = bytes(data)
+                object.__setattr__(self, "_encoded", data)
+            return data
+
+        data = self.assemble()
+        object.__setattr__(self, "_encoded", data)
+        object.__setattr__(self, "_generation", self._generation + 1)
+        self._set_clean()
+        return data
 
     def get_field(self, name):
         for field in self.fields:
@@ -192,6 +488,29 @@ class Protocol(object):
         # ToDo: Change exception type?
         raise Exception("Payload pattern not found")
 
+    def is_dirty(self):
+        """
+        Check if the object, one of its fields or the payload has been changed
+        since it has been decoded or encoded.
+
+        :rtype: Boolean
+        """
+        if self._dirty:
+            return True
+
+        for field in self.fields:
+            if field.is_dirty():
+                return True
+
+        payload = self._payload
+        if isinstance(payload, Protocol):
+            # The payload has been encoded on its own after a change
+            if payload._generation != self._payload_generation:
+                return True
+            return payload.is_dirty()
+
+        return False
+
     def is_fragment(self):
         if self.payload_fragment_length_field is None and self.payload_fragment_offset_field is None:
             return None
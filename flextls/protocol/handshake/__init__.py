@@ -3,6 +3,7 @@ The SSL/TLS Handshake Protocol
 """
 
 import flextls
+from flextls import helper
 from flextls.field import UInt24Field, UInt16Field, UInt8Field
 from flextls.field import UInt8EnumField
 from flextls.field import VectorUInt8Field, VectorUInt16Field
@@ -49,11 +50,12 @@ class DTLSv10Handshake(Protocol):
         self.payload_fragment_offset_field = "fragment_offset"
 
     def assemble(self):
-        Protocol.assemble(self)
+        payload = self.assemble_payload()
+        self.length = len(payload)
         # ToDo: Fragmentation is not supported
         self.fragment_offset = 0
-        self.fragment_length = self.length
-        return Protocol.assemble(self)
+        self.fragment_length = len(payload)
+        return self.assemble_fields() + payload
 
     def concat(self, *parts):
         found = True
@@ -111,6 +113,16 @@ class DTLSv10ClientHello(Protocol):
             ExtensionsField("extensions"),
         ]
 
+    def get_extension(self, extension_type):
+        """
+        Get the first extension of the given type.
+
+        :param Integer extension_type: The type of the extension
+        :return: The extension or None if not found
+        :rtype: flextls.protocol.handshake.extension.Extension
+        """
+        return self.get_field("extensions").get_extension(extension_type)
+
 DTLSv10Handshake.add_payload_type(1, DTLSv10ClientHello)
 
 
@@ -175,6 +187,16 @@ class ClientHello(Protocol):
             ExtensionsField("extensions"),
         ]
 
+    def get_extension(self, extension_type):
+        """
+        Get the first extension of the given type.
+
+        :param Integer extension_type: The type of the extension
+        :return: The extension or None if not found
+        :rtype: flextls.protocol.handshake.extension.Extension
+        """
+        return self.get_field("extensions").get_extension(extension_type)
+
 Handshake.add_payload_type(1, ClientHello)
 
 
@@ -194,6 +216,16 @@ class ServerHello(Protocol):
             ExtensionsField("extensions"),
         ]
 
+    def get_extension(self, extension_type):
+        """
+        Get the first extension of the given type.
+
+        :param Integer extension_type: The type of the extension
+        :return: The extension or None if not found
+        :rtype: flextls.protocol.handshake.extension.Extension
+        """
+        return self.get_field("extensions").get_extension(extension_type)
+
 DTLSv10Handshake.add_payload_type(2, ServerHello)
 Handshake.add_payload_type(2, ServerHello)
 
@@ -209,6 +241,25 @@ class ServerCertificate(Protocol):
             CertificateListField("certificate_list"),
         ]
 
+    def iter_certificates(self):
+        """
+        Iterate over the DER encoded certificates, the leaf certificate
+        first. Decode the message with payload_auto_decode=LAZY to read the
+        certificates without creating a field for each certificate.
+
+        :return: Iterator of memoryview objects
+        """
+        return self.get_field("certificate_list").iter_values()
+
+    def iter_certificate_digests(self, algorithm="sha256"):
+        """
+        Hash the certificates.
+
+        :param String algorithm: Name of the hash algorithm passed to :func:`hashlib.new`
+        :return: Iterator of hex digests
+        """
+        return helper.hash_certificates(self.iter_certificates(), algorithm=algorithm)
+
 DTLSv10Handshake.add_payload_type(11, ServerCertificate)
 Handshake.add_payload_type(11, ServerCertificate)
 
@@ -216,27 +267,62 @@ Handshake.add_payload_type(11, ServerCertificate)
 class ServerKeyExchange(Protocol):
     """
     Handle SSLv3 and TLS 1.0, 1.1 and 1.2 and DLTS 1.0 and 1.2 Server Key Exchange messages
+
+    The class used to decode the payload depends on the key exchange algorithm
+    of the negotiated cipher suite. Use :meth:`add_key_exchange_type` to add
+    support for additional key exchange algorithms.
     """
+    key_exchange_list = None
+    _cipher_suite_list = None
+
     def __init__(self, **kwargs):
         Protocol.__init__(self, **kwargs)
         self.payload = None
         self.fields = []
 
+    @classmethod
+    def add_key_exchange_type(cls, key_exchange, payload_class):
+        """
+        Register a class to decode the payload for a key exchange algorithm.
+
+        :param String key_exchange: Name of the key exchange algorithm as used in the registry
+        :param payload_class: Class used to decode the payload
+        """
+        if cls.key_exchange_list is None:
+            cls.key_exchange_list = {}
+        cls.key_exchange_list[key_exchange] = payload_class
+        # Rebuild the lookup table on next use
+        cls._cipher_suite_list = None
+
+    @classmethod
+    def get_key_exchange_class(cls, cipher_suite_id):
+        """
+        Get the class to decode the payload for the given cipher suite.
+
+        :param Integer cipher_suite_id: ID of the negotiated cipher suite
+        :return: The class or None if not available
+        """
+        if cls._cipher_suite_list is None:
+            cipher_suite_list = {}
+            if cls.key_exchange_list is not None:
+                for cipher_suite in flextls.registry.tls.cipher_suites:
+                    payload_class = cls.key_exchange_list.get(cipher_suite.key_exchange)
+                    if payload_class is not None:
+                        cipher_suite_list[cipher_suite.id] = payload_class
+            cls._cipher_suite_list = cipher_suite_list
+
+        return cls._cipher_suite_list.get(cipher_suite_id)
+
     def decode_payload(self, data=None, payload_auto_decode=True):
-        if self._connection is None:
-            self.payload = data
-            return b""
+        if data is None:
+            data = self.payload
+
+        if data is None:
+            return False
 
-        cipher_suite = flextls.registry.tls.cipher_suites.get(self._connection.state.cipher_suite)
         cls = None
-        if cipher_suite.key_exchange in ("DH_anon", "DH_anon_EXPORT"):
-            cls = ServerKeyExchangeDHAnon
-        elif cipher_suite.key_exchange in ("DHE_RSA", "DHE_RSA_EXPORT"):
-            cls = ServerKeyExchangeDHERSA
-        elif cipher_suite.key_exchange in ("DHE_DSS", "DHE_DSS_EXPORT"):
-            cls = ServerKeyExchangeDHEDSS
-        elif cipher_suite.key_exchange.startswith("ECD",):
-            cls = ServerKeyExchangeECDSA
+        if self._connection is not None and self._connection.state is not None:
+            cls = self.get_key_exchange_class(self._connection.state.cipher_suite)
 
         if cls is not None:
             try:
@@ -249,7 +335,7 @@ class ServerKeyExchange(Protocol):
 
         if cls is None:
             obj = data
-            data = b""
+            data = data[:0]
 
         self.payload = obj
         return data
@@ -288,6 +374,19 @@ class ServerKeyExchangeECDSA(Protocol):
             VectorUInt16Field("signed_params")
         ]
 
+ServerKeyExchange.add_key_exchange_type("DH_anon", ServerKeyExchangeDHAnon)
+ServerKeyExchange.add_key_exchange_type("DH_anon_EXPORT", ServerKeyExchangeDHAnon)
+ServerKeyExchange.add_key_exchange_type("DHE_RSA", ServerKeyExchangeDHERSA)
+ServerKeyExchange.add_key_exchange_type("DHE_RSA_EXPORT", ServerKeyExchangeDHERSA)
+ServerKeyExchange.add_key_exchange_type("DHE_DSS", ServerKeyExchangeDHEDSS)
+ServerKeyExchange.add_key_exchange_type("DHE_DSS_EXPORT", ServerKeyExchangeDHEDSS)
+ServerKeyExchange.add_key_exchange_type("ECDH_anon", ServerKeyExchangeECDSA)
+ServerKeyExchange.add_key_exchange_type("ECDH_ECDSA", ServerKeyExchangeECDSA)
+ServerKeyExchange.add_key_exchange_type("ECDH_RSA", ServerKeyExchangeECDSA)
+ServerKeyExchange.add_key_exchange_type("ECDHE_ECDSA", ServerKeyExchangeECDSA)
+ServerKeyExchange.add_key_exchange_type("ECDHE_PSK", ServerKeyExchangeECDSA)
+ServerKeyExchange.add_key_exchange_type("ECDHE_RSA", ServerKeyExchangeECDSA)
+
 DTLSv10Handshake.add_payload_type(12, ServerKeyExchange)
 Handshake.add_payload_type(12, ServerKeyExchange)
 
@@ -355,6 +454,10 @@ class SSLv2ClientHello(Protocol):
         data = Protocol.assemble(self) + data
         return data
 
+    def is_dirty(self):
+        # Changes to the list of cipher suites are not tracked
+        return True
+
     def dissect(self, data, payload_auto_decode=True):
         data = Protocol.dissect(
             self,
@@ -398,6 +501,10 @@ class SSLv2ServerHello(Protocol):
         self.cipher_suites = []
         self.connection_id = b""
 
+    def is_dirty(self):
+        # Changes to the list of cipher suites are not tracked
+        return True
+
     def dissect(self, data, payload_auto_decode=True):
         data = Protocol.dissect(
             self,
@@ -68,14 +68,17 @@ class ServerNameIndication(Protocol):
         )
         if len(data) > 0:
             data = obj.dissect(data)
+        else:
+            # Nothing to dissect, use the empty data as cache
+            obj.clear_dirty()
+            object.__setattr__(obj, "_encoded", data)
 
         return (obj, data)
 
-    def encode(self):
+    def assemble(self):
         if len(self.server_name_list) == 0:
             return b""
-        else:
-            return self.assemble()
+        return Protocol.assemble(self)
 
 
 Extension.add_payload_type(0x0000, ServerNameIndication)
@@ -143,6 +146,8 @@ class NextProtocolNegotiation(Protocol):
 
     * draft-agl-tls-nextprotoneg-04
     """
+    _clean_payload = ()
+
     def __init__(self, **kwargs):
         Protocol.__init__(self, **kwargs)
         self.payload = []
@@ -163,6 +168,33 @@ class NextProtocolNegotiation(Protocol):
 
         return data
 
+    def _set_clean(self):
+        Protocol._set_clean(self)
+        payload = self._payload
+        if isinstance(payload, list):
+            for protocol in payload:
+                if isinstance(protocol, VectorUInt8Field):
+                    protocol.clear_dirty()
+            object.__setattr__(self, "_clean_payload", tuple(payload))
+
+    def is_dirty(self):
+        if Protocol.is_dirty(self):
+            return True
+
+        # Compare the list of protocols with the list at the time the payload has been decoded or encoded
+        payload = self._payload
+        clean_payload = self._clean_payload
+        if not isinstance(payload, list) or len(payload) != len(clean_payload):
+            return True
+
+        for (protocol, clean_protocol) in zip(payload, clean_payload):
+            if protocol is not clean_protocol:
+                return True
+            if isinstance(protocol, VectorUInt8Field) and protocol.is_dirty():
+                return True
+
+        return False
+
     def decode_payload(self, data=None, payload_auto_decode=True):
         if data is None:
             data = self.payload
@@ -177,6 +209,8 @@ class NextProtocolNegotiation(Protocol):
             data = obj.dissect(data)
             self.payload.append(obj)
 
+        object.__setattr__(self, "_clean_payload", tuple(self.payload))
+
 
 Extension.add_payload_type(0x3374, NextProtocolNegotiation)
 
@@ -191,7 +225,7 @@ class SignatureAlgorithms(Protocol):
             VectorListUInt16Field(
                 "supported_signature_algorithms",
                 item_class=SignatureAndHashAlgorithmField,
-                item_class_args=[None, None]
+                item_class_args=[None]
             ),
         ]
 
@@ -215,13 +249,16 @@ class SessionTicketTLS(Protocol):
         )
         if len(data) > 0:
             data = obj.dissect(data)
+        else:
+            # Nothing to dissect, use the empty data as cache
+            obj.clear_dirty()
+            object.__setattr__(obj, "_encoded", data)
 
         return (obj, data)
 
-    def encode(self):
+    def assemble(self):
         if len(self.data) == 0:
             return b""
-        else:
-            return self.assemble()
+        return Protocol.assemble(self)
 
 Extension.add_payload_type(0x0023, SessionTicketTLS)
@@ -0,0 +1,304 @@
+"""
+Read values from raw handshake messages without decoding them into protocol
+objects.
+"""
+import hashlib
+import struct
+
+from flextls.exception import NotEnoughData
+
+
+def _is_grease(value):
+    return (value & 0x0f0f) == 0x0a0a and (value >> 8) == (value & 0xff)
+
+
+def _get_client_hello(data):
+    """
+    Get the ClientHello message from a SSLv3/TLS record stream or from a
+    handshake message. Messages fragmented over multiple records are joined.
+
+    :param data: The data
+    :return: The message and the minimum number of bytes missing. The message is None if bytes are missing.
+    :rtype: Tuple
+    """
+    if len(data) < 1:
+        return (None, 5)
+
+    (content_type,) = struct.unpack_from("!B", data, 0)
+    if content_type == 1:
+        # Handshake message without record layer
+        if len(data) < 4:
+            return (None, 4 - len(data))
+        (tmp_high, tmp_low) = struct.unpack_from("!BH", data, 1)
+        length = (tmp_high << 16) + tmp_low + 4
+        if len(data) < length:
+            return (None, length - len(data))
+        return (data[:length], 0)
+
+    if content_type != 22:
+        raise ValueError("Data does not start with a handshake record or a ClientHello")
+
+    fragments = []
+    fragments_length = 0
+    length = None
+    offset = 0
+    while True:
+        if len(data) < offset + 5:
+            missing = offset + 5 - len(data)
+            if length is not None:
+                missing += length - fragments_length
+            return (None, missing)
+
+        (content_type, record_length) = struct.unpack_from("!B2xH", data, offset)
+        if content_type != 22:
+            raise ValueError("Record does not contain a handshake message")
+
+        offset += 5
+        fragment = data[offset:offset + record_length]
+        offset += record_length
+        fragments.append(fragment)
+        fragments_length += len(fragment)
+
+        if length is None:
+            if fragments_length < 4:
+                # Unable to get the length if the header is fragmented
+                if len(fragment) < record_length:
+                    return (None, record_length - len(fragment))
+                continue
+            if len(fragments) > 1:
+                fragments = [b"".join([memoryview(tmp).tobytes() for tmp in fragments])]
+            (tmp_high, tmp_low) = struct.unpack_from("!BH", fragments[0], 1)
+            length = (tmp_high << 16) + tmp_low + 4
+
+        if fragments_length >= length:
+            break
+
+        if len(fragment) < record_length:
+            return (None, length - fragments_length)
+
+    if len(fragments) == 1:
+        return (fragments[0][:length], 0)
+    return (memoryview(b"".join([memoryview(tmp).tobytes() for tmp in fragments]))[:length], 0)
+
+
+def _split_client_hello(message):
+    """
+    Get the positions of the parts of a ClientHello message.
+
+    :param message: The handshake message including the handshake header
+    :return: The version and the offsets of the cipher suites, the compression methods and the extensions
+    :rtype: Tuple
+    """
+    (handshake_type,) = struct.unpack_from("!B", message, 0)
+    if handshake_type != 1:
+        raise ValueError("Handshake message is not a ClientHello")
+
+    end = len(message)
+    try:
+        # Skip header and random
+        (version, session_id_length) = struct.unpack_from("!H32xB", message, 4)
+        cipher_suites_offset = 39 + session_id_length
+        (cipher_suites_length,) = struct.unpack_from("!H", message, cipher_suites_offset)
+        compression_methods_offset = cipher_suites_offset + 2 + cipher_suites_length
+        (compression_methods_length,) = struct.unpack_from("!B", message, compression_methods_offset)
+        extensions_offset = compression_methods_offset + 1 + compression_methods_length
+    except struct.error:
+        raise ValueError("Malformed ClientHello")
+
+    if extensions_offset > end:
+        raise ValueError("Malformed ClientHello")
+
+    return (version, cipher_suites_offset, compression_methods_offset, extensions_offset)
+
+
+def _iter_extensions(message, offset):
+    """
+    Iterate over the extensions of a hello message.
+
+    :param message: The handshake message
+    :param Integer offset: Offset of the extensions length field
+    :return: Type, offset and length of the extension data
+    """
+    end = len(message)
+    if offset == end:
+        return
+
+    if offset + 2 > end:
+        raise ValueError("Malformed extensions")
+    (length,) = struct.unpack_from("!H", message, offset)
+    offset += 2
+    if offset + length > end:
+        raise ValueError("Malformed extensions")
+    end = offset + length
+
+    while offset < end:
+        if offset + 4 > end:
+            raise ValueError("Malformed extension")
+        (extension_type, length) = struct.unpack_from("!HH", message, offset)
+        offset += 4
+        if offset + length > end:
+            raise ValueError("Malformed extension")
+        yield (extension_type, offset, length)
+        offset += length
+
+
+def extract_client_hello_fingerprint(data, ignore_grease=True):
+    """
+    Extract the values used by JA3 style fingerprints from a ClientHello in
+    one pass over the raw data. The data may be a SSLv3/TLS record stream or a
+    handshake message.
+
+    :param data: The data, bytes or memoryview
+    :param Boolean ignore_grease: Remove GREASE values (RFC 8701)
+    :return: Version, cipher suites, extension types, elliptic curves and EC point formats
+    :rtype: Tuple
+    :raises flextls.exception.NotEnoughData: If the ClientHello is incomplete
+    :raises ValueError: If the data does not contain a ClientHello
+    """
+    (message, missing) = _get_client_hello(data)
+    if message is None:
+        raise NotEnoughData("Not enough data to extract the fingerprint")
+
+    (version, cipher_suites_offset, compression_methods_offset, extensions_offset) = _split_client_hello(message)
+
+    cipher_suites = struct.unpack_from(
+        "!%dH" % ((compression_methods_offset - cipher_suites_offset - 2) // 2),
+        message,
+        cipher_suites_offset + 2
+    )
+
+    extension_types = []
+    elliptic_curves = ()
+    ec_point_formats = ()
+    for (extension_type, offset, length) in _iter_extensions(message, extensions_offset):
+        if ignore_grease and _is_grease(extension_type):
+            continue
+        extension_types.append(extension_type)
+        if extension_type == 0x000a and length >= 2:
+            (tmp_length,) = struct.unpack_from("!H", message, offset)
+            elliptic_curves = struct.unpack_from(
+                "!%dH" % (min(tmp_length, length - 2) // 2),
+                message,
+                offset + 2
+            )
+        elif extension_type == 0x000b and length >= 1:
+            (tmp_length,) = struct.unpack_from("!B", message, offset)
+            ec_point_formats = struct.unpack_from(
+                "!%dB" % min(tmp_length, length - 1),
+                message,
+                offset + 1
+            )
+
+    if ignore_grease:
+        cipher_suites = tuple([tmp for tmp in cipher_suites if not _is_grease(tmp)])
+        elliptic_curves = tuple([tmp for tmp in elliptic_curves if not _is_grease(tmp)])
+
+    return (
+        version,
+        cipher_suites,
+        tuple(extension_types),
+        elliptic_curves,
+        ec_point_formats
+    )
+
+
+def extract_client_hello_fingerprints(buffers, ignore_grease=True, ignore_errors=False):
+    """
+    Extract the fingerprints and the digests from a list or an iterator of
+    buffers.
+
+    :param buffers: The buffers, each must contain one ClientHello
+    :param Boolean ignore_grease: Remove GREASE values (RFC 8701)
+    :param Boolean ignore_errors: Return (None, None) for incomplete or invalid buffers instead of raising an exception
+    :return: Iterator of fingerprint and digest tuples
+    """
+    for data in buffers:
+        try:
+            fingerprint = extract_client_hello_fingerprint(data, ignore_grease=ignore_grease)
+        except (NotEnoughData, ValueError):
+            if not ignore_errors:
+                raise
+            yield (None, None)
+            continue
+        yield (fingerprint, get_fingerprint_digest(fingerprint))
+
+
+def get_fingerprint_string(fingerprint):
+    """
+    Format the fingerprint as JA3 string e.g. "771,49195-49199,0-10-11,23-24,0"
+
+    :param Tuple fingerprint: The fingerprint
+    :rtype: String
+    """
+    return ",".join([
+        "-".join([str(value) for value in values])
+        for values in ((fingerprint[0],),) + tuple(fingerprint[1:])
+    ])
+
+
+def get_fingerprint_digest(fingerprint, algorithm="md5"):
+    """
+    Hash the JA3 string of the fingerprint.
+
+    :param Tuple fingerprint: The fingerprint
+    :param String algorithm: Name of the hash algorithm passed to :func:`hashlib.new`
+    :return: The hex digest
+    :rtype: String
+    """
+    return hashlib.new(
+        algorithm,
+        get_fingerprint_string(fingerprint).encode("ascii")
+    ).hexdigest()
+
+
+def peek_client_hello(data):
+    """
+    Get the values required to route a connection from the first bytes of a
+    SSLv3/TLS stream without decoding the ClientHello. The data is not
+    modified.
+
+    Example::
+
+        (version, server_names, protocols, missing) = peek_client_hello(buf)
+        if missing > 0:
+            # Read at least missing bytes and try again
+
+    :param data: The data, bytes or memoryview
+    :return: Version as (major, minor), host names from the SNI extension, protocols from the ALPN extension and the minimum number of bytes missing. All other values are None if bytes are missing.
+    :rtype: Tuple
+    :raises ValueError: If the data does not contain a ClientHello
+    """
+    (message, missing) = _get_client_hello(data)
+    if message is None:
+        return (None, None, None, missing)
+
+    message = memoryview(message)
+    (version, cipher_suites_offset, compression_methods_offset, extensions_offset) = _split_client_hello(message)
+
+    server_names = []
+    protocols = []
+    for (extension_type, offset, length) in _iter_extensions(message, extensions_offset):
+        end = offset + length
+        if extension_type == 0x0000:
+            # Skip the length of the server name list
+            offset += 2
+            while offset + 3 <= end:
+                (name_type, name_length) = struct.unpack_from("!BH", message, offset)
+                offset += 3
+                if offset + name_length > end:
+                    raise ValueError("Malformed server name")
+                if name_type == 0:
+                    server_names.append(message[offset:offset + name_length].tobytes())
+                offset += name_length
+        elif extension_type == 0x0010:
+            # Skip the length of the protocol name list
+            offset += 2
+            while offset < end:
+                (name_length,) = struct.unpack_from("!B", message, offset)
+                offset += 1
+                if offset + name_length > end:
+                    raise ValueError("Malformed protocol name")
+                protocols.append(message[offset:offset + name_length].tobytes())
+                offset += name_length
+
+    return ((version >> 8, version & 0xff), server_names, protocols, 0)
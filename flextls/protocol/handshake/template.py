@@ -0,0 +1,152 @@
+"""
+Pre-encoded handshake messages to generate a lot of similar messages fast.
+"""
+import struct
+
+import six
+
+from flextls import helper
+from flextls.protocol.handshake import ClientHello, Handshake
+from flextls.protocol.record import SSLv3Record
+
+
+class ClientHelloTemplate(object):
+    """
+    Encode a ClientHello once and generate SSLv3/TLS records by patching
+    the random, the session ID, the cipher suites, the server name (SNI) or
+    the extension block. The length fields of the record, the handshake
+    message and the extension block are updated.
+
+    :param flextls.protocol.handshake.ClientHello client_hello: The ClientHello to use as template
+    :param Integer protocol_version: Internal ID of the version used on the record layer. Default: The version of the ClientHello
+    """
+
+    #: Offset of the random in the encoded record
+    random_offset = 11
+
+    def __init__(self, client_hello, protocol_version=None):
+        if not isinstance(client_hello, ClientHello):
+            raise TypeError("Template must be of type flextls.protocol.handshake.ClientHello()")
+
+        record = SSLv3Record()
+        if protocol_version is None:
+            record.version.major = client_hello.version.major
+            record.version.minor = client_hello.version.minor
+        else:
+            ver_major, ver_minor = helper.get_tls_version(protocol_version)
+            record.version.major = ver_major
+            record.version.minor = ver_minor
+        record.set_payload(Handshake() + client_hello)
+        self._data = record.encode()
+
+        self._record_version = record.get_field("version").assemble()
+        self._version = client_hello.get_field("version").assemble()
+        self._random = client_hello.random
+        self._session_id = client_hello.get_field("session_id").assemble()
+        self._cipher_suites = client_hello.get_field("cipher_suites").assemble()
+        self._compression_methods = client_hello.get_field("compression_methods").assemble()
+
+        self._has_extensions = len(client_hello.extensions) > 0
+        extensions_before = []
+        extensions_after = []
+        self._server_name = None
+        for extension in client_hello.extensions:
+            data = extension.encode()
+            if self._server_name is None and extension.type == 0x0000:
+                self._server_name = data
+            elif self._server_name is None:
+                extensions_before.append(data)
+            else:
+                extensions_after.append(data)
+        self._extensions_before = b"".join(extensions_before)
+        self._extensions_after = b"".join(extensions_after)
+
+    @property
+    def data(self):
+        """
+        The encoded record of the template.
+
+        :rtype: bytes
+        """
+        return self._data
+
+    @staticmethod
+    def _encode_server_name(server_name):
+        if isinstance(server_name, six.text_type):
+            server_name = server_name.encode("idna")
+        name_length = len(server_name)
+        return struct.pack(
+            "!HHHBH",
+            0x0000,
+            name_length + 5,
+            name_length + 3,
+            0,
+            name_length
+        ) + server_name
+
+    def render(self, random=None, session_id=None, cipher_suites=None, server_name=None, extensions=None):
+        """
+        Generate a new record.
+
+        :param bytes random: The random, must have a length of 32 bytes
+        :param bytes session_id: The session ID
+        :param List cipher_suites: List of cipher suite IDs
+        :param String|bytes server_name: The host name to use in the SNI extension
+        :param bytes extensions: The encoded extensions without the length field
+        :return: The encoded record
+        :rtype: bytes
+        """
+        if random is not None and len(random) != 32:
+            raise ValueError("The random must have a length of 32 bytes")
+
+        if server_name is not None and extensions is not None:
+            raise ValueError("Unable to set the server name and the extensions at the same time")
+
+        if session_id is None and cipher_suites is None and server_name is None and extensions is None:
+            if random is None:
+                return self._data
+            data = bytearray(self._data)
+            data[self.random_offset:self.random_offset + 32] = random
+            return bytes(data)
+
+        if random is None:
+            random = self._random
+
+        tmp_session_id = self._session_id
+        if session_id is not None:
+            tmp_session_id = struct.pack("!B", len(session_id)) + session_id
+
+        tmp_cipher_suites = self._cipher_suites
+        if cipher_suites is not None:
+            tmp_cipher_suites = struct.pack(
+                "!H%dH" % len(cipher_suites),
+                len(cipher_suites) * 2,
+                *cipher_suites
+            )
+
+        if extensions is None:
+            tmp_server_name = self._server_name
+            if server_name is not None:
+                tmp_server_name = self._encode_server_name(server_name)
+            elif tmp_server_name is None:
+                tmp_server_name = b""
+            extensions = self._extensions_before + tmp_server_name + self._extensions_after
+
+        tmp_extensions = b""
+        if len(extensions) > 0 or self._has_extensions:
+            tmp_extensions = struct.pack("!H", len(extensions)) + extensions
+
+        length = 34 + len(tmp_session_id) + len(tmp_cipher_suites) + \
+            len(self._compression_methods) + len(tmp_extensions)
+
+        return b"".join((
+            struct.pack("!B", 22),
+            self._record_version,
+            struct.pack("!HBBH", length + 4, 1, length >> 16, length & 0xffff),
+            self._version,
+            random,
+            tmp_session_id,
+            tmp_cipher_suites,
+            self._compression_methods,
+            tmp_extensions
+        ))
@@ -30,7 +30,10 @@ class Record(Protocol):
                 connection=connection
             )
 
-        data = obj.dissect(data)
+        data = obj.dissect(
+            data,
+            payload_auto_decode=payload_auto_decode
+        )
         return (obj, data)
 
 
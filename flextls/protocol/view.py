@@ -0,0 +1,347 @@
+"""
+Read-only views of records and handshake messages. The values are read from
+the original buffer at offsets calculated when the view is created. All
+length fields are validated once in the constructor.
+
+Use :meth:`to_protocol` to get a Protocol object if a value must be changed
+or if a part of the message is not available in the view.
+"""
+import struct
+
+from flextls.exception import NotEnoughData
+from flextls.protocol.handshake import ClientHello, ServerHello, ServerCertificate
+from flextls.protocol.record import SSLv3Record
+
+
+class BaseView(object):
+    """
+    Base class of all views.
+
+    :param data: The data, bytes or memoryview
+    """
+
+    #: Class used by :meth:`to_protocol`
+    protocol_class = None
+
+    def __init__(self, data):
+        self._data = memoryview(data)
+
+    @property
+    def data(self):
+        """
+        The data of the record or message including the header.
+
+        :rtype: memoryview
+        """
+        return self._data
+
+    @property
+    def size(self):
+        return len(self._data)
+
+    def _get_protocol_data(self):
+        return self._data
+
+    def to_protocol(self, connection=None, payload_auto_decode=True):
+        """
+        Decode the data.
+
+        :param connection: The connection
+        :param payload_auto_decode: Passed to :meth:`flextls.protocol.Protocol.decode`
+        :return: The decoded object
+        :rtype: flextls.protocol.Protocol
+        """
+        (obj, data) = self.protocol_class.decode(
+            self._get_protocol_data().tobytes(),
+            connection=connection,
+            payload_auto_decode=payload_auto_decode
+        )
+        return obj
+
+
+class RecordView(BaseView):
+    """
+    View of a SSLv3/TLS record.
+
+    :param data: The data starting with the record header, additional data is ignored
+    :raises flextls.exception.NotEnoughData: If the record is incomplete
+    """
+    protocol_class = SSLv3Record
+
+    def __init__(self, data):
+        data = memoryview(data)
+        if len(data) < 5:
+            raise NotEnoughData("Not enough data to create view")
+
+        (self.content_type, ver_major, ver_minor, self.length) = struct.unpack_from("!BBBH", data, 0)
+        self.version = (ver_major, ver_minor)
+        if len(data) < self.length + 5:
+            raise NotEnoughData("Not enough data to create view")
+
+        BaseView.__init__(self, data[:self.length + 5])
+
+    @property
+    def payload(self):
+        """
+        The payload of the record.
+
+        :rtype: memoryview
+        """
+        return self._data[5:]
+
+    @classmethod
+    def iter_records(cls, data):
+        """
+        Create a view for every complete record in the data.
+
+        :param data: The data, bytes or memoryview
+        :return: Iterator of record views
+        """
+        data = memoryview(data)
+        offset = 0
+        while True:
+            try:
+                view = cls(data[offset:])
+            except NotEnoughData:
+                return
+            offset += view.size
+            yield view
+
+
+class HandshakeView(BaseView):
+    """
+    Base class of views of SSLv3/TLS handshake messages.
+
+    :param data: The data starting with the handshake header, additional data is ignored
+    :raises flextls.exception.NotEnoughData: If the message is incomplete
+    :raises ValueError: If the message has the wrong type or a length field is invalid
+    """
+
+    #: Type of the handshake message
+    handshake_type = None
+
+    def __init__(self, data):
+        data = memoryview(data)
+        if len(data) < 4:
+            raise NotEnoughData("Not enough data to create view")
+
+        (self.type, length_high, length_low) = struct.unpack_from("!BBH", data, 0)
+        if self.handshake_type is not None and self.type != self.handshake_type:
+            raise ValueError("Wrong handshake type")
+
+        self.length = (length_high << 16) + length_low
+        if len(data) < self.length + 4:
+            raise NotEnoughData("Not enough data to create view")
+
+        BaseView.__init__(self, data[:self.length + 4])
+        try:
+            self._parse()
+        except struct.error:
+            raise ValueError("Invalid length field")
+
+    def _get_protocol_data(self):
+        return self._data[4:]
+
+    def _parse(self):
+        pass
+
+    def _parse_vector(self, offset, fmt):
+        """
+        Validate the length of a vector.
+
+        :return: Offset of the first byte after the length field and offset of the first byte after the vector
+        :rtype: Tuple
+        """
+        (length,) = struct.unpack_from(fmt, self._data, offset)
+        offset += struct.calcsize(fmt)
+        end = offset + length
+        if end > len(self._data):
+            raise ValueError("Invalid length field")
+        return (offset, end)
+
+    def _parse_extensions(self, offset):
+        self._extensions = {}
+        self._extension_types = []
+        if offset == len(self._data):
+            return
+
+        (offset, end) = self._parse_vector(offset, "!H")
+        if end != len(self._data):
+            raise ValueError("Invalid length field")
+
+        while offset < end:
+            (extension_type, length) = struct.unpack_from("!HH", self._data, offset)
+            offset += 4
+            if offset + length > end:
+                raise ValueError("Invalid length field")
+            self._extension_types.append(extension_type)
+            if extension_type not in self._extensions:
+                self._extensions[extension_type] = (offset, length)
+            offset += length
+
+    @property
+    def payload(self):
+        """
+        The message without the handshake header.
+
+        :rtype: memoryview
+        """
+        return self._data[4:]
+
+
+class BaseHelloView(HandshakeView):
+    """
+    Base class of the views of ClientHello and ServerHello messages.
+    """
+    def __init__(self, data):
+        self._extensions = None
+        self._extension_types = None
+        HandshakeView.__init__(self, data)
+
+    @property
+    def extension_types(self):
+        """
+        Types of all extensions in the order of the message.
+
+        :rtype: List
+        """
+        return self._extension_types
+
+    def get_extension_data(self, extension_type):
+        """
+        Get the data of the first extension of the given type.
+
+        :param Integer extension_type: The type of the extension
+        :return: The data without the extension header or None if not found
+        :rtype: memoryview
+        """
+        tmp = self._extensions.get(extension_type)
+        if tmp is None:
+            return None
+        (offset, length) = tmp
+        return self._data[offset:offset + length]
+
+    @property
+    def random(self):
+        """
+        :rtype: memoryview
+        """
+        return self._data[6:38]
+
+    @property
+    def session_id(self):
+        """
+        :rtype: memoryview
+        """
+        return self._data[self._session_id_offset:self._session_id_end]
+
+    @property
+    def version(self):
+        """
+        The version as (major, minor).
+
+        :rtype: Tuple
+        """
+        return struct.unpack_from("!BB", self._data, 4)
+
+
+class ClientHelloView(BaseHelloView):
+    """
+    View of a SSLv3/TLS ClientHello message.
+
+    :param data: The data starting with the handshake header
+    """
+    handshake_type = 1
+    protocol_class = ClientHello
+
+    def _parse(self):
+        (self._session_id_offset, self._session_id_end) = self._parse_vector(38, "!B")
+        (self._cipher_suites_offset, self._cipher_suites_end) = self._parse_vector(self._session_id_end, "!H")
+        if (self._cipher_suites_end - self._cipher_suites_offset) % 2 != 0:
+            raise ValueError("Invalid length field")
+        (self._compression_methods_offset, self._compression_methods_end) = self._parse_vector(
+            self._cipher_suites_end,
+            "!B"
+        )
+        self._parse_extensions(self._compression_methods_end)
+
+    @property
+    def cipher_suites(self):
+        """
+        IDs of the cipher suites.
+
+        :rtype: Tuple
+        """
+        return struct.unpack_from(
+            "!%dH" % ((self._cipher_suites_end - self._cipher_suites_offset) // 2),
+            self._data,
+            self._cipher_suites_offset
+        )
+
+    @property
+    def compression_methods(self):
+        """
+        IDs of the compression methods.
+
+        :rtype: Tuple
+        """
+        return struct.unpack_from(
+            "!%dB" % (self._compression_methods_end - self._compression_methods_offset),
+            self._data,
+            self._compression_methods_offset
+        )
+
+
+class ServerHelloView(BaseHelloView):
+    """
+    View of a SSLv3/TLS ServerHello message.
+
+    :param data: The data starting with the handshake header
+    """
+    handshake_type = 2
+    protocol_class = ServerHello
+
+    def _parse(self):
+        (self._session_id_offset, self._session_id_end) = self._parse_vector(38, "!B")
+        (self.cipher_suite, self.compression_method) = struct.unpack_from("!HB", self._data, self._session_id_end)
+        self._parse_extensions(self._session_id_end + 3)
+
+
+class CertificateView(HandshakeView):
+    """
+    View of a SSLv3/TLS Certificate message. Use the view as sequence of
+    DER encoded certificates.
+
+    :param data: The data starting with the handshake header
+    """
+    handshake_type = 11
+    protocol_class = ServerCertificate
+
+    def _parse(self):
+        self._certificates = []
+        (length_high, length_low) = struct.unpack_from("!BH", self._data, 4)
+        offset = 7
+        end = offset + (length_high << 16) + length_low
+        if end != len(self._data):
+            raise ValueError("Invalid length field")
+
+        while offset < end:
+            (length_high, length_low) = struct.unpack_from("!BH", self._data, offset)
+            offset += 3
+            length = (length_high << 16) + length_low
+            if offset + length > end:
+                raise ValueError("Invalid length field")
+            self._certificates.append((offset, length))
+            offset += length
+
+    def __getitem__(self, index):
+        (offset, length) = self._certificates[index]
+        return self._data[offset:offset + length]
+
+    def __iter__(self):
+        data = self._data
+        for (offset, length) in self._certificates:
+            yield data[offset:offset + length]
+
+    def __len__(self):
+        return len(self._certificates)
@@ -0,0 +1,206 @@
+"""
+TLS passthrough proxy to route connections by the server name (SNI) and the
+ALPN protocols of the ClientHello. The TLS connection is not terminated.
+
+The proxy uses :mod:`asyncio` with async/await and requires Python 3.7 or
+newer. The syntax is not supported by older versions, the proxy is kept in
+a separate module not installed on these versions and :class:`SNIProxy` is
+not available. The routing table can be used on all versions.
+
+Example::
+
+    routing_table = RoutingTable()
+    routing_table.add_route("example.org", "127.0.0.1", 8443)
+    routing_table.add_route("*.example.org", "127.0.0.1", 9443)
+    routing_table.add_route("example.org", "127.0.0.1", 8444, protocol=b"h2")
+
+    proxy = SNIProxy(routing_table)
+    loop.run_until_complete(proxy.start("0.0.0.0", 443))
+"""
+import bisect
+import sys
+
+if sys.version_info >= (3, 7):
+    from flextls._proxy_server import SNIProxy
+
+
+class LatencyHistogram(object):
+    """
+    Count values in buckets with fixed upper bounds.
+
+    :param List bounds: Sorted upper bounds of the buckets in seconds, values above the last bound are counted in an extra bucket
+    """
+
+    #: Default bounds from 100us to 5s
+    default_bounds = (
+        0.0001, 0.00025, 0.0005,
+        0.001, 0.0025, 0.005,
+        0.01, 0.025, 0.05,
+        0.1, 0.25, 0.5,
+        1.0, 2.5, 5.0
+    )
+
+    def __init__(self, bounds=None):
+        if bounds is None:
+            bounds = self.default_bounds
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        """
+        Add a value.
+
+        :param float value: The value in seconds
+        """
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def snapshot(self):
+        """
+        Get the current values.
+
+        :return: Bounds, counts, number of values and the sum of all values
+        :rtype: Dict
+        """
+        return {
+            "bounds": list(self.bounds) + [None],
+            "counts": list(self.counts),
+            "count": self.count,
+            "total": self.total
+        }
+
+
+class Route(object):
+    """
+    A backend and its counters.
+
+    :param String host: Host name or IP address of the backend
+    :param Integer port: Port of the backend
+    """
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.setup_latency = LatencyHistogram()
+        self.reset()
+
+    def reset(self):
+        """
+        Reset all counters.
+        """
+        self.active_connections = 0
+        self.connections = 0
+        self.errors = 0
+        self.bytes_from_client = 0
+        self.bytes_from_server = 0
+        self.setup_latency.reset()
+
+    def snapshot(self):
+        """
+        Get the current values of all counters.
+
+        :rtype: Dict
+        """
+        return {
+            "host": self.host,
+            "port": self.port,
+            "active_connections": self.active_connections,
+            "connections": self.connections,
+            "errors": self.errors,
+            "bytes_from_client": self.bytes_from_client,
+            "bytes_from_server": self.bytes_from_server,
+            "setup_latency": self.setup_latency.snapshot()
+        }
+
+
+class RoutingTable(object):
+    """
+    Map server names and ALPN protocols to routes. Server names are matched
+    case insensitive. A name starting with "*." matches all sub domains.
+    """
+    def __init__(self):
+        self._routes = {}
+        self._wildcard_routes = {}
+        self.default_route = None
+
+    @staticmethod
+    def _normalize_name(server_name):
+        if isinstance(server_name, bytes):
+            server_name = server_name.decode("ascii")
+        return server_name.lower().rstrip(".")
+
+    def add_route(self, server_name, host, port, protocol=None):
+        """
+        Add a route.
+
+        :param String server_name: The server name or None to set the default route
+        :param String host: Host name or IP address of the backend
+        :param Integer port: Port of the backend
+        :param bytes protocol: Only use the route if the client offers the ALPN protocol
+        :return: The route
+        :rtype: Route
+        """
+        route = Route(host, port)
+        if server_name is None:
+            self.default_route = route
+            return route
+
+        server_name = self._normalize_name(server_name)
+        routes = self._routes
+        if server_name.startswith("*."):
+            routes = self._wildcard_routes
+            server_name = server_name[2:]
+        routes[(server_name, protocol)] = route
+        return route
+
+    def _find(self, routes, server_name, protocols):
+        for protocol in protocols:
+            route = routes.get((server_name, protocol))
+            if route is not None:
+                return route
+        return routes.get((server_name, None))
+
+    def get_route(self, server_names, protocols):
+        """
+        Find the route for a connection.
+
+        :param List server_names: The server names of the ClientHello
+        :param List protocols: The ALPN protocols of the ClientHello
+        :return: The route or None
+        :rtype: Route
+        """
+        for server_name in server_names:
+            try:
+                server_name = self._normalize_name(server_name)
+            except UnicodeDecodeError:
+                continue
+            route = self._find(self._routes, server_name, protocols)
+            if route is not None:
+                return route
+
+            domain = server_name.partition(".")[2]
+            while domain:
+                route = self._find(self._wildcard_routes, domain, protocols)
+                if route is not None:
+                    return route
+                domain = domain.partition(".")[2]
+
+        return self.default_route
+
+    def get_routes(self):
+        """
+        Get all routes.
+
+        :rtype: List
+        """
+        routes = list(self._routes.values()) + list(self._wildcard_routes.values())
+        if self.default_route is not None:
+            routes.append(self.default_route)
+        return routes
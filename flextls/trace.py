@@ -0,0 +1,143 @@
+"""
+Tracing of the connections.
+
+Pass a tracer to a connection to get notified about the events while
+decoding the data. A tracer is a callable with a :class:`TraceEvent` as
+argument. Nothing is traced if no tracer is set.
+
+Example::
+
+    tracer = RingBufferTracer(size=100)
+    conn = DTLSv10Connection(protocol_version, tracer=tracer)
+    conn.decode(data)
+    for line in tracer.dump():
+        print(line)
+"""
+import collections
+import logging
+
+#: A record or handshake message has been decoded
+RECORD_DECODED = "record_decoded"
+#: A fragment of a DTLS handshake message has been buffered until the message is complete
+FRAGMENT_BUFFERED = "fragment_buffered"
+#: A DTLS handshake message has been dropped because of an unexpected message sequence number
+OUT_OF_ORDER_DROPPED = "out_of_order_dropped"
+#: A record has a different protocol version than the connection
+VERSION_MISMATCH = "version_mismatch"
+#: Not enough data to decode a record or handshake message, wait for more data
+INCOMPLETE = "incomplete"
+
+
+class TraceEvent(object):
+    """
+    Event passed to the tracers.
+
+    :param String name: Name of the event e.g. :data:`RECORD_DECODED`
+    :param connection: The connection
+    :param flextls.protocol.Protocol record: The record or message if available
+    :param details: Additional values depending on the event
+    """
+    __slots__ = ("name", "connection", "record", "details")
+
+    def __init__(self, name, connection, record=None, **details):
+        self.name = name
+        self.connection = connection
+        self.record = record
+        self.details = details
+
+    def __repr__(self):
+        return "<TraceEvent %s>" % self.format()
+
+    def __str__(self):
+        return self.format()
+
+    def format(self):
+        """
+        Format the event as single line.
+
+        :rtype: String
+        """
+        items = [self.name]
+        if self.record is not None:
+            items.append(self.record.__class__.__name__)
+        for name in sorted(self.details.keys()):
+            items.append("%s=%r" % (name, self.details[name]))
+        return " ".join(items)
+
+
+class TraceDispatcher(object):
+    """
+    Pass the events to all subscribed tracers.
+    """
+    def __init__(self):
+        self._subscribers = []
+
+    def __call__(self, event):
+        for subscriber in self._subscribers:
+            subscriber(event)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self, tracer):
+        """
+        :param tracer: Callable with the event as argument
+        """
+        self._subscribers.append(tracer)
+
+    def unsubscribe(self, tracer):
+        """
+        :param tracer: The tracer passed to :meth:`subscribe`
+        """
+        self._subscribers.remove(tracer)
+
+
+class LoggingTracer(object):
+    """
+    Log the events. The events are only formatted if the level is enabled.
+
+    :param logger: The logger or name of the logger, defaults to flextls.trace
+    :param Integer level: The log level
+    """
+    def __init__(self, logger=None, level=logging.DEBUG):
+        if logger is None:
+            logger = __name__
+        if not isinstance(logger, logging.Logger):
+            logger = logging.getLogger(logger)
+        self.logger = logger
+        self.level = level
+
+    def __call__(self, event):
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, "%s", event)
+
+
+class RingBufferTracer(object):
+    """
+    Keep the last events e.g. to dump them after an error.
+
+    :param Integer size: Maximum number of events, older events are dropped
+    """
+    def __init__(self, size=1000):
+        self.events = collections.deque(maxlen=size)
+
+    def __call__(self, event):
+        self.events.append(event)
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def __len__(self):
+        return len(self.events)
+
+    def clear(self):
+        self.events.clear()
+
+    def dump(self):
+        """
+        Format the buffered events.
+
+        :return: One line per event, oldest event first
+        :rtype: List
+        """
+        return [event.format() for event in self.events]
@@ -0,0 +1,62 @@
+"""
+Hash the handshake messages of a connection.
+"""
+import hashlib
+
+
+class HandshakeTranscript(object):
+    """
+    Incremental hashes of the handshake messages. The messages are not kept
+    in memory.
+
+    Use the algorithm name "md5-sha1" for the concatenation of MD5 and SHA-1
+    used by SSLv3, TLS 1.0 and TLS 1.1. All other names are passed to
+    :func:`hashlib.new`.
+
+    :param List algorithms: Names of the hash algorithms
+    """
+    def __init__(self, algorithms=("md5-sha1", "sha256", "sha384")):
+        self.algorithms = tuple(algorithms)
+        self._hashes = {}
+        self.reset()
+
+    def digest(self, algorithm):
+        """
+        Get the digest of all messages processed so far.
+
+        :param String algorithm: Name of the hash algorithm
+        :return: The digest
+        :rtype: bytes
+        """
+        return b"".join([tmp_hash.copy().digest() for tmp_hash in self._hashes[algorithm]])
+
+    def hexdigest(self, algorithm):
+        """
+        Get the digest of all messages processed so far as hex string.
+
+        :param String algorithm: Name of the hash algorithm
+        :return: The digest
+        :rtype: String
+        """
+        return "".join([tmp_hash.copy().hexdigest() for tmp_hash in self._hashes[algorithm]])
+
+    def reset(self):
+        """
+        Drop all messages processed so far.
+        """
+        self._hashes = {}
+        for algorithm in self.algorithms:
+            if algorithm == "md5-sha1":
+                self._hashes[algorithm] = (hashlib.md5(), hashlib.sha1())
+            else:
+                self._hashes[algorithm] = (hashlib.new(algorithm),)
+
+    def update(self, data):
+        """
+        Add the data of a handshake message including the handshake header.
+
+        :param bytes data: The data
+        """
+        for hashes in self._hashes.values():
+            for tmp_hash in hashes:
+                tmp_hash.update(data)
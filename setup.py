@@ -1,9 +1,25 @@
 #!/usr/bin/env python
 import os
+import sys
 from setuptools import setup, find_packages
+from setuptools.command.build_py import build_py
 
 base_dir = os.path.dirname(__file__)
 
+# Modules using async/await, byte-compiling them fails on older versions
+ASYNC_MODULES = [
+    ("flextls", "_proxy_server"),
+    ("tests", "test_proxy"),
+]
+
+
+class BuildPy(build_py):
+    def find_package_modules(self, package, package_dir):
+        modules = build_py.find_package_modules(self, package, package_dir)
+        if sys.version_info >= (3, 7):
+            return modules
+        return [module for module in modules if module[:2] not in ASYNC_MODULES]
+
 about = {}
 with open(os.path.join(base_dir, "flextls", "__about__.py")) as f:
     exec(f.read(), about)
@@ -38,6 +54,9 @@ setup(
         "six >= 1.4.1",
     ],
     packages=find_packages(exclude=["*.tests", "*.tests.*"]),
+    cmdclass={
+        "build_py": BuildPy,
+    },
     include_package_data=True,
     package_data={
         #"": ["README"],
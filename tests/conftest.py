@@ -0,0 +1,6 @@
+import sys
+
+collect_ignore = []
+if sys.version_info < (3, 7):
+    # The proxy requires asyncio with async/await
+    collect_ignore.append("test_proxy.py")
@@ -0,0 +1,113 @@
+import os
+import pickle
+
+import pytest
+
+from flextls import analysis
+from flextls.analysis import CaptureAnalyzer, FlowSummary, get_shard, summarize
+from flextls.capture import SERVER, CaptureReader
+
+from tests.test_capture import CLIENT_ADDRESS, SERVER_ADDRESS, build_pcap, build_tcp, build_udp
+from tests.test_capture import client_hello_record, dtls_client_hello_record, server_hello_done_record
+
+
+def build_capture(flow_count):
+    packets = []
+    for i in range(flow_count):
+        client = (CLIENT_ADDRESS, SERVER_ADDRESS, 10000 + i, 443)
+        server = (SERVER_ADDRESS, CLIENT_ADDRESS, 443, 10000 + i)
+        packets += [
+            build_tcp(*client, seq=100, flags=0x02),
+            build_tcp(*server, seq=500, flags=0x12),
+            build_tcp(*client, seq=101, flags=0x18, payload=client_hello_record),
+            build_tcp(*server, seq=501, flags=0x18, payload=server_hello_done_record + b"\x15\x03\x03\x00\x02\x02\x28"),
+            build_tcp(*client, seq=101 + len(client_hello_record), flags=0x14),
+        ]
+    packets.append(build_udp(CLIENT_ADDRESS, SERVER_ADDRESS, 50000, 4433, dtls_client_hello_record))
+    return build_pcap(packets)
+
+
+def exit_worker(*args):
+    # Exit like a worker killed by a signal without sending any results
+    os._exit(1)
+
+
+class TestFlowSummary(object):
+    def test_summarize(self, tmpdir):
+        filename = tmpdir.join("test.pcap")
+        filename.write_binary(build_capture(2))
+
+        with CaptureReader(str(filename)) as reader:
+            summaries = list(summarize(reader))
+
+        assert len(summaries) == 3
+        summary = summaries[0]
+        assert summary.protocol == "tcp"
+        assert summary.client == ("10.0.0.1", 10000)
+        assert summary.server == ("10.0.0.2", 443)
+        assert summary.packets == 5
+        assert summary.versions == [(3, 3)]
+        assert summary.cipher_suites == [0x002f]
+        assert summary.server_names == [b"localhost"]
+        # Alert: fatal, handshake_failure
+        assert summary.alerts == [(SERVER, 2, 40)]
+        assert summary.errors == [None, None]
+
+        summary = summaries[2]
+        assert summary.protocol == "udp"
+        assert summary.versions == [(254, 255)]
+
+    def test_pickle(self, tmpdir):
+        filename = tmpdir.join("test.pcap")
+        filename.write_binary(build_capture(1))
+
+        with CaptureReader(str(filename)) as reader:
+            summary = next(summarize(reader))
+
+        tmp = pickle.loads(pickle.dumps(summary))
+        assert tmp.as_dict() == summary.as_dict()
+
+
+class TestCaptureAnalyzer(object):
+    def test_get_shard(self):
+        shard = get_shard(6, CLIENT_ADDRESS, 10000, SERVER_ADDRESS, 443, 32)
+        assert 0 <= shard < 32
+        assert get_shard(6, SERVER_ADDRESS, 443, CLIENT_ADDRESS, 10000, 32) == shard
+
+    def test_analyze(self, tmpdir):
+        filename = tmpdir.join("test.pcap")
+        filename.write_binary(build_capture(50))
+
+        analyzer = CaptureAnalyzer(shard_count=3, queue_depth=2, batch_size=4)
+        summaries = list(analyzer.analyze(str(filename)))
+        assert len(summaries) == 51
+
+        with CaptureReader(str(filename)) as reader:
+            expected = dict([(summary.client, summary.as_dict()) for summary in summarize(reader)])
+
+        for summary in summaries:
+            tmp = summary.as_dict()
+            # Flow IDs are assigned by every worker
+            tmp["flow_id"] = expected[summary.client]["flow_id"]
+            assert tmp == expected[summary.client]
+
+    def test_worker_killed(self, tmpdir, monkeypatch):
+        filename = tmpdir.join("test.pcap")
+        filename.write_binary(build_capture(1))
+
+        monkeypatch.setattr(analysis, "_run_worker", exit_worker)
+        analyzer = CaptureAnalyzer(shard_count=2)
+        with pytest.raises(RuntimeError):
+            list(analyzer.analyze(str(filename)))
+
+    def test_concurrent(self, tmpdir):
+        filename = tmpdir.join("test.pcap")
+        filename.write_binary(build_capture(10))
+
+        analyzer = CaptureAnalyzer(shard_count=2, batch_size=2)
+        results1 = analyzer.analyze(str(filename))
+        results2 = analyzer.analyze(str(filename))
+        summaries = [next(results1), next(results2)]
+        summaries += list(results1)
+        assert len(summaries) == 12
+        assert len(list(results2)) == 10
@@ -0,0 +1,109 @@
+import binascii
+import sys
+
+from flextls.cache import DecodeCache, InternPool
+from flextls.protocol import DecodeProfile
+from flextls.protocol.handshake import Handshake, ServerHelloDone
+from flextls.protocol.handshake.extension import Extension
+
+
+def create_message():
+    obj = ServerHelloDone()
+    obj.encode()
+    return obj
+
+
+class TestDecodeCache(object):
+    def test_get(self):
+        cache = DecodeCache()
+        obj = create_message()
+        assert cache.get(Handshake, 14, b"data") is None
+        cache.add(Handshake, 14, b"data", obj)
+        tmp_obj = cache.get(Handshake, 14, b"data")
+        assert isinstance(tmp_obj, ServerHelloDone)
+        assert tmp_obj is not obj
+        assert cache.get(Handshake, 14, b"data", context=1) is None
+        assert cache.get(Handshake, 11, b"data") is None
+        assert cache.get(Handshake, 14, b"other") is None
+        assert cache.snapshot() == {
+            "entries": 1,
+            "memory": 4,
+            "hits": 1,
+            "misses": 4,
+            "evictions": 0
+        }
+
+    def test_max_entries(self):
+        cache = DecodeCache(max_entries=2)
+        objs = [create_message() for i in range(3)]
+        cache.add(Handshake, 14, b"data0", objs[0])
+        cache.add(Handshake, 14, b"data1", objs[1])
+        # Mark as recently used
+        assert cache.get(Handshake, 14, b"data0") is not None
+        cache.add(Handshake, 14, b"data2", objs[2])
+        assert len(cache) == 2
+        assert cache.evictions == 1
+        assert cache.get(Handshake, 14, b"data1") is None
+        assert cache.get(Handshake, 14, b"data0") is not None
+
+    def test_max_memory(self):
+        cache = DecodeCache(max_memory=10)
+        cache.add(Handshake, 14, b"a" * 11, create_message())
+        assert len(cache) == 0
+
+        cache.add(Handshake, 14, b"a" * 6, create_message())
+        cache.add(Handshake, 14, b"b" * 6, create_message())
+        assert len(cache) == 1
+        assert cache.memory == 6
+        assert cache.evictions == 1
+
+        cache.clear()
+        assert cache.snapshot()["memory"] == 0
+
+    def test_changed(self):
+        cache = DecodeCache()
+        cache.add(Handshake, 14, b"data", create_message())
+        obj = cache.get(Handshake, 14, b"data")
+        obj.fields = []
+        # Every hit returns a new copy
+        obj = cache.get(Handshake, 14, b"data")
+        assert not obj.is_dirty()
+        assert obj.fields is not cache.get(Handshake, 14, b"data").fields
+
+
+class TestInternPool(object):
+    def test_intern(self):
+        pool = InternPool()
+        value1 = pool.intern(b"".join([b"value", b"1"]))
+        value2 = pool.intern(memoryview(b"value1"))
+        assert value1 == b"value1"
+        assert value2 is value1
+        assert pool.hits == 1
+        assert pool.misses == 1
+        assert pool.saved_bytes == sys.getsizeof(b"value1")
+        assert pool.snapshot()["entries"] == 1
+
+    def test_prune(self):
+        pool = InternPool(max_entries=2)
+        value1 = pool.intern(b"".join([b"value", b"1"]))
+        pool.intern(b"".join([b"value", b"2"]))
+        pool.prune()
+        assert len(pool) == 1
+        assert pool.intern(b"".join([b"value", b"1"])) is value1
+
+        # The pool is pruned if it is full
+        pool.intern(b"".join([b"value", b"2"]))
+        pool.intern(b"".join([b"value", b"3"]))
+        assert len(pool) == 2
+
+    def test_profile(self):
+        pool = InternPool()
+        # Type: ALPN, Length: 14, Protocols: h2, http/1.1
+        data = binascii.unhexlify(b"0010000e000c02683208687474702f312e31")
+        profile = DecodeProfile(intern_pool=pool)
+        (obj1, tmp_data) = Extension.decode(data, payload_auto_decode=profile)
+        (obj2, tmp_data) = Extension.decode(bytes(bytearray(data)), payload_auto_decode=profile)
+        value1 = obj1.payload.protocol_name_list[1].value
+        assert value1 == b"http/1.1"
+        assert obj2.payload.protocol_name_list[1].value is value1
+        assert pool.get_profile(True) is pool.get_profile(True)
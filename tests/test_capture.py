@@ -0,0 +1,280 @@
+import binascii
+import struct
+
+import pytest
+
+from flextls.capture import CLIENT, SERVER, TCP_SYN, CaptureReader, FlowTracker, Packet, PcapWriter, TCPStream
+from flextls.capture import read_capture
+from flextls.protocol.change_cipher_spec import ChangeCipherSpec
+from flextls.protocol.handshake import ClientHello, DTLSv10ClientHello, ServerHelloDone
+
+# Handshake, TLS 1.0, Length 74
+client_hello_record = b"160301004a"
+# Client Hello, Length 70, TLS 1.2
+client_hello_record += b"010000460303"
+# Random, Session ID Length: 0
+client_hello_record += b"00" * 32 + b"00"
+# Cipher Suites Length: 2, TLS_RSA_WITH_AES_128_CBC_SHA, Compression Methods Length: 1, null
+client_hello_record += b"0002002f0100"
+# Extensions Length: 27, server_name: localhost, ALPN: h2
+client_hello_record += b"001b0000000e000c0000096c6f63616c686f7374001000050003026832"
+client_hello_record = binascii.unhexlify(client_hello_record)
+
+# Handshake, TLS 1.2, Length 4, Server Hello Done
+server_hello_done_record = binascii.unhexlify(b"16030300040e000000")
+
+# Handshake, DTLSv1.0, Epoch 0, Sequence Number 0, Length 54
+dtls_client_hello_record = b"16feff00000000000000000036"
+# Client Hello, Length 42, Message Sequence 0, Fragment Offset 0, Fragment Length 42
+dtls_client_hello_record += b"0100002a000000000000002a"
+# DTLS 1.0, Random, Session ID Length: 0, Cookie Length: 0
+dtls_client_hello_record += b"feff" + b"00" * 32 + b"0000"
+# Cipher Suites Length: 2, TLS_RSA_WITH_AES_128_CBC_SHA, Compression Methods Length: 1, null
+dtls_client_hello_record += b"0002002f0100"
+dtls_client_hello_record = binascii.unhexlify(dtls_client_hello_record)
+
+CLIENT_ADDRESS = b"\x0a\x00\x00\x01"
+SERVER_ADDRESS = b"\x0a\x00\x00\x02"
+
+
+def build_tcp(src, dst, src_port, dst_port, seq, flags, payload=b""):
+    tcp = struct.pack("!HHIIBBHHH", src_port, dst_port, seq, 0, 5 << 4, flags, 65535, 0, 0) + payload
+    ip = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(tcp), 0, 0x4000, 64, 6, 0, src, dst)
+    ethernet = b"\x00" * 12 + b"\x08\x00"
+    return ethernet + ip + tcp
+
+
+def build_udp(src, dst, src_port, dst_port, payload):
+    udp = struct.pack("!HHHH", src_port, dst_port, 8 + len(payload), 0) + payload
+    ip = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(udp), 0, 0, 64, 17, 0, src, dst)
+    # VLAN tagged
+    ethernet = b"\x00" * 12 + b"\x81\x00\x00\x0a\x08\x00"
+    return ethernet + ip + udp
+
+
+def build_pcap(packets):
+    data = struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1)
+    for (i, packet) in enumerate(packets):
+        data += struct.pack("<IIII", 1000 + i, 0, len(packet), len(packet)) + packet
+    return data
+
+
+def build_pcapng(packets):
+    options = struct.pack("<HHB3x", 9, 1, 6) + struct.pack("<HH", 0, 0)
+    data = struct.pack("<IIIHHq", 0x0a0d0d0a, 28, 0x1a2b3c4d, 1, 0, -1) + struct.pack("<I", 28)
+    data += struct.pack("<IIHHI", 1, 16 + len(options) + 4, 1, 0, 65535) + options
+    data += struct.pack("<I", 16 + len(options) + 4)
+    for (i, packet) in enumerate(packets):
+        padding = b"\x00" * (-len(packet) % 4)
+        length = 32 + len(packet) + len(padding)
+        timestamp = (1000 + i) * 1000000
+        data += struct.pack("<IIIIIII", 6, length, 0, timestamp >> 32, timestamp & 0xffffffff, len(packet), len(packet))
+        data += packet + padding + struct.pack("<I", length)
+    return data
+
+
+def build_tcp_flow(reorder=True):
+    client = (CLIENT_ADDRESS, SERVER_ADDRESS, 50000, 443)
+    server = (SERVER_ADDRESS, CLIENT_ADDRESS, 443, 50000)
+    packets = [
+        build_tcp(*client, seq=100, flags=0x02),
+        build_tcp(*server, seq=500, flags=0x12),
+    ]
+    segments = [
+        build_tcp(*client, seq=101, flags=0x18, payload=client_hello_record[:10]),
+        build_tcp(*client, seq=111, flags=0x18, payload=client_hello_record[10:40]),
+        build_tcp(*client, seq=141, flags=0x18, payload=client_hello_record[40:]),
+    ]
+    if reorder:
+        # Out of order and retransmitted segments
+        segments = [segments[2], segments[1], segments[0], segments[1]]
+    packets += segments
+    packets += [
+        build_tcp(*server, seq=501, flags=0x18, payload=server_hello_done_record),
+        build_tcp(*client, seq=101 + len(client_hello_record), flags=0x11),
+        build_tcp(*server, seq=501 + len(server_hello_done_record), flags=0x11),
+    ]
+    return packets
+
+
+class TestCaptureReader(object):
+    def test_pcap(self, tmpdir):
+        filename = tmpdir.join("test.pcap")
+        filename.write_binary(build_pcap(build_tcp_flow(reorder=False)))
+
+        with CaptureReader(str(filename)) as reader:
+            packets = [(packet.timestamp, packet.linktype, packet.data.tobytes()) for packet in reader]
+
+        assert len(packets) == 8
+        assert packets[0][0] == 1000.0
+        assert packets[0][1] == 1
+        assert packets[2][2].endswith(client_hello_record[:10])
+
+    def test_pcapng(self, tmpdir):
+        filename = tmpdir.join("test.pcapng")
+        filename.write_binary(build_pcapng(build_tcp_flow(reorder=False)))
+
+        with CaptureReader(str(filename)) as reader:
+            packets = [(packet.timestamp, packet.data.tobytes()) for packet in reader]
+
+        assert len(packets) == 8
+        assert packets[7][0] == 1007.0
+        assert packets[2][1].endswith(client_hello_record[:10])
+
+    def test_unsupported(self, tmpdir):
+        filename = tmpdir.join("test.txt")
+        filename.write_binary(b"This is not a capture")
+        with pytest.raises(ValueError):
+            CaptureReader(str(filename))
+
+
+class TestPcapWriter(object):
+    def test_write(self, tmpdir):
+        filename = str(tmpdir.join("test.pcap"))
+        with PcapWriter(filename) as writer:
+            writer.write_tcp(1000.5, "10.0.0.1", 50000, "10.0.0.2", 443, 100, TCP_SYN)
+            writer.write_udp(1001.0, "10.0.0.1", 50000, "10.0.0.2", 4433, dtls_client_hello_record)
+
+        with CaptureReader(filename) as reader:
+            packets = [(packet.timestamp, packet.data.tobytes()) for packet in reader]
+        assert len(packets) == 2
+        assert packets[0][0] == 1000.5
+        assert packets[0][1][14:] == build_tcp(CLIENT_ADDRESS, SERVER_ADDRESS, 50000, 443, seq=100, flags=TCP_SYN)[14:]
+
+        results = list(read_capture(filename))
+        assert len(results) == 1
+        (flow, direction, record) = results[0]
+        assert flow.server[1] == 4433
+        assert isinstance(record.payload, DTLSv10ClientHello)
+
+
+class TestTCPStream(object):
+    def test_reorder(self):
+        stream = TCPStream(max_buffer_size=100)
+        assert stream.add(99, b"", syn=True) == []
+        assert stream.add(105, b"fghij") == []
+        assert stream.buffer_size == 5
+        # Overlapping retransmission
+        assert b"".join(stream.add(100, b"abcdefg")) == b"abcdefghij"
+        assert stream.buffer_size == 0
+        assert stream.add(102, b"cdefghijkl") == [b"kl"]
+        assert stream.add(100, b"abc") == []
+
+    def test_sequence_wrap(self):
+        stream = TCPStream(max_buffer_size=100)
+        stream.add(0xfffffffd, b"", syn=True)
+        assert stream.add(0x00000001, b"cd") == []
+        assert b"".join(stream.add(0xfffffffe, b"ab1")) == b"ab1cd"
+        assert stream.next_seq == 3
+
+    def test_buffer_limit(self):
+        stream = TCPStream(max_buffer_size=10)
+        stream.add(0, b"", syn=True)
+        stream.add(10, b"x" * 11)
+        assert stream.failed
+        assert stream.add(1, b"abc") == []
+
+
+class TestFlowTracker(object):
+    def test_tcp(self, tmpdir):
+        filename = tmpdir.join("test.pcap")
+        filename.write_binary(build_pcap(build_tcp_flow()))
+
+        closed_flows = []
+        results = list(read_capture(str(filename), ports=[443], flow_closed_callback=closed_flows.append))
+        assert len(results) == 2
+
+        (flow, direction, record) = results[0]
+        assert direction == CLIENT
+        assert flow.client_address == "10.0.0.1"
+        assert flow.client[1] == 50000
+        assert flow.server_address == "10.0.0.2"
+        assert flow.server[1] == 443
+        assert isinstance(record.payload, ClientHello)
+
+        (flow, direction, record) = results[1]
+        assert direction == SERVER
+        assert isinstance(record.payload, ServerHelloDone)
+
+        assert closed_flows == [flow]
+        assert flow.packets == 9
+        assert flow.errors == [None, None]
+
+    def test_ports(self, tmpdir):
+        filename = tmpdir.join("test.pcapng")
+        filename.write_binary(build_pcapng(build_tcp_flow()))
+        assert list(read_capture(str(filename), ports=[8443])) == []
+
+    def test_max_flows(self):
+        closed_flows = []
+        tracker = FlowTracker(max_flows=2, flow_closed_callback=closed_flows.append)
+        for port in (50000, 50001, 50002):
+            packet = build_tcp(CLIENT_ADDRESS, SERVER_ADDRESS, port, 443, seq=100, flags=0x02)
+            tracker.process_packet(Packet(0.0, 1, memoryview(packet), 0))
+        assert len(tracker) == 2
+        assert len(closed_flows) == 1
+        assert closed_flows[0].client[1] == 50000
+
+    def test_tso(self):
+        tracker = FlowTracker()
+        packets = [
+            build_tcp(CLIENT_ADDRESS, SERVER_ADDRESS, 50000, 443, seq=100, flags=0x02),
+            build_tcp(CLIENT_ADDRESS, SERVER_ADDRESS, 50000, 443, seq=101, flags=0x18, payload=client_hello_record),
+        ]
+        # IPv4 total length 0 in packets captured before TCP segmentation offload
+        packets[1] = packets[1][:16] + b"\x00\x00" + packets[1][18:]
+        results = []
+        for packet in packets:
+            results += tracker.process_packet(Packet(0.0, 1, memoryview(packet), 0))
+        assert len(results) == 1
+        assert isinstance(results[0][2].payload, ClientHello)
+
+    def test_decode_error(self):
+        tracker = FlowTracker()
+        packets = [
+            build_tcp(CLIENT_ADDRESS, SERVER_ADDRESS, 50000, 443, seq=100, flags=0x02),
+            # Unknown content type
+            build_tcp(CLIENT_ADDRESS, SERVER_ADDRESS, 50000, 443, seq=101, flags=0x18, payload=b"\xff\x03\x01\x00\x01\x01"),
+            build_tcp(CLIENT_ADDRESS, SERVER_ADDRESS, 50000, 443, seq=107, flags=0x18, payload=client_hello_record),
+        ]
+        results = []
+        for packet in packets:
+            results += tracker.process_packet(Packet(0.0, 1, memoryview(packet), 0))
+        assert results == []
+        (key, flow) = next(iter(tracker._flows.items()))
+        assert flow.errors[CLIENT] is not None
+
+    def test_change_cipher_spec(self):
+        tracker = FlowTracker()
+        # Change Cipher Spec, encrypted Finished message and Application Data
+        data = server_hello_done_record + binascii.unhexlify(b"140303000101" + b"1603030010" + b"ab" * 16)
+        packets = [
+            build_tcp(SERVER_ADDRESS, CLIENT_ADDRESS, 443, 50000, seq=500, flags=0x12),
+            build_tcp(SERVER_ADDRESS, CLIENT_ADDRESS, 443, 50000, seq=501, flags=0x18, payload=data),
+            build_tcp(SERVER_ADDRESS, CLIENT_ADDRESS, 443, 50000, seq=501 + len(data), flags=0x18,
+                      payload=binascii.unhexlify(b"1703030004abababab")),
+        ]
+        results = []
+        for packet in packets:
+            results += tracker.process_packet(Packet(0.0, 1, memoryview(packet), 0))
+        assert len(results) == 2
+        (flow, direction, record) = results[0]
+        assert direction == SERVER
+        assert isinstance(record.payload, ServerHelloDone)
+        assert isinstance(results[1][2], ChangeCipherSpec)
+        assert flow.encrypted == [False, True]
+        assert flow.errors == [None, None]
+
+    def test_udp(self, tmpdir):
+        filename = tmpdir.join("test.pcap")
+        filename.write_binary(build_pcap([
+            build_udp(CLIENT_ADDRESS, SERVER_ADDRESS, 50000, 4433, dtls_client_hello_record)
+        ]))
+
+        results = list(read_capture(str(filename), ports=[4433]))
+        assert len(results) == 1
+        (flow, direction, record) = results[0]
+        assert direction == CLIENT
+        assert flow.server[1] == 4433
+        assert isinstance(record.payload, DTLSv10ClientHello)
+
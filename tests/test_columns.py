@@ -0,0 +1,93 @@
+import pytest
+
+import flextls
+from flextls.columns import Column, ColumnTable, HandshakeExporter, get_extension_bitmap
+from flextls.connection import SSLv30Connection
+from flextls.protocol import LAZY
+from flextls.protocol.handshake import ClientHello
+
+from tests.test_capture import client_hello_record
+from tests.test_ssl_3_0 import client_hello_01, prepare_handshake_data, server_certificate_01, server_hello_01
+from tests.test_ssl_3_0 import server_hello_done_01
+
+numpy = pytest.importorskip("numpy")
+
+
+def decode(exporter, data, payload_auto_decode=True):
+    conn = SSLv30Connection(
+        protocol_version=flextls.registry.version.SSLv3,
+        payload_auto_decode=payload_auto_decode,
+        record_sink=exporter
+    )
+    conn.decode(prepare_handshake_data(data))
+    return conn
+
+
+class TestColumnTable(object):
+    def test_chunks(self):
+        table = ColumnTable([Column("value", "u2", lambda message: message * 2)], chunk_size=3)
+        for i in range(7):
+            table.append(i)
+        assert len(table) == 7
+        assert len(table._chunks) == 2
+
+        array = table.to_array()
+        assert array.dtype.names == ("value",)
+        assert list(array["value"]) == [0, 2, 4, 6, 8, 10, 12]
+
+        table.clear()
+        assert len(table) == 0
+        assert len(table.to_array()) == 0
+
+    def test_save(self, tmpdir):
+        filename = str(tmpdir.join("test.npy"))
+        table = ColumnTable([Column("value", "u1", lambda message: message)])
+        table.append(5)
+        table.save(filename)
+        assert list(numpy.load(filename)["value"]) == [5]
+
+
+class TestHandshakeExporter(object):
+    @pytest.mark.parametrize("payload_auto_decode", [True, LAZY])
+    def test_connection(self, payload_auto_decode):
+        exporter = HandshakeExporter(chunk_size=2)
+        data = server_hello_01 + server_certificate_01 + server_hello_done_01
+        for i in range(3):
+            conn = decode(exporter, data, payload_auto_decode=payload_auto_decode)
+            # The records are passed to the sink
+            assert conn.is_empty()
+        decode(exporter, client_hello_01)
+
+        arrays = exporter.to_arrays()
+        server_hello = arrays["server_hello"]
+        assert len(server_hello) == 3
+        assert list(server_hello["cipher_suite"]) == [0x0039] * 3
+        assert server_hello[0]["version_major"] == 3
+        assert server_hello[0]["version_minor"] == 0
+        assert server_hello[0]["session_id_length"] == 32
+        assert server_hello[0]["extension_type_count"] == 1
+        # renegotiation_info is not part of the bitmap
+        assert server_hello[0]["extension_bitmap"] == 0
+
+        assert list(arrays["certificate"]["chain_length"]) == [1] * 3
+
+        client_hello = arrays["client_hello"]
+        assert len(client_hello) == 1
+        assert client_hello[0]["cipher_suite_count"] == 46
+        assert client_hello[0]["compression_method_count"] == 2
+
+    def test_save(self, tmpdir):
+        filename = str(tmpdir.join("test.npz"))
+        exporter = HandshakeExporter()
+        decode(exporter, server_hello_01)
+        exporter.save(filename, compressed=True)
+        with numpy.load(filename) as data:
+            assert sorted(data.files) == ["certificate", "client_hello", "server_hello"]
+            assert len(data["server_hello"]) == 1
+            assert len(data["certificate"]) == 0
+
+
+def test_extension_bitmap():
+    (message, data) = ClientHello.decode(client_hello_record[9:], payload_auto_decode=LAZY)
+    # server_name and ALPN
+    assert get_extension_bitmap(message) == (1 << 0) | (1 << 16)
@@ -0,0 +1,116 @@
+import io
+
+import pytest
+
+import flextls
+from flextls.capture import CLIENT, SERVER, read_capture
+from flextls.connection import DTLSv10Connection, SSLv30Connection
+from flextls.corpus import CorpusGenerator
+from flextls.protocol.handshake import ClientHello, DTLSv10ClientHello, ServerCertificate, ServerHello, \
+    ServerHelloDone, ServerKeyExchange
+
+
+def decode(connection, data_list):
+    for data in data_list:
+        connection.decode(data)
+    messages = []
+    while not connection.is_empty():
+        messages.append(connection.pop_record().payload)
+    return messages
+
+
+class TestCorpusGenerator(object):
+    def test_seed(self):
+        handshakes = list(CorpusGenerator(seed=1).iter_tls(3))
+        assert list(CorpusGenerator(seed=1).iter_tls(3)) == handshakes
+        assert list(CorpusGenerator(seed=2).iter_tls(3)) != handshakes
+
+    def test_tls(self):
+        generator = CorpusGenerator(seed=1, cipher_suite_count=(30, 30), chain_length=(2, 4))
+        for (client_data, server_data) in generator.iter_tls(10):
+            messages = decode(SSLv30Connection(flextls.registry.version.TLSv12), [client_data])
+            assert len(messages) == 1
+            assert isinstance(messages[0], ClientHello)
+            assert len(messages[0].cipher_suites) == 30
+
+            messages = decode(SSLv30Connection(flextls.registry.version.TLSv12), [server_data])
+            assert isinstance(messages[0], ServerHello)
+            assert isinstance(messages[1], ServerCertificate)
+            assert 2 <= len(messages[1].certificate_list) <= 4
+            assert isinstance(messages[-1], ServerHelloDone)
+            if len(messages) == 4:
+                assert isinstance(messages[2], ServerKeyExchange)
+                # Decoded with the cipher suite selected by the server
+                assert not isinstance(messages[2].payload, bytes)
+
+    def test_extensions(self):
+        generator = CorpusGenerator(seed=1, extension_types=[0x0000, 0x0010], extension_probability=1.0)
+        (client_messages, server_messages) = generator.create_handshake()
+        extensions = client_messages[0].extensions
+        assert [extension.type for extension in extensions] == [0x0000, 0x0010]
+        server_name = extensions[0].payload.server_name_list[0].payload.value
+        assert server_name in [name.encode("ascii") for name in generator.server_names]
+
+        generator = CorpusGenerator(seed=1, extension_probability=0.0)
+        (client_messages, server_messages) = generator.create_handshake()
+        assert len(client_messages[0].extensions) == 0
+
+        with pytest.raises(ValueError):
+            CorpusGenerator(extension_types=[0x1234])
+
+    def test_dtls(self):
+        generator = CorpusGenerator(seed=1, protocol_version=flextls.registry.version.DTLSv12)
+        (client_datagrams, server_datagrams) = next(generator.iter_dtls(1, fragment_size=100))
+        assert len(server_datagrams) > 10
+        for datagram in server_datagrams:
+            # Record header, handshake header and the fragment
+            assert len(datagram) <= 13 + 12 + 100
+
+        messages = decode(DTLSv10Connection(flextls.registry.version.DTLSv12), client_datagrams)
+        assert isinstance(messages[0], DTLSv10ClientHello)
+        messages = decode(DTLSv10Connection(flextls.registry.version.DTLSv12), server_datagrams)
+        assert isinstance(messages[0], ServerHello)
+        assert isinstance(messages[-1], ServerHelloDone)
+
+    def test_dtls_reorder(self):
+        generator = CorpusGenerator(seed=1, protocol_version=flextls.registry.version.DTLSv12)
+        (client_messages, server_messages) = generator.create_handshake()
+        datagrams = generator.encode_dtls(server_messages, fragment_size=100)
+        reordered = generator.encode_dtls(server_messages, fragment_size=100, reorder=True)
+        assert reordered != datagrams
+        assert sorted(reordered) == sorted(datagrams)
+
+    def test_write_raw(self):
+        client_file = io.BytesIO()
+        server_file = io.BytesIO()
+        CorpusGenerator(seed=1).write_raw(client_file, server_file, 5)
+        messages = decode(SSLv30Connection(flextls.registry.version.TLSv12), [client_file.getvalue()])
+        assert len(messages) == 5
+
+        generator = CorpusGenerator(protocol_version=flextls.registry.version.DTLSv12)
+        with pytest.raises(ValueError):
+            generator.write_raw(client_file, server_file, 1)
+
+    @pytest.mark.parametrize("reorder", [False, True])
+    def test_write_pcap(self, tmpdir, reorder):
+        filename = str(tmpdir.join("test.pcap"))
+        CorpusGenerator(seed=1).write_pcap(filename, 5, segment_size=200, reorder=reorder)
+
+        closed_flows = []
+        results = list(read_capture(filename, ports=[443], flow_closed_callback=closed_flows.append))
+        assert len(closed_flows) == 5
+        for flow in closed_flows:
+            assert flow.errors == [None, None]
+        assert len([record for (flow, direction, record) in results if direction == CLIENT]) == 5
+        server_messages = [record.payload for (flow, direction, record) in results if direction == SERVER]
+        assert len([message for message in server_messages if isinstance(message, ServerHelloDone)]) == 5
+
+    def test_write_pcap_dtls(self, tmpdir):
+        filename = str(tmpdir.join("test.pcap"))
+        generator = CorpusGenerator(seed=1, protocol_version=flextls.registry.version.DTLSv12)
+        generator.write_pcap(filename, 3, fragment_size=300, port=4433)
+
+        results = list(read_capture(filename, ports=[4433]))
+        messages = [record.payload for (flow, direction, record) in results]
+        assert len([message for message in messages if isinstance(message, DTLSv10ClientHello)]) == 3
+        assert len([message for message in messages if isinstance(message, ServerHelloDone)]) == 3
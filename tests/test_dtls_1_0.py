@@ -1,12 +1,14 @@
 import binascii
+import hashlib
 
 import pytest
 
 import flextls
+from flextls.cache import DecodeCache
 from flextls.connection import DTLSv10Connection
 from flextls.exception import NotEnoughData
 from flextls.protocol.handshake import DTLSv10Handshake
-from flextls.protocol.handshake import ServerCertificate
+from flextls.protocol.handshake import ServerCertificate, ServerHelloDone
 from flextls.protocol.record import Record, DTLSv10Record
 
 
@@ -98,9 +100,9 @@ class TestCertificate(object):
         # Fragment Offset 0 Fragment Length
         data_splited = [self._cert[i:i + n] for i in range(0, len(self._cert), n)]
         for i, part in enumerate(data_splited):
-            tmp = "%.6x%.6x" % (i * n / 2, len(part) / 2)
+            tmp = "%.6x%.6x" % (i * n // 2, len(part) // 2)
             cert_data = cert_header + tmp.encode('ascii') + part
-            tmp = "%.4x" % (len(cert_data) / 2)
+            tmp = "%.4x" % (len(cert_data) // 2)
             data = record_header + tmp.encode('ascii') + cert_data
             conn_dtls.decode(binascii.unhexlify(data))
 
@@ -110,6 +112,69 @@ class TestCertificate(object):
         assert isinstance(record, DTLSv10Handshake)
         assert isinstance(record.payload, ServerCertificate)
 
+    def test_incomplete_no_exception(self, monkeypatch):
+        def not_enough_data(self, *args):
+            raise AssertionError("NotEnoughData raised")
+
+        monkeypatch.setattr(NotEnoughData, "__init__", not_enough_data)
+        conn_dtls = DTLSv10Connection(
+            protocol_version=flextls.registry.version.DTLSv10
+        )
+        # Handshake, DTLSv1.0, Epoch 0, Sequence Number 2, Length 696
+        data = binascii.unhexlify(b"16feff000000000000000202b8" + b"0b0002ac00000000000002ac" + self._cert)
+        conn_dtls.decode(data[:5])
+        conn_dtls.decode(data[:-1])
+        assert conn_dtls.is_empty()
+        conn_dtls.decode(data)
+        assert isinstance(conn_dtls.pop_record().payload, ServerCertificate)
+
+    def test_transcript(self):
+        record_header = b"16feff0000000000000002"
+        cert_header = b"0b0002ac0002"
+
+        conn_dtls = DTLSv10Connection(
+            protocol_version=flextls.registry.version.DTLSv10,
+            transcript_hash_algorithms=("sha256",)
+        )
+        conn_dtls._handshake_next_receive_seq = 2
+
+        n = 200
+        data_splited = [self._cert[i:i + n] for i in range(0, len(self._cert), n)]
+        for i, part in enumerate(data_splited):
+            tmp = "%.6x%.6x" % (i * n // 2, len(part) // 2)
+            cert_data = cert_header + tmp.encode('ascii') + part
+            tmp = "%.4x" % (len(cert_data) // 2)
+            data = record_header + tmp.encode('ascii') + cert_data
+            conn_dtls.decode(binascii.unhexlify(data))
+
+        # Certificate, Length 684, Message Sequence 2, Fragment Offset 0, Fragment Length 684
+        data = binascii.unhexlify(b"0b0002ac00020000000002ac" + self._cert)
+        assert conn_dtls.transcript.digest("sha256") == hashlib.sha256(data).digest()
+
+    def test_decode_cache(self):
+        # Handshake, DTLSv1.0, Epoch 0, Sequence Number 2, Length 696
+        data = b"16feff000000000000000202b8"
+        # Certificate, Length 684, Message Sequence 0, Fragment Offset 0, Fragment Length 684
+        data += b"0b0002ac00000000000002ac"
+        data += self._cert
+
+        cache = DecodeCache()
+        records = []
+        for i in range(2):
+            conn_dtls = DTLSv10Connection(
+                protocol_version=flextls.registry.version.DTLSv10,
+                decode_cache=cache
+            )
+            conn_dtls.decode(binascii.unhexlify(data))
+            records.append(conn_dtls.pop_record())
+
+        assert cache.hits == 1
+        assert records[0] is not records[1]
+        assert records[0].payload is not records[1].payload
+        assert records[1].payload._connection is conn_dtls
+        assert records[0].payload.encode() == records[1].payload.encode()
+        assert len(records[1].payload.certificate_list[0].value) == 678
+
 
 class TestClientHello(object):
 
@@ -385,6 +450,31 @@ class TestServerHelloDone(object):
         assert handshake.fragment_offset == 0
         assert handshake.fragment_length == 0
 
+    def test_record_sink(self):
+        def record_sink(record):
+            raise NotEnoughData("Raised by the sink")
+
+        conn = DTLSv10Connection(
+            protocol_version=flextls.registry.version.DTLSv10,
+            record_sink=record_sink
+        )
+        # Handshake, DTLSv1.0, Epoch 0, Sequence Number 0, Length 12
+        # Server Hello Done, Length 0, Message Sequence 0, Fragment Offset 0, Fragment Length 0
+        data = b"16feff0000000000000000000c0e0000000000000000000000"
+        # Exceptions of the sink are not handled as incomplete data
+        with pytest.raises(NotEnoughData):
+            conn.decode(binascii.unhexlify(data))
+
+    def test_encode(self):
+        handshake = DTLSv10Handshake() + ServerHelloDone()
+        handshake.message_seq = 4
+        data = handshake.encode()
+        assert binascii.hexlify(data) == b"0e0000000004000000000000"
+        assert handshake.encode() is data
+
+        handshake.message_seq = 5
+        assert binascii.hexlify(handshake.encode()) == b"0e0000000005000000000000"
+
 
 class TestServerKeyExchange(object):
     def test_pkg1(self):
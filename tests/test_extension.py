@@ -1,8 +1,13 @@
 import binascii
 
+import pytest
+
 from flextls.protocol.record import Record
 from flextls.protocol.handshake.extension import Extension, SessionTicketTLS, ServerNameIndication, ApplicationLayerProtocolNegotiation, NextProtocolNegotiation
+from flextls.protocol.handshake.extension import SignatureAlgorithms
 from flextls.field import ServerNameField, HostNameField, VectorUInt8Field
+from flextls.protocol import LAZY, DecodeProfile
+from flextls.protocol.handshake import Handshake
 
 
 class TestApplicationLayerProtocolNegotiation(object):
@@ -45,6 +50,16 @@ class TestApplicationLayerProtocolNegotiation(object):
         assert obj.payload.protocol_name_list[1].value == b"spdy/2"
         assert obj.payload.protocol_name_list[2].value == b"http/1.1"
 
+    def test_decode_profile(self):
+        data = binascii.unhexlify(self._get_data())
+
+        profile = DecodeProfile()
+        profile.add_rule(Extension, 0x0010, False)
+        (obj, tmp_data) = Extension.decode(data, payload_auto_decode=profile)
+        assert tmp_data == b""
+        assert obj.type == 0x0010
+        assert obj.payload == data[4:]
+
 
 class TestNextProtocolNegotiation(object):
     @staticmethod
@@ -160,3 +175,158 @@ class TestServerNameIndication(object):
         assert isinstance(obj.payload, ServerNameIndication)
         assert len(obj.payload.server_name_list) == 1
         assert obj.payload.server_name_list[0].payload.value == b"example.org"
+
+
+class TestSignatureAlgorithms(object):
+    def test_decode(self):
+        # Type: signature_algorithms, Length: 6, Algorithms Length: 4
+        # ecdsa_secp256r1_sha256, rsa_pkcs1_sha256
+        data = binascii.unhexlify(b"000d000600040403" + b"0401")
+        (record, data) = Extension.decode(data)
+        assert isinstance(record.payload, SignatureAlgorithms)
+        algorithms = record.payload.supported_signature_algorithms
+        assert [(item.hash, item.signature) for item in algorithms] == [(4, 3), (4, 1)]
+        assert record.encode() == binascii.unhexlify(b"000d0006000404030401")
+
+
+class TestEncodeCache(object):
+    @pytest.mark.parametrize("data", [
+        # ALPN, NPN
+        TestApplicationLayerProtocolNegotiation._get_data(),
+        TestNextProtocolNegotiation._get_data(),
+        # SessionTicket TLS, empty and Length: 6, Ticket Length: 4
+        b"00230000",
+        b"00230006000461626364",
+        # Server Name, empty and Host Name: example.org
+        b"00000000",
+        b"00000010000e00000b6578616d706c652e6f7267",
+        # Signature Algorithms: ecdsa_secp256r1_sha256, rsa_pkcs1_sha256
+        b"000d0006000404030401",
+        # Heartbeat: peer_allowed_to_send
+        b"000f000101",
+        # Elliptic Curves: secp256r1, secp384r1
+        b"000a0006000400170018",
+        # EC Point Formats: uncompressed
+        b"000b00020100",
+    ])
+    def test_decoded(self, data):
+        data = binascii.unhexlify(data)
+        (obj, tmp_data) = Extension.decode(data)
+        assert not isinstance(obj.payload, bytes)
+        assert not obj.is_dirty()
+        assert not obj.payload.is_dirty()
+        assert obj.encode() == data
+        assert obj.payload.encode() == data[4:]
+        assert not obj.is_dirty()
+
+    def test_change_next_protocol(self):
+        (obj, tmp_data) = Extension.decode(binascii.unhexlify(TestNextProtocolNegotiation._get_data()))
+        obj.payload.payload[0].value = b"h3"
+        assert obj.is_dirty()
+        assert obj.encode()[4:7] == b"\x02h3"
+        assert not obj.is_dirty()
+
+        obj.payload.payload.reverse()
+        assert obj.is_dirty()
+
+
+class TestExtensionIndex(object):
+    @staticmethod
+    def _get_data():
+        # Client Hello, Length 83, TLS 1.2, Random, Session ID Length: 0
+        data = b"010000530303" + b"00" * 32 + b"00"
+        # Cipher Suites Length: 2, Cipher Suite: 0x002f, Compression Methods Length: 1, Compression Method: null
+        data += b"0002002f0100"
+        # Extensions Length: 40
+        data += b"0028"
+        # Type: server_name, Length: 14, Host Name: localhost
+        data += b"0000000e000c0000096c6f63616c686f7374"
+        # Type: SessionTicket TLS, Length: 0
+        data += b"00230000"
+        # Type: ALPN, Length: 14, Protocols: h2, http/1.1
+        data += b"0010000e000c02683208687474702f312e31"
+        return binascii.unhexlify(data)
+
+    def test_index(self):
+        (obj, data) = Handshake.decode(self._get_data())
+        client_hello = obj.payload
+        field = client_hello.get_field("extensions")
+        assert field.get_index() == {
+            0x0000: (0, 18),
+            0x0023: (18, 4),
+            0x0010: (22, 18)
+        }
+
+        extension = client_hello.get_extension(0x0010)
+        assert extension is client_hello.extensions[2]
+        assert extension.payload.protocol_name_list[1].value == b"http/1.1"
+        assert client_hello.get_extension(0x000d) is None
+
+    def test_lazy(self):
+        data = self._get_data()
+        (obj, tmp_data) = Handshake.decode(data, payload_auto_decode=LAZY)
+        client_hello = obj.payload
+        field = client_hello.get_field("extensions")
+
+        extension = client_hello.get_extension(0x0000)
+        assert extension.payload.server_name_list[0].payload.value == b"localhost"
+        assert client_hello.get_extension(0x0000) is extension
+        assert client_hello.get_extension(0x000d) is None
+        # Only the requested extension has been decoded
+        assert field._raw_items is not None
+        assert not obj.is_dirty()
+
+        # Decode all items and use the decoded extension
+        assert client_hello.extensions[0] is extension
+        assert client_hello.extensions[1].type == 0x0023
+        assert obj.encode() == data
+
+    def test_lazy_change(self):
+        (obj, tmp_data) = Handshake.decode(self._get_data(), payload_auto_decode=LAZY)
+        client_hello = obj.payload
+
+        extension = client_hello.get_extension(0x0023)
+        extension.payload.data = b"ticket"
+        assert obj.is_dirty()
+
+        (obj, tmp_data) = Handshake.decode(obj.encode())
+        assert obj.payload.get_extension(0x0023).payload.data == b"ticket"
+        assert obj.payload.get_extension(0x0010).length == 14
+
+    def test_change_encoded(self):
+        data = self._get_data()
+        (obj, tmp_data) = Handshake.decode(data)
+        extension = obj.payload.extensions[2]
+        extension.payload.protocol_name_list[0].value = b"h3"
+        # Encoding the extension on its own must not hide the change
+        encoded = extension.encode()
+        assert obj.is_dirty()
+        assert encoded in obj.encode()
+
+        (obj, tmp_data) = Handshake.decode(data, payload_auto_decode=LAZY)
+        extension = obj.payload.get_extension(0x0010)
+        extension.payload.protocol_name_list[0].value = b"h3"
+        extension.encode()
+        assert obj.is_dirty()
+        assert obj.payload.extensions[2] is extension
+        assert obj.is_dirty()
+        assert encoded in obj.encode()
+
+    def test_types(self):
+        for payload_auto_decode in (True, LAZY):
+            (obj, tmp_data) = Handshake.decode(self._get_data(), payload_auto_decode=payload_auto_decode)
+            field = obj.payload.get_field("extensions")
+            assert sorted(field.get_types()) == [0x0000, 0x0010, 0x0023]
+            assert (field._raw_items is not None) == (payload_auto_decode is LAZY)
+
+        field.items = field.items[:1] * 2
+        assert field.get_types() == [0x0000]
+
+    def test_set_items(self):
+        (obj, tmp_data) = Handshake.decode(self._get_data())
+        client_hello = obj.payload
+        field = client_hello.get_field("extensions")
+        field.items = field.items[1:]
+        assert field.get_index() is None
+        assert client_hello.get_extension(0x0000) is None
+        assert client_hello.get_extension(0x0010).type == 0x0010
@@ -1,7 +1,10 @@
+import pickle
+
 import pytest
 
 from flextls.exception import *
 from flextls.field import *
+from flextls.protocol import LAZY
 
 
 class TestNumberFields(object):
@@ -238,4 +241,82 @@ class TestEnumFields(object):
             f.dissect(b"")
 
         with pytest.raises(NotEnoughData):
-            f.dissect(b"\x00")
\ No newline at end of file
+            f.dissect(b"\x00")
+
+
+class TestVectorFields(object):
+    def test_vectorlistuint16field(self):
+        f = CipherSuitesField("test")
+        assert f.dissect(b"\x00\x04\x00\x39\x00\x35\x99") == b"\x99"
+        assert len(f.items) == 2
+        assert f.items[0].value == 0x0039
+        assert f.assemble() == b"\x00\x04\x00\x39\x00\x35"
+
+        with pytest.raises(NotEnoughData):
+            f.dissect(b"\x00\x04\x00\x39")
+
+    def test_vectorlistuint16field_lazy(self):
+        f = CipherSuitesField("test")
+        data = memoryview(b"\x00\x04\x00\x39\x00\x35\x99")
+        assert f.dissect(data, payload_auto_decode=LAZY) == b"\x99"
+        assert f._raw_items is not None
+        assert len(f.items) == 2
+        assert f._raw_items is None
+        assert f.items[1].value == 0x0035
+
+    def test_item_count(self):
+        f = CipherSuitesField("test")
+        f.dissect(memoryview(b"\x00\x04\x00\x39\x00\x35"), payload_auto_decode=LAZY)
+        assert f.get_item_count(item_size=2) == 2
+        # Not decoded
+        assert f._raw_items is not None
+        assert f.get_item_count() == 2
+        assert f._raw_items is None
+        f.items.append(CipherSuiteField())
+        assert f.get_item_count(item_size=2) == 3
+
+    def test_vectoruint8field_lazy(self):
+        f = VectorUInt8Field("test")
+        assert f.dissect(memoryview(b"\x02ab\x99"), payload_auto_decode=LAZY) == b"\x99"
+        assert isinstance(f.value, bytes)
+        assert f.value == b"ab"
+        assert f.assemble() == b"\x02ab"
+
+    def test_pickle(self):
+        f = CipherSuitesField("test")
+        f.dissect(memoryview(b"\x00\x04\x00\x39\x00\x35"), payload_auto_decode=LAZY)
+        tmp = pickle.loads(pickle.dumps(f))
+        assert tmp._raw_items is not None
+        assert not tmp.is_dirty()
+        assert [item.value for item in tmp.items] == [0x0039, 0x0035]
+
+        f.items.append(CipherSuiteField())
+        f.items[2].value = 0x002f
+        tmp = pickle.loads(pickle.dumps(f))
+        assert tmp.is_dirty()
+        assert tmp.assemble() == b"\x00\x06\x00\x39\x00\x35\x00\x2f"
+
+        f = VectorUInt8Field("test")
+        f.dissect(memoryview(b"\x02ab"), payload_auto_decode=LAZY)
+        tmp = pickle.loads(pickle.dumps(f))
+        assert tmp.value == b"ab"
+        assert not tmp.is_dirty()
+
+
+class TestMultiPartFields(object):
+    def test_ec_parameters(self):
+        f = ServerECDHParamsField("params")
+        # named_curve: secp256r1, Point Length: 3
+        data = b"\x03\x00\x17\x03\x04\x01\x02"
+        assert f.dissect(data) == b""
+        assert f.curve_params.namedcurve == 0x0017
+        assert f.assemble() == data
+
+    def test_pickle(self):
+        f = ServerNameField("server_name")
+        f.dissect(b"\x00\x00\x0bexample.org")
+        tmp = pickle.loads(pickle.dumps(f))
+        assert tmp.name == "server_name"
+        assert tmp.payload.value == b"example.org"
+        assert not tmp.is_dirty()
+        assert tmp.assemble() == b"\x00\x00\x0bexample.org"
@@ -0,0 +1,127 @@
+import binascii
+
+import pytest
+
+from flextls.capture import CLIENT, IPPROTO_TCP, SERVER, Flow, TCPStream
+from flextls.index import NO_HANDSHAKE_TYPE, IndexReader, RecordIndexer, build_index
+from flextls.protocol.handshake import ClientHello, DTLSv10ClientHello, ServerHelloDone
+
+from tests.test_capture import CLIENT_ADDRESS, SERVER_ADDRESS, build_pcap, build_pcapng, build_tcp, build_tcp_flow
+from tests.test_capture import build_udp, client_hello_record, dtls_client_hello_record, server_hello_done_record
+
+# Change Cipher Spec, encrypted Finished message
+server_finished = binascii.unhexlify(b"140303000101" + b"1603030010" + b"ab" * 16)
+
+
+def build_capture():
+    packets = build_tcp_flow()
+    client = (CLIENT_ADDRESS, SERVER_ADDRESS, 50001, 443)
+    server = (SERVER_ADDRESS, CLIENT_ADDRESS, 443, 50001)
+    packets += [
+        build_tcp(*client, seq=1000, flags=0x02),
+        build_tcp(*server, seq=5000, flags=0x12),
+        build_tcp(*client, seq=1001, flags=0x18, payload=client_hello_record),
+        build_tcp(*server, seq=5001, flags=0x18, payload=server_hello_done_record + server_finished[:8]),
+        build_tcp(*server, seq=5010 + 8, flags=0x18, payload=server_finished[8:]),
+        build_udp(CLIENT_ADDRESS, SERVER_ADDRESS, 50000, 4433, dtls_client_hello_record),
+    ]
+    return packets
+
+
+class TestIndex(object):
+    @pytest.mark.parametrize("build", [build_pcap, build_pcapng])
+    def test_index(self, tmpdir, build):
+        capture_filename = str(tmpdir.join("test.pcap"))
+        index_filename = str(tmpdir.join("test.pcap.idx"))
+        with open(capture_filename, "wb") as f:
+            f.write(build(build_capture()))
+
+        assert build_index(capture_filename, index_filename) == (3, 9, 7)
+
+        with IndexReader(capture_filename, index_filename) as reader:
+            assert len(reader) == 7
+            assert reader.flows[1] == (6, ("10.0.0.1", 50001), ("10.0.0.2", 443))
+
+            entries = list(reader.find_records(handshake_type=1))
+            assert [entry.flow_id for entry in entries] == [0, 1, 2]
+            for entry in entries:
+                assert entry.direction == CLIENT
+                assert entry.stream_offset == 0
+
+            # Segments received out of order
+            record = reader.decode_record(entries[0])
+            assert isinstance(record.payload.payload, ClientHello)
+            assert reader.read_record(entries[0]) == client_hello_record
+
+            record = reader.decode_record(entries[2])
+            assert isinstance(record.payload.payload, DTLSv10ClientHello)
+
+            entries = list(reader.find_records(flow_id=1, direction=SERVER))
+            assert [(entry.content_type, entry.handshake_type) for entry in entries] == [
+                (22, 14),
+                (20, NO_HANDSHAKE_TYPE),
+                (22, NO_HANDSHAKE_TYPE),
+            ]
+            assert entries[1].stream_offset == len(server_hello_done_record)
+
+            record = reader.decode_record(entries[0])
+            assert isinstance(record.payload.payload, ServerHelloDone)
+            # Record in two segments
+            assert reader.read_record(entries[2]) == server_finished[6:]
+
+            assert list(reader.find_records(flow_id=3)) == []
+
+    def test_invalid(self, tmpdir):
+        capture_filename = str(tmpdir.join("test.pcap"))
+        index_filename = str(tmpdir.join("test.pcap.idx"))
+        with open(capture_filename, "wb") as f:
+            f.write(build_pcap(build_capture()))
+        with open(index_filename, "wb") as f:
+            f.write(b"\x00" * 100)
+
+        with pytest.raises(ValueError):
+            IndexReader(capture_filename, index_filename)
+
+    def test_stream_offset_wrap(self):
+        indexer = RecordIndexer()
+        flow = Flow(IPPROTO_TCP, (b"\x0a\x00\x00\x01", 50001), (b"\x0a\x00\x00\x02", 443), flow_id=1)
+        flow.streams[CLIENT] = TCPStream(1024)
+        flow.streams[CLIENT].initial_seq = 0xfffffff0
+        offsets = [i * 0x7fff0000 for i in range(6)]
+        for (i, offset) in enumerate(offsets):
+            indexer._add_payload(flow, CLIENT, (0xfffffff0 + offset) & 0xffffffff, b"\x00" * 100, i * 100)
+            if i == 0:
+                # Retransmission of data before the initial sequence number
+                indexer._add_payload(flow, CLIENT, 0xffffffe0, b"\x00" * 100, 1000)
+        # Retransmission of old data after the wrap
+        indexer._add_payload(flow, CLIENT, (0xfffffff0 + offsets[4]) & 0xffffffff, b"\x00" * 100, 1100)
+        assert [int(offset) for offset in indexer._segments[2]] == offsets + [offsets[4]]
+        assert offsets[-1] > 0xffffffff
+
+    def test_record_without_segment(self, tmpdir):
+        capture_filename = str(tmpdir.join("test.pcap"))
+        index_filename = str(tmpdir.join("test.pcap.idx"))
+        with open(capture_filename, "wb") as f:
+            f.write(build_pcap(build_capture()))
+
+        indexer = RecordIndexer()
+        flows = [
+            Flow(IPPROTO_TCP, (b"\x0a\x00\x00\x01", 50000 + i), (b"\x0a\x00\x00\x02", 443), flow_id=i)
+            for i in range(3)
+        ]
+        for flow in flows:
+            flow.streams[CLIENT] = TCPStream(1024)
+            flow.streams[CLIENT].initial_seq = 1000
+        indexer._add_payload(flows[1], CLIENT, 1000, b"\x00" * 100, 5000)
+        indexer._add_payload(flows[1], CLIENT, 1100, b"\x00" * 100, 6000)
+        for (flow, direction, stream_offset) in [(flows[0], CLIENT, 0), (flows[1], CLIENT, 150),
+                                                 (flows[1], CLIENT, 250), (flows[1], SERVER, 0),
+                                                 (flows[2], CLIENT, 0)]:
+            indexer._add_record(flow, direction, stream_offset, 22, 1)
+
+        assert indexer.write(index_filename) == (1, 2, 1)
+        with IndexReader(capture_filename, index_filename) as reader:
+            entries = list(reader.find_records())
+            assert [(entry.flow_id, entry.stream_offset, entry.capture_offset) for entry in entries] == [
+                (1, 150, 6050)
+            ]
@@ -0,0 +1,77 @@
+import binascii
+
+import pytest
+
+import flextls
+from flextls import instrumentation
+from flextls.connection import SSLv30Connection
+from flextls.exception import NotEnoughData
+from flextls.protocol import Protocol
+from flextls.protocol.handshake import Handshake, ServerHelloDone
+
+from tests.test_ssl_3_0 import prepare_handshake_data, prepare_handshake_data_split, server_certificate_01, \
+    server_hello_01, server_hello_done_01
+
+
+@pytest.fixture
+def enabled():
+    instrumentation.reset()
+    instrumentation.enable()
+    yield
+    instrumentation.disable()
+    instrumentation.reset()
+
+
+class TestInstrumentation(object):
+    def test_disabled(self):
+        decode = Protocol.__dict__["decode"]
+        instrumentation.enable()
+        assert instrumentation.is_enabled()
+        assert Protocol.__dict__["decode"] is not decode
+        instrumentation.disable()
+        assert not instrumentation.is_enabled()
+        assert Protocol.__dict__["decode"] is decode
+        assert SSLv30Connection.decode is SSLv30Connection.__mro__[1].__dict__["decode"]
+
+    def test_protocol(self, enabled):
+        data = binascii.unhexlify(server_hello_01)
+        (record, tmp_data) = Handshake.decode(data)
+        assert record.payload.cipher_suite == 0x0039
+        record.encode()
+        with pytest.raises(NotEnoughData):
+            Handshake.decode(data[:10])
+
+        metrics = instrumentation.snapshot()["classes"]
+        assert metrics["Handshake"]["decode"]["calls"] == 2
+        assert metrics["Handshake"]["decode"]["bytes"] == len(data)
+        assert metrics["Handshake"]["decode"]["incomplete"] == 1
+        assert metrics["Handshake"]["decode_payload"]["bytes"] == len(data) - 4
+        assert metrics["ServerHello"]["decode"]["calls"] == 1
+        assert metrics["ServerHello"]["decode"]["bytes"] == len(data) - 4
+        assert metrics["Handshake"]["encode"]["bytes"] == len(data)
+        assert metrics["Handshake"]["decode"]["time"] >= metrics["ServerHello"]["decode"]["time"]
+
+        instrumentation.reset()
+        assert instrumentation.snapshot() == {"classes": {}, "connections": {}}
+
+    def test_connection(self, enabled):
+        conn = SSLv30Connection(protocol_version=flextls.registry.version.SSLv3)
+        data_list = prepare_handshake_data_split(server_hello_01 + server_certificate_01 + server_hello_done_01, 200)
+        for data in data_list:
+            conn.decode(data)
+
+        stats = instrumentation.get_connection_stats(conn)
+        assert stats["calls"] == len(data_list)
+        assert stats["bytes"] == sum([len(data) for data in data_list])
+        assert stats["records"] == 3
+        assert stats["incomplete"] > 0
+
+        metrics = instrumentation.snapshot()
+        assert metrics["connections"]["SSLv30Connection"]["decode"]["calls"] == len(data_list)
+        assert metrics["classes"]["ServerCertificate"]["decode"]["calls"] == 1
+
+        other_conn = SSLv30Connection(protocol_version=flextls.registry.version.SSLv3)
+        other_conn.decode(prepare_handshake_data(server_hello_done_01))
+        assert instrumentation.get_connection_stats(other_conn)["records"] == 1
+        assert instrumentation.get_connection_stats(conn)["records"] == 3
+        assert isinstance(other_conn.pop_record().payload, ServerHelloDone)
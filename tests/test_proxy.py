@@ -0,0 +1,128 @@
+import asyncio
+import binascii
+
+import pytest
+
+from flextls.proxy import LatencyHistogram, RoutingTable, SNIProxy
+
+# Client Hello, Length 70, TLS 1.2, Random, Session ID Length: 0
+client_hello_01 = b"010000460303" + b"00" * 32 + b"00"
+# Cipher Suites Length: 2, Cipher Suite: 0x002f, Compression Methods Length: 1, Compression Method: null
+client_hello_01 += b"0002002f0100"
+# Extensions Length: 27
+client_hello_01 += b"001b"
+# Type: server_name, Length: 14, Host Name: localhost
+client_hello_01 += b"0000000e000c0000096c6f63616c686f7374"
+# Type: ALPN, Length: 5, Protocols: h2
+client_hello_01 += b"001000050003026832"
+
+
+def prepare_record(data):
+    # Handshake, TLS 1.0
+    return binascii.unhexlify(b"160301" + ("%.4x" % (len(data) // 2)).encode("ascii") + data)
+
+
+async def echo(reader, writer):
+    while True:
+        data = await reader.read(4096)
+        if not data:
+            break
+        writer.write(data)
+        await writer.drain()
+    writer.close()
+
+
+async def start_proxy(routing_table):
+    backend = await asyncio.start_server(echo, "127.0.0.1", 0)
+    backend_port = backend.sockets[0].getsockname()[1]
+    for route in routing_table.get_routes():
+        route.port = backend_port
+
+    proxy = SNIProxy(routing_table, hello_timeout=1.0)
+    server = await proxy.start("127.0.0.1", 0)
+    return (backend, proxy, server.sockets[0].getsockname()[1])
+
+
+class TestRoutingTable(object):
+    def test_get_route(self):
+        routing_table = RoutingTable()
+        route_default = routing_table.add_route(None, "127.0.0.1", 1)
+        route_name = routing_table.add_route("Example.org", "127.0.0.1", 2)
+        route_h2 = routing_table.add_route(b"example.org", "127.0.0.1", 3, protocol=b"h2")
+        route_wildcard = routing_table.add_route("*.example.org", "127.0.0.1", 4)
+
+        assert routing_table.get_route([b"example.org"], []) is route_name
+        assert routing_table.get_route([b"EXAMPLE.ORG."], [b"http/1.1"]) is route_name
+        assert routing_table.get_route([b"example.org"], [b"h2"]) is route_h2
+        assert routing_table.get_route([b"www.sub.example.org"], []) is route_wildcard
+        assert routing_table.get_route([b"example.com"], []) is route_default
+        assert routing_table.get_route([], []) is route_default
+        assert len(routing_table.get_routes()) == 4
+
+
+class TestLatencyHistogram(object):
+    def test_add(self):
+        histogram = LatencyHistogram(bounds=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.add(value)
+        result = histogram.snapshot()
+        assert result["counts"] == [2, 1, 1]
+        assert result["count"] == 4
+        histogram.reset()
+        assert histogram.snapshot()["count"] == 0
+
+
+class TestSNIProxy(object):
+    def test_forward(self):
+        async def run():
+            routing_table = RoutingTable()
+            route = routing_table.add_route("localhost", "127.0.0.1", 0)
+            (backend, proxy, port) = await start_proxy(routing_table)
+
+            (reader, writer) = await asyncio.open_connection("127.0.0.1", port)
+            hello = prepare_record(client_hello_01)
+            # Send the ClientHello in two parts
+            writer.write(hello[:20])
+            await writer.drain()
+            writer.write(hello[20:] + b"data")
+            writer.write_eof()
+            data = await reader.read()
+            writer.close()
+
+            await proxy.stop()
+            backend.close()
+            return (data, route.snapshot(), proxy.snapshot())
+
+        (data, route_stats, proxy_stats) = asyncio.run(run())
+        assert data == prepare_record(client_hello_01) + b"data"
+        assert route_stats["connections"] == 1
+        assert route_stats["active_connections"] == 0
+        assert route_stats["bytes_from_client"] == len(data)
+        assert route_stats["bytes_from_server"] == len(data)
+        assert route_stats["setup_latency"]["count"] == 1
+        assert proxy_stats["rejected_connections"] == 0
+
+    @pytest.mark.parametrize("data", [
+        # No route for the server name
+        prepare_record(client_hello_01.replace(b"6c6f63616c686f7374", b"6c6f63616c686f7373")),
+        # Not a TLS connection
+        b"GET / HTTP/1.0\r\n\r\n",
+    ])
+    def test_reject(self, data):
+        async def run():
+            routing_table = RoutingTable()
+            routing_table.add_route("localhost", "127.0.0.1", 0)
+            (backend, proxy, port) = await start_proxy(routing_table)
+
+            (reader, writer) = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(data)
+            result = await reader.read()
+            writer.close()
+
+            await proxy.stop()
+            backend.close()
+            return (result, proxy.snapshot())
+
+        (result, proxy_stats) = asyncio.run(run())
+        assert result == b""
+        assert proxy_stats["rejected_connections"] == 1
@@ -0,0 +1,134 @@
+import binascii
+import hashlib
+
+import pytest
+
+from flextls.exception import NotEnoughData
+from flextls.protocol.handshake import Handshake
+from flextls.protocol.handshake.raw import extract_client_hello_fingerprint, extract_client_hello_fingerprints
+from flextls.protocol.handshake.raw import get_fingerprint_digest, get_fingerprint_string, peek_client_hello
+
+# Client Hello, Length 107
+client_hello_01 = b"0100006b"
+# Version: TLS 1.2
+client_hello_01 += b"0303"
+# Random
+client_hello_01 += b"00" * 32
+# Session ID Length: 0
+client_hello_01 += b"00"
+# Length: 8, Cipher Suites: GREASE, 0xc02b, 0xc02f, 0x002f
+client_hello_01 += b"00080a0ac02bc02f002f"
+# Length: 1, Compression Method: null
+client_hello_01 += b"0100"
+# Extensions Length: 58
+client_hello_01 += b"003a"
+# Type: GREASE, Length: 0
+client_hello_01 += b"1a1a0000"
+# Type: server_name, Length: 14, Host Name: localhost
+client_hello_01 += b"0000000e000c0000096c6f63616c686f7374"
+# Type: elliptic_curves, Length: 8, Curves: GREASE, x25519, secp256r1
+client_hello_01 += b"000a000800062a2a001d0017"
+# Type: ec_point_formats, Length: 2, Format: uncompressed
+client_hello_01 += b"000b00020100"
+# Type: ALPN, Length: 14, Protocols: h2, http/1.1
+client_hello_01 += b"0010000e000c02683208687474702f312e31"
+
+
+def prepare_record(data):
+    # Handshake, TLS 1.0
+    return binascii.unhexlify(b"160301" + ("%.4x" % (len(data) // 2)).encode("ascii") + data)
+
+
+class TestFingerprint(object):
+    def test_handshake(self):
+        data = binascii.unhexlify(client_hello_01)
+        fingerprint = extract_client_hello_fingerprint(data)
+        assert fingerprint == (
+            0x0303,
+            (0xc02b, 0xc02f, 0x002f),
+            (0x0000, 0x000a, 0x000b, 0x0010),
+            (0x001d, 0x0017),
+            (0,)
+        )
+        assert get_fingerprint_string(fingerprint) == "771,49195-49199-47,0-10-11-16,29-23,0"
+        assert get_fingerprint_digest(fingerprint) == hashlib.md5(b"771,49195-49199-47,0-10-11-16,29-23,0").hexdigest()
+
+    def test_compare_decoded(self):
+        data = binascii.unhexlify(client_hello_01)
+        (record, tmp_data) = Handshake.decode(data)
+        extensions = record.payload.extensions
+        fingerprint = extract_client_hello_fingerprint(memoryview(data), ignore_grease=False)
+        assert fingerprint[1] == tuple([tmp.value for tmp in record.payload.cipher_suites])
+        assert fingerprint[2] == tuple([tmp.type for tmp in extensions])
+        assert fingerprint[3] == tuple([tmp.value for tmp in extensions[2].payload.elliptic_curve_list])
+        assert fingerprint[4] == tuple([tmp.value for tmp in extensions[3].payload.point_format_list])
+
+    def test_record(self):
+        fingerprint = extract_client_hello_fingerprint(binascii.unhexlify(client_hello_01))
+        assert extract_client_hello_fingerprint(prepare_record(client_hello_01)) == fingerprint
+
+        # Handshake message fragmented over three records
+        data = b"".join([
+            prepare_record(client_hello_01[i:i + 6])
+            for i in (0, 6)
+        ]) + prepare_record(client_hello_01[12:])
+        assert extract_client_hello_fingerprint(data) == fingerprint
+
+    def test_not_enough_data(self):
+        data = prepare_record(client_hello_01)
+        for length in (0, 3, 9, len(data) - 1):
+            with pytest.raises(NotEnoughData):
+                extract_client_hello_fingerprint(data[:length])
+
+    def test_invalid(self):
+        # Server Hello Done
+        with pytest.raises(ValueError):
+            extract_client_hello_fingerprint(binascii.unhexlify(b"0e000000"))
+
+        # Wrong length of the extensions
+        data = bytearray(binascii.unhexlify(client_hello_01))
+        data[52] = 0x3b
+        with pytest.raises(ValueError):
+            extract_client_hello_fingerprint(bytes(data))
+
+    def test_batch(self):
+        buffers = [
+            binascii.unhexlify(client_hello_01),
+            binascii.unhexlify(b"0e000000"),
+            prepare_record(client_hello_01)
+        ]
+        results = list(extract_client_hello_fingerprints(iter(buffers), ignore_errors=True))
+        assert len(results) == 3
+        assert results[0][1] == hashlib.md5(b"771,49195-49199-47,0-10-11-16,29-23,0").hexdigest()
+        assert results[1] == (None, None)
+        assert results[2] == results[0]
+
+        with pytest.raises(ValueError):
+            list(extract_client_hello_fingerprints(buffers))
+
+
+class TestPeekClientHello(object):
+    def test_peek(self):
+        data = prepare_record(client_hello_01)
+        result = peek_client_hello(memoryview(data))
+        assert result == ((3, 3), [b"localhost"], [b"h2", b"http/1.1"], 0)
+        assert peek_client_hello(data) == result
+        assert peek_client_hello(binascii.unhexlify(client_hello_01)) == result
+
+    def test_missing(self):
+        data = prepare_record(client_hello_01)
+        assert peek_client_hello(b"") == (None, None, None, 5)
+        assert peek_client_hello(data[:3]) == (None, None, None, 2)
+        # Record header and handshake length available
+        assert peek_client_hello(data[:9]) == (None, None, None, len(data) - 9)
+        assert peek_client_hello(memoryview(data)[:-1]) == (None, None, None, 1)
+
+    def test_no_extensions(self):
+        # Client Hello, Length 41, TLS 1.0
+        data = b"01000029" + b"0301" + b"00" * 32 + b"00" + b"0002002f" + b"0100"
+        assert peek_client_hello(binascii.unhexlify(data)) == ((3, 1), [], [], 0)
+
+    def test_invalid(self):
+        # Application Data
+        with pytest.raises(ValueError):
+            peek_client_hello(binascii.unhexlify(b"170301000100"))
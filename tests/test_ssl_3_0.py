@@ -1,12 +1,21 @@
 import binascii
+import gc
+import hashlib
+import pickle
+import weakref
 
 import pytest
 
 import flextls
-from flextls.connection import SSLv30Connection
+from flextls.cache import DecodeCache, InternPool
+from flextls.connection import BaseConnectionState, SSLv30Connection
+from flextls.field import CipherSuiteField
 from flextls.exception import NotEnoughData
+from flextls.protocol import LAZY, SKIP, DecodeProfile, Protocol
+from flextls.protocol.alert import Alert
 from flextls.protocol.record import Record, SSLv3Record
 from flextls.protocol.handshake import Handshake
+from flextls.protocol.handshake import ServerKeyExchange, ServerKeyExchangeDHERSA
 
 client_hello_01 = b""
 # Client Hello, Length 132, SSLv3.0
@@ -142,7 +151,7 @@ def prepare_handshake_data(data):
     # Handshake, SSLv3.0
     result = b"160300"
     # Length
-    tmp_len = "%.4x" % (len(data) / 2)
+    tmp_len = "%.4x" % (len(data) // 2)
     result += tmp_len.encode("ascii")
     result += data
     return binascii.unhexlify(result)
@@ -156,7 +165,7 @@ def prepare_handshake_data_split(data, part_len):
 
     for i in range(0, len(data), part_len):
         part = data[i:i + part_len]
-        l = "%.4x" % (len(part) / 2)
+        l = "%.4x" % (len(part) // 2)
         # Handshake, SSLv3.0
         results.append(
             binascii.unhexlify(
@@ -303,6 +312,8 @@ class TestConnectionServer(object):
 
         assert record.length == 393
 
+        assert isinstance(record.payload.payload, ServerKeyExchangeDHERSA)
+
     def test_single(self):
         conn = SSLv30Connection(
             protocol_version=flextls.registry.version.SSLv3
@@ -463,4 +474,531 @@ class TestConnectionServer(object):
         assert not conn.is_empty()
         record = conn.pop_record()
         assert conn.is_empty()
-        self._server_hello_done_01(record)
\ No newline at end of file
+        self._server_hello_done_01(record)
+
+    def test_split_no_exception(self, monkeypatch):
+        def not_enough_data(self, *args):
+            raise AssertionError("NotEnoughData raised")
+
+        # Incomplete data must not raise NotEnoughData inside of the connection
+        monkeypatch.setattr(NotEnoughData, "__init__", not_enough_data)
+        conn = SSLv30Connection(
+            protocol_version=flextls.registry.version.SSLv3
+        )
+        data = b"".join(prepare_handshake_data_split(server_hello_01 + server_certificate_01, 50))
+        for i in range(0, len(data), 3):
+            conn.decode(data[i:i + 3])
+
+        self._server_hello_01(conn.pop_record())
+        self._server_certificate_01(conn.pop_record())
+        assert conn.is_empty()
+
+
+class TestServerKeyExchange(object):
+    def test_key_exchange_class(self):
+        # TLS_DHE_RSA_WITH_AES_256_CBC_SHA
+        assert ServerKeyExchange.get_key_exchange_class(0x0039) is ServerKeyExchangeDHERSA
+        # TLS_RSA_WITH_AES_256_CBC_SHA
+        assert ServerKeyExchange.get_key_exchange_class(0x0035) is None
+        assert ServerKeyExchange.get_key_exchange_class(None) is None
+
+    def test_no_connection(self):
+        data = binascii.unhexlify(server_key_exchange_01)
+        (record, data) = Handshake.decode(data)
+        assert data == b""
+        assert isinstance(record.payload, ServerKeyExchange)
+        assert record.payload.payload == binascii.unhexlify(server_key_exchange_01[8:])
+
+    def test_no_cipher_suite(self):
+        conn = SSLv30Connection(
+            protocol_version=flextls.registry.version.SSLv3
+        )
+        conn.decode(
+            prepare_handshake_data(
+                server_key_exchange_01
+            )
+        )
+        record = conn.pop_record()
+        assert record.payload.payload == binascii.unhexlify(server_key_exchange_01[8:])
+
+
+class AlertConnectionState(BaseConnectionState):
+    def __init__(self):
+        BaseConnectionState.__init__(self)
+        self.alerts = []
+
+    def _update_alert(self, record):
+        self.alerts.append((record.level, record.description))
+
+
+AlertConnectionState.add_update_handler(Alert, None, AlertConnectionState._update_alert)
+
+
+class TestConnectionState(object):
+    def test_client_hello(self):
+        conn = SSLv30Connection(
+            protocol_version=flextls.registry.version.SSLv3
+        )
+        conn.decode(
+            prepare_handshake_data(
+                client_hello_01
+            )
+        )
+        assert conn.state.client_random == binascii.unhexlify(client_hello_01[12:76])
+        assert conn.state.server_random is None
+
+    def test_custom_handler(self):
+        conn = SSLv30Connection(
+            protocol_version=flextls.registry.version.SSLv3
+        )
+        conn.state = AlertConnectionState()
+        # Alert, SSLv3.0, Length 2, fatal, handshake_failure
+        conn.decode(binascii.unhexlify(b"15030000020228"))
+        conn.decode(prepare_handshake_data(server_hello_01))
+        assert conn.state.alerts == [(2, 40)]
+        assert conn.state.cipher_suite == 0x0039
+
+        assert Alert not in BaseConnectionState.update_handlers
+
+    def test_subclass(self):
+        class CustomHandshake(Handshake):
+            pass
+
+        (record, data) = CustomHandshake.decode(binascii.unhexlify(server_hello_01))
+        state = AlertConnectionState()
+        state.update(record)
+        assert state.cipher_suite == 0x0039
+
+        # Handlers added later are used
+        hello_types = []
+        AlertConnectionState.add_update_handler(
+            CustomHandshake,
+            2,
+            lambda state, record: hello_types.append(record.type)
+        )
+        try:
+            state.update(record)
+            BaseConnectionState().update(record)
+        finally:
+            del AlertConnectionState.update_handlers[CustomHandshake]
+            BaseConnectionState._handler_cache.clear()
+        assert hello_types == [2]
+
+
+class TestLazyDecode(object):
+    def test_record(self):
+        (record, data) = SSLv3Record.decode(
+            prepare_handshake_data(server_hello_01),
+            payload_auto_decode=LAZY
+        )
+        assert data == b""
+        assert not isinstance(record.__dict__["_payload"], Handshake)
+
+        handshake = record.payload
+        assert isinstance(handshake, Handshake)
+        assert handshake.payload.cipher_suite == 0x0039
+
+        extensions = handshake.payload.get_field("extensions")
+        assert extensions._raw_items is not None
+        assert len(handshake.payload.extensions) == 1
+        assert extensions._raw_items is None
+        assert handshake.payload.extensions[0].type == 0xff01
+
+    def test_connection(self):
+        conn = SSLv30Connection(
+            protocol_version=flextls.registry.version.SSLv3,
+            payload_auto_decode=LAZY
+        )
+        data = server_hello_01
+        data += server_certificate_01
+        data += server_key_exchange_01
+        conn.decode(
+            prepare_handshake_data(
+                data
+            )
+        )
+        assert conn.state.cipher_suite == 0x0039
+
+        conn.pop_record()
+        record = conn.pop_record()
+        certificate_list = record.payload.get_field("certificate_list")
+        assert certificate_list._raw_items is not None
+        assert len(record.payload.certificate_list[0].value) == 835
+        assert isinstance(record.payload.certificate_list[0].value, bytes)
+
+        record = conn.pop_record()
+        assert isinstance(record.payload.payload, ServerKeyExchangeDHERSA)
+        assert len(record.payload.payload.params.dh_p) == 128
+
+
+class TestDecodeProfile(object):
+    def test_connection(self):
+        profile = DecodeProfile(default=False)
+        profile.add_rule(SSLv3Record, 22, True)
+        profile.add_rule(SSLv3Record, 23, SKIP)
+        profile.add_rule(Handshake, 2, True)
+        profile.add_rule(Handshake, 11, SKIP)
+
+        conn = SSLv30Connection(
+            protocol_version=flextls.registry.version.SSLv3,
+            payload_auto_decode=profile
+        )
+        data = server_hello_01
+        data += server_certificate_01
+        data += server_key_exchange_01
+        conn.decode(
+            prepare_handshake_data(
+                data
+            )
+        )
+        # Application Data, SSLv3.0, Length 3
+        conn.decode(binascii.unhexlify(b"1703000003abcdef"))
+        # Change Cipher Spec, SSLv3.0, Length 1
+        conn.decode(binascii.unhexlify(b"140300000101"))
+
+        record = conn.pop_record()
+        self._server_hello(record)
+
+        record = conn.pop_record()
+        assert record.type == 11
+        assert record.payload is None
+
+        record = conn.pop_record()
+        assert record.type == 12
+        assert record.payload == binascii.unhexlify(server_key_exchange_01[8:])
+
+        record = conn.pop_record()
+        assert isinstance(record, SSLv3Record)
+        assert record.content_type == 20
+        assert record.payload == b"\x01"
+        assert conn.is_empty()
+
+    def test_lazy_items(self):
+        profile = DecodeProfile(item_mode=LAZY)
+        (record, data) = Handshake.decode(
+            binascii.unhexlify(server_hello_01),
+            payload_auto_decode=profile
+        )
+        extensions = record.payload.get_field("extensions")
+        assert extensions._raw_items is not None
+        self._server_hello(record)
+
+    def _server_hello(self, record):
+        assert record.type == 2
+        assert record.payload.cipher_suite == 0x0039
+        assert len(record.payload.extensions) == 1
+
+
+class TestEncodeCache(object):
+    def test_decoded(self):
+        data = binascii.unhexlify(client_hello_01)
+        (record, tmp_data) = Handshake.decode(data)
+        assert not record.is_dirty()
+        assert record.encode() is data
+
+    def test_record(self):
+        data = prepare_handshake_data(server_hello_01)
+        data += prepare_handshake_data(server_certificate_01)
+        (record, tmp_data) = SSLv3Record.decode(data)
+        assert record.encode() == prepare_handshake_data(server_hello_01)
+        assert record.encode() is record.encode()
+
+        (record, tmp_data) = SSLv3Record.decode(tmp_data)
+        assert record.encode() == prepare_handshake_data(server_certificate_01)
+
+    def test_stream(self, monkeypatch):
+        # Two records and a partial record in one buffer
+        data1 = prepare_handshake_data(server_hello_01)
+        data2 = prepare_handshake_data(server_hello_done_01)
+        data = data1 + data2 + data2[:3]
+        (record1, tmp_data) = SSLv3Record.decode(data)
+        (record2, tmp_data) = SSLv3Record.decode(tmp_data)
+        (message, tmp_data) = Handshake.decode(data2[5:] + data2[5:])
+        assert tmp_data == data2[5:]
+
+        def assemble_fields(self):
+            raise AssertionError("Assembled")
+
+        # The original data is used without assembling the fields
+        monkeypatch.setattr(Protocol, "assemble_fields", assemble_fields)
+        assert record1.encode() == data1
+        assert record2.encode() == data2
+        assert message.encode() == data2[5:]
+
+    def test_change_field(self):
+        data = binascii.unhexlify(client_hello_01)
+        (record, tmp_data) = Handshake.decode(data)
+        record.payload.version.minor = 1
+        assert record.is_dirty()
+        encoded = record.encode()
+        assert encoded[:6] == binascii.unhexlify(b"010000840301")
+        assert encoded[6:] == data[6:]
+        assert not record.is_dirty()
+        assert record.encode() is encoded
+
+    def test_change_list(self):
+        data = binascii.unhexlify(client_hello_01)
+        (record, tmp_data) = Handshake.decode(data)
+        cipher_suite = CipherSuiteField()
+        cipher_suite.value = 0x0039
+        record.payload.cipher_suites.append(cipher_suite)
+        encoded = record.encode()
+        assert len(encoded) == len(data) + 2
+        (record, tmp_data) = Handshake.decode(encoded)
+        assert len(record.payload.cipher_suites) == 47
+        assert record.payload.cipher_suites[46].value == 0x0039
+
+        record.payload.cipher_suites[0].value = 0x0035
+        assert record.encode()[41:43] == b"\x00\x35"
+
+    def test_change_order(self):
+        data = prepare_handshake_data(client_hello_01)
+        (record, tmp_data) = SSLv3Record.decode(data)
+        record.payload.payload.cipher_suites.reverse()
+        assert record.is_dirty()
+        encoded = record.encode()
+        assert encoded[46:48] == data[136:138]
+        assert not record.is_dirty()
+
+        (record, tmp_data) = SSLv3Record.decode(data)
+        cipher_suites = record.payload.payload.cipher_suites
+        (cipher_suites[0], cipher_suites[1]) = (cipher_suites[1], cipher_suites[0])
+        assert record.is_dirty()
+        assert record.encode()[46:50] == data[48:50] + data[46:48]
+
+        (record, tmp_data) = SSLv3Record.decode(data)
+        record.payload.payload.cipher_suites.sort(key=lambda item: item.value)
+        assert record.is_dirty()
+        assert record.encode() != data
+
+    def test_change_payload(self):
+        data = binascii.unhexlify(server_hello_done_01)
+        (record, tmp_data) = Handshake.decode(data)
+        (tmp_record, tmp_data) = Handshake.decode(binascii.unhexlify(client_hello_01))
+        record.payload = tmp_record.payload
+        assert record.encode() == binascii.unhexlify(client_hello_01)
+
+    def test_change_nested(self):
+        data = prepare_handshake_data(client_hello_01)
+        (record, tmp_data) = SSLv3Record.decode(data)
+        record.payload.payload.random = b"\x00" * 32
+        # Encoding the payload on its own must not hide the change
+        encoded = record.payload.encode()
+        assert encoded[6:38] == b"\x00" * 32
+        assert record.is_dirty()
+        assert record.encode() == data[:5] + encoded
+        assert not record.is_dirty()
+
+
+class TestTranscript(object):
+    def test_decode(self):
+        data = server_hello_01 + server_certificate_01 + server_hello_done_01
+        conn = SSLv30Connection(
+            protocol_version=flextls.registry.version.SSLv3,
+            transcript_hash_algorithms=("md5-sha1", "sha256")
+        )
+        for tmp_data in prepare_handshake_data_split(data, 100):
+            conn.decode(tmp_data)
+
+        raw_data = binascii.unhexlify(data)
+        assert conn.transcript.digest("md5-sha1") == hashlib.md5(raw_data).digest() + hashlib.sha1(raw_data).digest()
+        assert conn.transcript.hexdigest("sha256") == hashlib.sha256(raw_data).hexdigest()
+
+    def test_encode(self):
+        conn = SSLv30Connection(
+            protocol_version=flextls.registry.version.SSLv3,
+            transcript_hash_algorithms=("sha384",)
+        )
+        (record, tmp_data) = Handshake.decode(binascii.unhexlify(server_hello_done_01))
+        conn.encode([record])
+        assert conn.transcript.digest("sha384") == hashlib.sha384(binascii.unhexlify(server_hello_done_01)).digest()
+
+    def test_disabled(self):
+        conn = SSLv30Connection(
+            protocol_version=flextls.registry.version.SSLv3
+        )
+        conn.decode(prepare_handshake_data(server_hello_done_01))
+        assert conn.transcript is None
+
+
+class TestDecodeCache(object):
+    def _decode(self, cache, data):
+        conn = SSLv30Connection(
+            protocol_version=flextls.registry.version.SSLv3,
+            decode_cache=cache
+        )
+        for tmp_data in prepare_handshake_data_split(data, 200):
+            conn.decode(tmp_data)
+        records = []
+        while not conn.is_empty():
+            records.append(conn.pop_record())
+        return records
+
+    def test_connection(self):
+        cache = DecodeCache()
+        data = server_hello_01 + server_certificate_01 + server_key_exchange_01 + server_hello_done_01
+        records1 = self._decode(cache, data)
+        records2 = self._decode(cache, data)
+        assert len(records2) == 4
+        assert cache.snapshot()["hits"] == 2
+        assert cache.snapshot()["misses"] == 2
+
+        # Certificate and ServerKeyExchange
+        for i in (1, 2):
+            assert records1[i] is not records2[i]
+            assert records1[i].payload is not records2[i].payload
+            assert records1[i].encode() == records2[i].encode()
+
+        assert records1[0].payload is not records2[0].payload
+        TestConnectionServer()._server_certificate_01(records2[1])
+        TestConnectionServer()._server_key_exchange_01(records2[2])
+
+    def test_shared_connection(self):
+        cache = DecodeCache()
+        data = server_hello_01 + server_certificate_01 + server_key_exchange_01
+        conn = SSLv30Connection(
+            protocol_version=flextls.registry.version.SSLv3,
+            decode_cache=cache
+        )
+        conn.decode(prepare_handshake_data(data))
+        records = self._decode(cache, data)
+        conn_ref = weakref.ref(conn)
+        del conn
+        gc.collect()
+        # The cache must not keep the first connection
+        assert conn_ref() is None
+
+        # The copies returned by the cache use the connection decoding the data
+        server_key_exchange = records[2].payload
+        assert server_key_exchange._connection is records[2]._connection
+        assert server_key_exchange.payload._connection is records[2]._connection
+        assert server_key_exchange._connection.state.cipher_suite == 0x0039
+        assert records[1].payload._connection is records[1]._connection
+
+    def test_changed(self):
+        cache = DecodeCache()
+        data = server_hello_01 + server_certificate_01
+        records = self._decode(cache, data)
+        records[1].payload.certificate_list[0].value = b"EVIL"
+        records[1].encode()
+
+        for i in range(2):
+            records = self._decode(cache, data)
+            assert cache.hits == i + 1
+            assert len(records[1].payload.certificate_list[0].value) == 835
+            assert records[1].encode() == binascii.unhexlify(server_certificate_01)
+            # Change the copy returned by the cache
+            records[1].payload.certificate_list[0].value = b"EVIL"
+            records[1].encode()
+
+    def test_context(self):
+        cache = DecodeCache()
+        records1 = self._decode(cache, server_hello_01 + server_key_exchange_01)
+        # Cipher suite unknown
+        records2 = self._decode(cache, server_key_exchange_01)
+        assert records1[1].payload is not records2[0].payload
+        assert records2[0].payload.payload == binascii.unhexlify(server_key_exchange_01)[4:]
+
+
+class TestInternPool(object):
+    def test_connection(self):
+        pool = InternPool()
+        certificates = []
+        for payload_auto_decode in (True, LAZY):
+            conn = SSLv30Connection(
+                protocol_version=flextls.registry.version.SSLv3,
+                payload_auto_decode=payload_auto_decode,
+                intern_pool=pool
+            )
+            conn.decode(prepare_handshake_data(server_certificate_01))
+            record = conn.pop_record()
+            certificates.append(record.payload.certificate_list[0].value)
+
+        assert len(certificates[0]) == 835
+        assert certificates[0] is certificates[1]
+        assert pool.hits == 1
+
+    def test_profile(self):
+        with pytest.raises(ValueError):
+            SSLv30Connection(
+                protocol_version=flextls.registry.version.SSLv3,
+                payload_auto_decode=DecodeProfile(),
+                intern_pool=InternPool()
+            )
+
+
+class TestRecordSink(object):
+    def test_connection(self):
+        records = []
+        conn = SSLv30Connection(
+            protocol_version=flextls.registry.version.SSLv3,
+            record_sink=records.append
+        )
+        conn.decode(prepare_handshake_data(server_hello_01 + server_hello_done_01))
+        assert conn.is_empty()
+        assert [record.type for record in records] == [2, 14]
+        TestConnectionServer()._server_hello_01(records[0])
+
+    def test_exception(self):
+        def record_sink(record):
+            raise NotEnoughData("Raised by the sink")
+
+        conn = SSLv30Connection(
+            protocol_version=flextls.registry.version.SSLv3,
+            record_sink=record_sink
+        )
+        # Exceptions of the sink are not handled as incomplete data
+        with pytest.raises(NotEnoughData):
+            conn.decode(prepare_handshake_data(server_hello_done_01))
+
+
+class TestPickle(object):
+    def _decode(self, data, payload_auto_decode=True):
+        conn = SSLv30Connection(
+            protocol_version=flextls.registry.version.SSLv3,
+            payload_auto_decode=payload_auto_decode
+        )
+        conn.decode(prepare_handshake_data(data))
+        records = []
+        while not conn.is_empty():
+            records.append(conn.pop_record())
+        return records
+
+    def test_pickle(self):
+        records = self._decode(server_hello_01 + server_certificate_01 + server_key_exchange_01)
+        data = pickle.dumps(records, pickle.HIGHEST_PROTOCOL)
+        assert b"SSLv30Connection" not in data
+        assert len(data) < len(pickle.dumps([record.encode() for record in records])) + 500
+
+        tmp_records = pickle.loads(data)
+        assert len(tmp_records) == 3
+        for (record, tmp_record) in zip(records, tmp_records):
+            assert tmp_record.__class__ is record.__class__
+            assert tmp_record.encode() == record.encode()
+            assert not tmp_record.is_dirty()
+
+        # Decoded on first access
+        extensions = tmp_records[0].payload.get_field("extensions")
+        assert extensions._raw_items is not None
+        assert extensions.get_extension(0xff01) is not None
+
+        TestConnectionServer()._server_certificate_01(tmp_records[1])
+        # The cipher suite of the connection is kept to decode the payload
+        TestConnectionServer()._server_key_exchange_01(tmp_records[2])
+
+    def test_lazy(self):
+        records = self._decode(server_certificate_01, payload_auto_decode=LAZY)
+        tmp_record = pickle.loads(pickle.dumps(records[0]))
+        assert tmp_record.encode() == records[0].encode()
+        assert len(tmp_record.payload.certificate_list[0].value) == 835
+
+    def test_changed(self):
+        (record, data) = Handshake.decode(binascii.unhexlify(server_hello_01))
+        record.payload.cipher_suite = 0x0035
+        tmp_record = pickle.loads(pickle.dumps(record))
+        assert tmp_record.payload.cipher_suite == 0x0035
+
+    def test_raw_payload(self):
+        (record, data) = SSLv3Record.decode(prepare_handshake_data(server_hello_01), payload_auto_decode=False)
+        tmp_record = pickle.loads(pickle.dumps(record))
+        assert tmp_record.payload == record.payload
@@ -0,0 +1,103 @@
+import pytest
+
+from flextls.field import CipherSuiteField, CompressionMethodField
+from flextls.field import ServerNameField, HostNameField
+from flextls.protocol.handshake import ClientHello, Handshake
+from flextls.protocol.handshake.extension import Extension, ServerNameIndication, SessionTicketTLS
+from flextls.protocol.handshake.template import ClientHelloTemplate
+from flextls.protocol.record import SSLv3Record
+
+
+def create_client_hello(cipher_suites, server_name=None):
+    client_hello = ClientHello()
+    client_hello.version.major = 3
+    client_hello.version.minor = 3
+    client_hello.random = b"A" * 32
+    for cipher_suite in cipher_suites:
+        tmp = CipherSuiteField()
+        tmp.value = cipher_suite
+        client_hello.cipher_suites.append(tmp)
+
+    comp = CompressionMethodField()
+    comp.value = 0
+    client_hello.compression_methods.append(comp)
+
+    if server_name is not None:
+        tmp_server_name = ServerNameField()
+        tmp_server_name.payload = HostNameField("")
+        tmp_server_name.payload.value = server_name
+        tmp_sni = ServerNameIndication()
+        tmp_sni.server_name_list.append(tmp_server_name)
+        client_hello.extensions.append(Extension() + tmp_sni)
+
+    session_ticket = SessionTicketTLS()
+    session_ticket.data = b"ticket"
+    client_hello.extensions.append(Extension() + session_ticket)
+    return client_hello
+
+
+def encode_client_hello(client_hello):
+    record = SSLv3Record()
+    record.version.major = 3
+    record.version.minor = 3
+    record.set_payload(Handshake() + client_hello)
+    return record.encode()
+
+
+class TestClientHelloTemplate(object):
+    def test_no_change(self):
+        client_hello = create_client_hello([0x0039, 0x002f], b"example.org")
+        template = ClientHelloTemplate(client_hello)
+        data = encode_client_hello(create_client_hello([0x0039, 0x002f], b"example.org"))
+        assert template.data == data
+        assert template.render() == data
+
+    def test_random(self):
+        template = ClientHelloTemplate(create_client_hello([0x0039], b"example.org"))
+        data = template.render(random=b"B" * 32)
+
+        (record, tmp_data) = SSLv3Record.decode(data)
+        assert record.payload.payload.random == b"B" * 32
+        assert template.render() == template.data
+
+        with pytest.raises(ValueError):
+            template.render(random=b"B")
+
+    def test_variable(self):
+        template = ClientHelloTemplate(create_client_hello([0x0039], b"example.org"))
+        data = template.render(
+            random=b"B" * 32,
+            session_id=b"\x01" * 16,
+            cipher_suites=[0x0035, 0x002f, 0x000a],
+            server_name=u"www.example.org"
+        )
+
+        client_hello = create_client_hello([0x0035, 0x002f, 0x000a], b"www.example.org")
+        client_hello.random = b"B" * 32
+        client_hello.session_id = b"\x01" * 16
+        assert data == encode_client_hello(client_hello)
+
+        (record, tmp_data) = SSLv3Record.decode(data)
+        assert tmp_data == b""
+        extensions = record.payload.payload.extensions
+        assert extensions[0].payload.server_name_list[0].payload.value == b"www.example.org"
+        assert extensions[1].payload.data == b"ticket"
+
+    def test_add_server_name(self):
+        template = ClientHelloTemplate(create_client_hello([0x0039]))
+        data = template.render(server_name=b"example.org")
+
+        (record, tmp_data) = SSLv3Record.decode(data)
+        extensions = record.payload.payload.extensions
+        assert extensions[0].payload.data == b"ticket"
+        assert extensions[1].payload.server_name_list[0].payload.value == b"example.org"
+
+    def test_extensions(self):
+        template = ClientHelloTemplate(create_client_hello([0x0039], b"example.org"))
+        data = template.render(extensions=b"")
+
+        (record, tmp_data) = SSLv3Record.decode(data)
+        assert len(record.payload.payload.extensions) == 0
+
+        with pytest.raises(ValueError):
+            template.render(server_name=b"example.org", extensions=b"")
@@ -0,0 +1,174 @@
+import binascii
+import logging
+
+import pytest
+
+import flextls
+from flextls import trace
+from flextls.connection import DTLSv10Connection, SSLv30Connection
+from flextls.exception import WrongProtocolVersion
+from flextls.protocol.handshake import DTLSv10Handshake
+from flextls.trace import LoggingTracer, RingBufferTracer, TraceDispatcher, TraceEvent
+
+from tests.test_dtls_1_0 import TestCertificate
+from tests.test_ssl_3_0 import prepare_handshake_data, prepare_handshake_data_split, server_hello_01, \
+    server_hello_done_01
+
+
+def get_fragments(message_seq=2, n=200):
+    # Handshake, DTLSv1.0, Epoch 0, Sequence Number 2
+    record_header = b"16feff0000000000000002"
+    # Certificate, Length 684
+    cert_header = b"0b0002ac" + ("%.4x" % message_seq).encode("ascii")
+
+    cert = TestCertificate._cert
+    datagrams = []
+    for i, part in enumerate([cert[i:i + n] for i in range(0, len(cert), n)]):
+        tmp = "%.6x%.6x" % (i * n // 2, len(part) // 2)
+        cert_data = cert_header + tmp.encode("ascii") + part
+        tmp = "%.4x" % (len(cert_data) // 2)
+        datagrams.append(binascii.unhexlify(record_header + tmp.encode("ascii") + cert_data))
+    return datagrams
+
+
+class TestTraceDTLS(object):
+    def test_fragments(self):
+        tracer = RingBufferTracer()
+        conn = DTLSv10Connection(protocol_version=flextls.registry.version.DTLSv10, tracer=tracer)
+        conn._handshake_next_receive_seq = 2
+        datagrams = get_fragments()
+        for data in datagrams:
+            conn.decode(data)
+
+        names = [event.name for event in tracer]
+        assert names == [trace.FRAGMENT_BUFFERED] * (len(datagrams) - 1) + [trace.RECORD_DECODED]
+        event = tracer.events[1]
+        assert event.connection is conn
+        assert isinstance(event.record, DTLSv10Handshake)
+        # The buffered fragments have been merged
+        assert event.details == {"message_seq": 2, "fragment_offset": 0, "fragment_length": 200, "length": 684}
+        assert tracer.events[-1].record is conn.pop_record()
+
+    def test_out_of_order(self):
+        tracer = RingBufferTracer()
+        conn = DTLSv10Connection(protocol_version=flextls.registry.version.DTLSv10, tracer=tracer)
+        conn.decode(get_fragments(message_seq=1)[0])
+        assert conn.is_empty()
+        assert len(tracer) == 1
+        assert tracer.events[0].name == trace.OUT_OF_ORDER_DROPPED
+        assert tracer.events[0].details == {"message_seq": 1, "expected_message_seq": 0}
+
+    def test_incomplete(self):
+        tracer = RingBufferTracer()
+        conn = DTLSv10Connection(protocol_version=flextls.registry.version.DTLSv10, tracer=tracer)
+        data = get_fragments()[0]
+        conn.decode(data[:-10])
+        conn.decode(data[:5])
+        assert [event.details for event in tracer] == [
+            {"layer": "record", "bytes_needed": 10},
+            {"layer": "record", "bytes_needed": 8},
+        ]
+        assert tracer.dump()[0] == "incomplete bytes_needed=10 layer='record'"
+
+    def test_version_mismatch(self):
+        tracer = RingBufferTracer()
+        conn = DTLSv10Connection(protocol_version=flextls.registry.version.DTLSv12, tracer=tracer)
+        with pytest.raises(WrongProtocolVersion):
+            conn.decode(get_fragments()[0])
+        assert tracer.events[0].name == trace.VERSION_MISMATCH
+        assert tracer.events[0].details == {"expected": "DTLSv12", "received": "DTLSv10"}
+
+    def test_incomplete_message(self):
+        tracer = RingBufferTracer()
+        conn = DTLSv10Connection(protocol_version=flextls.registry.version.DTLSv10, tracer=tracer)
+        # Handshake, DTLSv1.0, Epoch 0, Sequence Number 0, Length 4 with a truncated handshake header
+        conn.decode(binascii.unhexlify(b"16feff00000000000000000004" + b"0e000000"))
+        # Alert, DTLSv1.0, Epoch 0, Sequence Number 1, Length 1
+        conn.decode(binascii.unhexlify(b"15feff00000000000000010001" + b"02"))
+        assert [event.details for event in tracer] == [
+            {"layer": "message", "content_type": 22, "bytes_needed": 8},
+            {"layer": "message", "content_type": 21, "bytes_needed": 1},
+        ]
+
+    def test_no_output(self, capsys):
+        conn = DTLSv10Connection(protocol_version=flextls.registry.version.DTLSv10)
+        conn.decode(get_fragments()[0][:20])
+        assert capsys.readouterr().out == ""
+
+
+class TestTraceTLS(object):
+    def test_incomplete(self):
+        tracer = RingBufferTracer(size=3)
+        conn = SSLv30Connection(protocol_version=flextls.registry.version.SSLv3, tracer=tracer)
+        for data in prepare_handshake_data_split(server_hello_01 + server_hello_done_01, 30):
+            conn.decode(data)
+
+        assert len(tracer) == 3
+        assert [event.name for event in tracer][-1] == trace.RECORD_DECODED
+        assert conn.pop_record() is tracer.events[-2].record
+        assert conn.pop_record() is tracer.events[-1].record
+
+    def test_incomplete_record(self):
+        tracer = RingBufferTracer()
+        conn = SSLv30Connection(protocol_version=flextls.registry.version.SSLv3, tracer=tracer)
+        data = prepare_handshake_data(server_hello_01)
+        conn.decode(data[:20])
+        assert tracer.events[-1].details == {"layer": "record", "bytes_needed": len(data) - 20}
+
+    def test_incomplete_message(self):
+        tracer = RingBufferTracer()
+        conn = SSLv30Connection(protocol_version=flextls.registry.version.SSLv3, tracer=tracer)
+        # Complete record with an incomplete handshake message
+        conn.decode(prepare_handshake_data_split(server_hello_01, 30)[0])
+        assert tracer.events[-1].details == {
+            "layer": "message",
+            "content_type": 22,
+            "bytes_needed": len(server_hello_01) // 2 - 30
+        }
+
+    def test_incomplete_alert(self):
+        tracer = RingBufferTracer()
+        conn = SSLv30Connection(protocol_version=flextls.registry.version.SSLv3, tracer=tracer)
+        # Alert split into two records: fatal, handshake_failure
+        conn.decode(binascii.unhexlify(b"150300000102"))
+        assert tracer.events[-1].details == {"layer": "message", "content_type": 21, "bytes_needed": 1}
+        conn.decode(binascii.unhexlify(b"150300000128"))
+        assert tracer.events[-1].name == trace.RECORD_DECODED
+        record = conn.pop_record()
+        assert (record.level, record.description) == (2, 40)
+
+
+class TestTracers(object):
+    def test_event(self):
+        event = TraceEvent(trace.INCOMPLETE, None, layer="record", bytes_needed=3)
+        assert str(event) == "incomplete bytes_needed=3 layer='record'"
+
+    def test_dispatcher(self):
+        dispatcher = TraceDispatcher()
+        tracers = [RingBufferTracer(), RingBufferTracer()]
+        for tracer in tracers:
+            dispatcher.subscribe(tracer)
+        conn = SSLv30Connection(protocol_version=flextls.registry.version.SSLv3, tracer=dispatcher)
+        conn.decode(prepare_handshake_data(server_hello_done_01))
+        dispatcher.unsubscribe(tracers[1])
+        conn.decode(prepare_handshake_data(server_hello_done_01))
+        assert len(dispatcher) == 1
+        assert len(tracers[0]) == 2
+        assert len(tracers[1]) == 1
+
+    def test_logging(self, caplog):
+        caplog.set_level(logging.DEBUG, logger="flextls.trace")
+        conn = SSLv30Connection(protocol_version=flextls.registry.version.SSLv3, tracer=LoggingTracer())
+        conn.decode(prepare_handshake_data(server_hello_done_01))
+        assert caplog.messages == ["record_decoded Handshake"]
+
+    def test_logging_disabled(self):
+        class Event(object):
+            def format(self):
+                raise AssertionError("Formatted")
+
+            __str__ = format
+
+        logger = logging.getLogger("flextls.test_trace")
+        logger.setLevel(logging.INFO)
+        LoggingTracer(logger, level=logging.DEBUG)(Event())
@@ -0,0 +1,175 @@
+import binascii
+import hashlib
+
+import pytest
+
+from flextls.exception import NotEnoughData
+from flextls.field import CertificateField
+from flextls.helper import hash_certificates
+from flextls.protocol import LAZY
+from flextls.protocol.handshake import ClientHello, Handshake, ServerCertificate, ServerHello
+from flextls.protocol.record import SSLv3Record
+from flextls.protocol.view import CertificateView, ClientHelloView, RecordView, ServerHelloView
+
+# Client Hello, Length 89, TLS 1.2, Random, Session ID Length: 4
+client_hello_01 = b"010000590303" + b"41" * 32 + b"0401020304"
+# Cipher Suites Length: 4, Cipher Suites: 0xc02f, 0x002f, Compression Methods Length: 1, Compression Method: null
+client_hello_01 += b"0004c02f002f0100"
+# Extensions Length: 40
+client_hello_01 += b"0028"
+# Type: server_name, Length: 14, Host Name: localhost
+client_hello_01 += b"0000000e000c0000096c6f63616c686f7374"
+# Type: SessionTicket TLS, Length: 0
+client_hello_01 += b"00230000"
+# Type: ALPN, Length: 14, Protocols: h2, http/1.1
+client_hello_01 += b"0010000e000c02683208687474702f312e31"
+
+# Server Hello, Length 44, TLS 1.2, Random, Session ID Length: 0, Cipher Suite: 0xc02f, Compression Method: null
+server_hello_01 = b"0200002c0303" + b"42" * 32 + b"00c02f00"
+# Extensions Length: 4, Type: SessionTicket TLS, Length: 0
+server_hello_01 += b"000400230000"
+
+
+def create_certificate(certificates):
+    certificate = ServerCertificate()
+    for data in certificates:
+        tmp = CertificateField()
+        tmp.value = data
+        certificate.certificate_list.append(tmp)
+    return (Handshake() + certificate).encode()
+
+
+class TestRecordView(object):
+    def test_iter_records(self):
+        data = binascii.unhexlify(b"160303000401020304" + b"1503030002022800" + b"160303")
+        records = list(RecordView.iter_records(data))
+        assert len(records) == 2
+        assert records[0].content_type == 22
+        assert records[0].version == (3, 3)
+        assert records[0].payload.tobytes() == b"\x01\x02\x03\x04"
+        assert records[1].content_type == 21
+        assert records[1].size == 7
+
+        record = records[1].to_protocol()
+        assert isinstance(record, SSLv3Record)
+        assert record.payload.level == 2
+
+    def test_not_enough_data(self):
+        with pytest.raises(NotEnoughData):
+            RecordView(binascii.unhexlify(b"1603030004010203"))
+
+
+class TestClientHelloView(object):
+    def test_view(self):
+        data = binascii.unhexlify(client_hello_01)
+        view = ClientHelloView(data + b"trailing")
+        assert view.size == len(data)
+        assert view.version == (3, 3)
+        assert view.random.tobytes() == b"A" * 32
+        assert view.session_id.tobytes() == b"\x01\x02\x03\x04"
+        assert view.cipher_suites == (0xc02f, 0x002f)
+        assert view.compression_methods == (0,)
+        assert view.extension_types == [0x0000, 0x0023, 0x0010]
+        assert view.get_extension_data(0x0023).tobytes() == b""
+        assert view.get_extension_data(0x0010)[3:5].tobytes() == b"h2"
+        assert view.get_extension_data(0x000d) is None
+
+    def test_to_protocol(self):
+        view = ClientHelloView(binascii.unhexlify(client_hello_01))
+        client_hello = view.to_protocol()
+        assert isinstance(client_hello, ClientHello)
+        assert len(client_hello.cipher_suites) == 2
+        assert client_hello.get_extension(0x0000).payload.server_name_list[0].payload.value == b"localhost"
+
+    def test_invalid(self):
+        data = binascii.unhexlify(client_hello_01)
+        with pytest.raises(NotEnoughData):
+            ClientHelloView(data[:-1])
+
+        with pytest.raises(ValueError):
+            ServerHelloView(data)
+
+        # Wrong length of the cipher suites
+        tmp_data = bytearray(data)
+        tmp_data[44] = 0xf0
+        with pytest.raises(ValueError):
+            ClientHelloView(bytes(tmp_data))
+
+        # Wrong length of an extension
+        tmp_data = bytearray(data)
+        tmp_data[-15] = 0x0f
+        with pytest.raises(ValueError):
+            ClientHelloView(bytes(tmp_data))
+
+
+class TestServerHelloView(object):
+    def test_view(self):
+        view = ServerHelloView(memoryview(binascii.unhexlify(server_hello_01)))
+        assert view.version == (3, 3)
+        assert view.random.tobytes() == b"B" * 32
+        assert view.session_id.tobytes() == b""
+        assert view.cipher_suite == 0xc02f
+        assert view.compression_method == 0
+        assert view.extension_types == [0x0023]
+
+        server_hello = view.to_protocol()
+        assert isinstance(server_hello, ServerHello)
+        assert server_hello.cipher_suite == 0xc02f
+
+
+class TestCertificateView(object):
+    def test_view(self):
+        view = CertificateView(create_certificate([b"cert1", b"certificate2"]))
+        assert len(view) == 2
+        assert view[1].tobytes() == b"certificate2"
+        assert [tmp.tobytes() for tmp in view] == [b"cert1", b"certificate2"]
+
+        certificate = view.to_protocol()
+        assert isinstance(certificate, ServerCertificate)
+        assert certificate.certificate_list[0].value == b"cert1"
+
+    def test_invalid(self):
+        data = bytearray(create_certificate([b"cert1"]))
+        # Length of the certificate list
+        data[6] += 1
+        with pytest.raises(ValueError):
+            CertificateView(bytes(data))
+
+    def test_hash(self):
+        view = CertificateView(create_certificate([b"cert1", b"certificate2"]))
+        assert list(hash_certificates(view, algorithm="sha1")) == [
+            hashlib.sha1(b"cert1").hexdigest(),
+            hashlib.sha1(b"certificate2").hexdigest()
+        ]
+
+
+class TestIterCertificates(object):
+    @pytest.mark.parametrize("payload_auto_decode", [True, LAZY])
+    def test_iter(self, payload_auto_decode):
+        data = create_certificate([b"cert1", b"certificate2", b"cert3"])
+        (obj, tmp_data) = Handshake.decode(memoryview(data), payload_auto_decode=payload_auto_decode)
+        certificate = obj.payload
+
+        certificates = certificate.iter_certificates()
+        leaf = next(certificates)
+        assert isinstance(leaf, memoryview)
+        assert leaf.tobytes() == b"cert1"
+
+        assert list(certificate.iter_certificate_digests()) == [
+            hashlib.sha256(b"cert1").hexdigest(),
+            hashlib.sha256(b"certificate2").hexdigest(),
+            hashlib.sha256(b"cert3").hexdigest()
+        ]
+        # Nothing has been decoded in lazy mode
+        assert (certificate.get_field("certificate_list")._raw_items is None) == (payload_auto_decode is True)
+        assert certificate.certificate_list[2].value == b"cert3"
+
+    def test_invalid(self):
+        data = bytearray(create_certificate([b"cert1", b"cert2"]))
+        # Length of the last certificate
+        data[-6] = 0x06
+        (obj, tmp_data) = Handshake.decode(bytes(data), payload_auto_decode=LAZY)
+        certificates = obj.payload.iter_certificates()
+        assert next(certificates).tobytes() == b"cert1"
+        with pytest.raises(NotEnoughData):
+            next(certificates)